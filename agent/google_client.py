@@ -1,25 +1,39 @@
 import os
+import threading
+from datetime import datetime, timedelta
+import httplib2
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
+
+# Refresh the access token this long before it expires
+REFRESH_MARGIN = timedelta(minutes=5)
 
 class GoogleClient:
-    def __init__(self):
+    def __init__(self, creds=None):
+        """creds skips the sign-in (e.g. credentials loaded elsewhere, or tests)"""
         self.SCOPES = [
             'https://www.googleapis.com/auth/calendar',
             'https://www.googleapis.com/auth/gmail.readonly'
         ]
-        self.creds = None
-        self._authenticate()
-    
+        self.token_file = 'credentials/token.json'
+        self.creds = creds
+        self._services = {}
+        self._lock = threading.Lock()
+        # httplib2.Http isn't thread-safe, and the services are shared by the
+        # sync, context and main threads: each thread gets its own connection
+        self._local = threading.local()
+        if creds is None:
+            self._authenticate()
+
     def _authenticate(self):
         """Handle OAuth2 authentication"""
-        token_file = 'credentials/token.json'
-        
-        if os.path.exists(token_file):
-            self.creds = Credentials.from_authorized_user_file(token_file, self.SCOPES)
-        
+        if os.path.exists(self.token_file):
+            self.creds = Credentials.from_authorized_user_file(self.token_file, self.SCOPES)
+
         if not self.creds or not self.creds.valid:
             if self.creds and self.creds.expired and self.creds.refresh_token:
                 self.creds.refresh(Request())
@@ -27,13 +41,54 @@ class GoogleClient:
                 flow = InstalledAppFlow.from_client_secrets_file(
                     'credentials/client_secret.json', self.SCOPES)
                 self.creds = flow.run_local_server(port=0)
-            
-            # Save credentials for next run
-            with open(token_file, 'w') as token:
-                token.write(self.creds.to_json())
-    
+
+            self._save_token()
+
+    def _save_token(self):
+        # Save credentials for next run
+        with open(self.token_file, 'w') as token:
+            token.write(self.creds.to_json())
+
+    def ensure_fresh(self):
+        """Refresh the access token if it's expired or about to expire
+
+        Services share self.creds, so a refresh here covers every service
+        already handed out. Long-running processes should call this before
+        API calls rather than waiting for a 401.
+        """
+        with self._lock:
+            expiry = self.creds.expiry  # naive UTC, as google-auth stores it
+            if not self.creds.refresh_token:
+                return
+            if self.creds.valid and (expiry is None or expiry - datetime.utcnow() > REFRESH_MARGIN):
+                return
+            self.creds.refresh(Request())
+            self._save_token()
+
+    def http(self) -> AuthorizedHttp:
+        """The calling thread's authorized connection"""
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = AuthorizedHttp(self.creds, http=httplib2.Http())
+        return http
+
+    def _build_request(self, http, *args, **kwargs) -> HttpRequest:
+        # Requests go out on the connection of the thread that makes them
+        return HttpRequest(self.http(), *args, **kwargs)
+
+    def _get_service(self, name: str, version: str):
+        """Build each API service once, from the discovery document bundled with the library"""
+        self.ensure_fresh()
+        with self._lock:
+            if (name, version) not in self._services:
+                self._services[(name, version)] = build(
+                    name, version, credentials=self.creds, requestBuilder=self._build_request,
+                    static_discovery=True, cache_discovery=False
+                )
+            return self._services[(name, version)]
+
     def get_calendar_service(self):
-        return build('calendar', 'v3', credentials=self.creds)
-    
+        return self._get_service('calendar', 'v3')
+
     def get_gmail_service(self):
-        return build('gmail', 'v1', credentials=self.creds)
+        return self._get_service('gmail', 'v1')
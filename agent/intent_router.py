@@ -0,0 +1,245 @@
+import re
+from concurrent.futures import Executor, TimeoutError as FutureTimeout
+from datetime import date, datetime, timedelta, time as clock
+from typing import Callable, List, Optional, Tuple
+from agent.metrics import metrics
+
+# Matched against the whole command, lowercased, without trailing punctuation
+WHATS = r"what(?:'?s| is)"
+
+NEXT_EVENT = re.compile(
+    rf"(?:(?:{WHATS}|when(?:'?s| is)) )?(?:my )?next(?: (?:meeting|event|appointment|call|one|up))?"
+    r"(?: on (?:my|the) (?:calendar|schedule))?"
+)
+AGENDA = re.compile(
+    rf"(?:{WHATS} (?:on )?(?:my )?(?:calendar|schedule|agenda) (?:for )?|{WHATS} on (?:for )?"
+    r"|what do i have (?:on )?|what meetings do i have |(?:show|list)(?: me)? my (?:calendar|schedule|agenda|meetings) (?:for )?"
+    r"|my (?:calendar|schedule|agenda) (?:for )?)(?P<day>today|tomorrow)"
+)
+TASKS = re.compile(
+    rf"(?:(?:list|show|read)(?: me)? |what are |{WHATS} on )?(?:all )?my "
+    r"(?:tasks|to-?dos|to-?do list|to do list|task list)"
+)
+ADD_TASK = re.compile(r"(?:add|create|new) (?:a )?(?:task|to-?do)(?: to| for)?:? (?P<task>.+)")
+FREE_TIME = re.compile(r"(?:when am i|am i|when(?:'?s| is) my|do i have(?: any)?)(?: free| available)\b.*")
+MAIL = r"(?:e-?mails?|mail|messages)"
+UNREAD_MAIL = re.compile(
+    r"(?:(?:do i have|are there|check|show me|read me|list|what are)(?: my)? )?(?:any )?(?:my )?"
+    rf"(?:unread(?: {MAIL})?|new {MAIL})(?: from (?P<sender>.+))?"
+)
+MAIL_ABOUT = re.compile(
+    r"(?:(?:do i have|are there|find|show me|search(?: for)?)(?: any)? )?(?:my )?"
+    rf"{MAIL} (?:about|on|regarding|mentioning) (?:the |my )?(?P<topic>.+)"
+)
+THANKS = re.compile(r"(?:thanks|thank you|thx|cheers)(?: ted)?(?: so much| a lot)?")
+GREETING = re.compile(r"(?:hi|hello|hey)(?: ted)?")
+
+class IntentRouter:
+    """Answers common requests from local data before they reach the LLM
+
+    Each rule is a compiled pattern that must match the whole command and a
+    handler that builds a templated reply from CalendarTools, Memory,
+    FreeSlots or GmailTools. A handler can return None to pass the command on; anything no
+    rule claims falls through to the LLM.
+
+    With a pool, handlers run on it and get `timeout` seconds, like the
+    context sources the LLM path gathers; a slow calendar falls through too.
+    Handlers that change state run inline instead: a write that outlived its
+    deadline would still land after the turn had moved on to the LLM.
+    """
+
+    def __init__(self, calendar, memory, free_slots=None, pool: Optional[Executor] = None,
+                 timeout: float = 1.5, gmail=None):
+        self.calendar = calendar
+        self.memory = memory
+        self.free_slots = free_slots
+        self.gmail = gmail
+        self.pool = pool
+        self.timeout = timeout
+        self.tz = free_slots.tz if free_slots is not None else datetime.now().astimezone().tzinfo
+
+        self.rules: List[Tuple[str, re.Pattern, Callable]] = [
+            ("next_event", NEXT_EVENT, self._next_event),
+            ("agenda", AGENDA, self._agenda),
+            ("tasks", TASKS, self._tasks),
+            ("add_task", ADD_TASK, self._add_task),
+            ("free_time", FREE_TIME, self._free_time),
+            ("unread_mail", UNREAD_MAIL, self._unread_mail),
+            ("mail_about", MAIL_ABOUT, self._mail_about),
+            ("thanks", THANKS, lambda match, command: "Anytime."),
+            ("greeting", GREETING, lambda match, command: "Hey! What do you need?"),
+        ]
+        self.writes = {"add_task"}
+        self.routed = 0
+        self.passed = 0
+
+    def route(self, command: str, timeout: Optional[float] = None) -> Optional[Tuple[str, str]]:
+        """(intent, reply) if a rule answers the command, otherwise None
+
+        timeout overrides the default deadline (e.g. what's left of a turn's).
+        """
+        original = command.strip().rstrip("?!. ").replace("’", "'")
+        text = original.lower()
+        for intent, pattern, handler in self.rules:
+            match = pattern.fullmatch(text)
+            if match is None:
+                continue
+            try:
+                if intent in self.writes:
+                    reply = handler(match, original)
+                else:
+                    reply = self._run(handler, match, original, self.timeout if timeout is None else timeout)
+            except FutureTimeout:
+                metrics.count("fallbacks", kind="router_timeout")
+                reply = None
+            except Exception as e:
+                # Let the LLM path (and its error handling) deal with it
+                metrics.count("errors", stage="router", error=type(e).__name__)
+                reply = None
+            if reply is not None:
+                self.routed += 1
+                metrics.count("routed", intent=intent)
+                return intent, reply
+            break
+        self.passed += 1
+        return None
+
+    def _run(self, handler, match, command, timeout: float) -> Optional[str]:
+        if self.pool is None:
+            return handler(match, command)
+        # A timed-out handler keeps running in the pool, but the turn moves on
+        return self.pool.submit(handler, match, command).result(timeout=timeout)
+
+    def _next_event(self, match, command) -> str:
+        events = self.calendar.get_events(1)
+        if not events:
+            return "Nothing else on your calendar."
+        event = events[0]
+        start = self._local(event, 'start')
+        summary = event.get('summary', 'something')
+        if start <= datetime.now(self.tz):
+            return f"You're in {summary} until {self._clock(self._local(event, 'end'))}."
+        return f"Your next one is {summary} {self._when(start)}."
+
+    def _agenda(self, match, command) -> str:
+        day_name = match.group('day')
+        day = datetime.now(self.tz).date()
+        if day_name == "tomorrow":
+            day += timedelta(days=1)
+
+        events = [e for e in self.calendar.get_events(50) if self._on_day(e, day)]
+        if not events:
+            return f"Nothing on your calendar {day_name}."
+
+        items = []
+        for event in events[:3]:
+            summary = event.get('summary', 'something')
+            if 'date' in event.get('start', {}):
+                items.append(f"{summary} (all day)")
+            else:
+                items.append(f"{summary} at {self._clock(self._local(event, 'start'))}")
+        if len(events) > 3:
+            listed = ", ".join(items) + f", plus {len(events) - 3} more"
+        else:
+            listed = self._join(items)
+        count = len(events)
+        return f"You have {count} {'thing' if count == 1 else 'things'} {day_name}: {listed}."
+
+    def _tasks(self, match, command) -> str:
+        tasks = self.memory.get_tasks()
+        if not tasks:
+            return "Your task list is empty."
+        names = [t["description"] for t in tasks[:5]]
+        if len(tasks) > 5:
+            names.append(f"{len(tasks) - 5} more")
+        return f"You've got {len(tasks)} {'task' if len(tasks) == 1 else 'tasks'}: {self._join(names)}."
+
+    def _add_task(self, match, command) -> str:
+        task = command[match.start('task'):match.end('task')].strip()
+        self.memory.add_task(task)
+        return f"Added to your tasks: {task}."
+
+    def _free_time(self, match, command) -> Optional[str]:
+        if self.free_slots is None:
+            return None
+        request = self.free_slots.parse(command)
+        if request is None:
+            return None
+        minutes = int(request.duration.total_seconds() // 60)
+        slots = self.free_slots.find(request.duration, request.start, request.end, limit=3)
+        if not slots:
+            return f"I don't see a free {minutes}-minute slot {request.label}."
+        offers = [f"{self._day(start)} {self._clock(start)} to {self._clock(end)}" for start, end in slots]
+        return f"You're free {self._join(offers, 'or')}."
+
+    def _unread_mail(self, match, command) -> Optional[str]:
+        if self.gmail is None:
+            return None
+        sender = command[match.start('sender'):match.end('sender')].strip() if match.group('sender') else None
+        messages = self.gmail.unread_from(sender, 20) if sender else self.gmail.unread(20)
+        source = f" from {sender}" if sender else ""
+        if not messages:
+            return f"No unread email{source}."
+        count = f"{len(messages)}+" if len(messages) == 20 else str(len(messages))
+        items = [self._message(m, with_sender=not sender) for m in messages[:3]]
+        if len(messages) > 3:
+            items.append("more")
+        return f"You've got {count} unread{source}: {self._join(items)}."
+
+    def _mail_about(self, match, command) -> Optional[str]:
+        if self.gmail is None:
+            return None
+        topic = command[match.start('topic'):match.end('topic')].strip()
+        messages = self.gmail.search(topic, 3)
+        if not messages:
+            return f"Nothing in your mail about {topic}."
+        items = [f"{self._message(m)} {self._received(m)}" for m in messages]
+        return f"Latest on {topic}: {self._join(items)}."
+
+    @staticmethod
+    def _message(message, with_sender: bool = True) -> str:
+        subject = message.get('subject') or "(no subject)"
+        sender = message.get('sender_name') or message.get('sender_email')
+        return f'"{subject}" from {sender}' if with_sender and sender else f'"{subject}"'
+
+    def _received(self, message) -> str:
+        received = datetime.fromtimestamp(message['received_at'] / 1000, self.tz)
+        day = self._day(received)
+        return day if day in ("today", "tomorrow") else f"on {day}"
+
+    def _local(self, event, key) -> datetime:
+        """Event start/end in local time (all-day events start at local midnight)"""
+        value = event.get(key, {})
+        if 'dateTime' in value:
+            return datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00')).astimezone(self.tz)
+        return datetime.combine(date.fromisoformat(value['date']), clock(0), self.tz)
+
+    def _on_day(self, event, day: date) -> bool:
+        # The end is exclusive, so an event ending at midnight isn't on the next day
+        start = self._local(event, 'start')
+        end = self._local(event, 'end') - timedelta(seconds=1)
+        return start.date() <= day <= max(start, end).date()
+
+    def _when(self, start: datetime) -> str:
+        day = self._day(start)
+        return f"at {self._clock(start)}" if day == "today" else f"{day} at {self._clock(start)}"
+
+    def _day(self, when: datetime) -> str:
+        today = datetime.now(self.tz).date()
+        if when.date() == today:
+            return "today"
+        if when.date() == today + timedelta(days=1):
+            return "tomorrow"
+        return f"{when:%A}" if when.date() - today < timedelta(days=7) else f"{when:%a %b} {when.day}"
+
+    @staticmethod
+    def _clock(when: datetime) -> str:
+        """2 PM, 2:30 PM"""
+        text = when.strftime("%I:%M %p").lstrip("0")
+        return text.replace(":00", "")
+
+    @staticmethod
+    def _join(items: List[str], word: str = "and") -> str:
+        if len(items) <= 1:
+            return "".join(items)
+        return f"{', '.join(items[:-1])} {word} {items[-1]}"
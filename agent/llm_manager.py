@@ -1,79 +1,523 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
-from typing import Dict, Any
+import re
+import time
+from collections import deque
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Tuple, Union
+from agent.memory import DEFAULT_SESSION
+from agent.metrics import metrics
+from agent.model_cascade import ModelCascade, Route
+from agent.prompt_builder import PromptBuilder
+from agent.response_cache import ResponseCache
 
-class LLMManager:
-    def __init__(self, model: str = "phi3:mini"):
-        self.model = model
-        self.ollama_url = "http://localhost:11434/api/generate"
-        self.conversation_history = []
-    
-    def generate_response(self, prompt: str, context: str = "") -> str:
-        """Send prompt to local LLM via Ollama"""
-        
-        system_prompt = """
-        You are TED, a direct personal assistant. You manage calendar, emails, and tasks.
+# A sentence ends at ., ! or ? followed by whitespace...
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+# ...unless the period belongs to a title or an initial ("Dr. Smith", "J. Smith")
+NEVER_END = re.compile(r'(?:\b(?i:mr|mrs|ms|dr|prof|st|jr|sr|vs|approx)|(?:^|\s)[A-Z])\.$')
+# ...or to a dotted abbreviation ("2 p.m. tomorrow"), unless a capital follows ("2 p.m. Then")
+DOTTED = re.compile(r'\b(?:[a-z]\.){2,}$', re.I)
 
-        RESPONSE STYLE:
-        - Be brief: 1-2 sentences max
-        - Be direct and actionable
-        - Use casual language like a human assistant
-        - No fluff, no explanations unless asked
-        - If you can't do something, say what you CAN do
-        - Use contractions: "I'll", "you've", "can't"
-        - Sound like a busy colleague, not a chatbot
+def _sentence_ends(text: str):
+    """SENTENCE_END matches in text that really end a sentence"""
+    for match in SENTENCE_END.finditer(text):
+        before = text[:match.start()]
+        if NEVER_END.search(before[-12:]):
+            continue
+        if DOTTED.search(before[-16:]):
+            following = text[match.end():match.end() + 1]
+            # Not streamed yet: decide once the next word arrives
+            if not following.isupper():
+                continue
+        yield match
 
-        Examples:
-        User: "What's on my calendar today?"
-        You: "You have 3 meetings. Your next one is the project sync at 2 PM."
+def split_sentences(text: str) -> List[str]:
+    sentences = []
+    start = 0
+    for match in _sentence_ends(text):
+        sentences.append(text[start:match.start()])
+        start = match.end()
+    sentences.append(text[start:])
+    return [sentence.strip() for sentence in sentences if sentence.strip()]
 
-        User: "Schedule a meeting with Alex"
-        You: "I can't schedule yet, but I can show you your free slots."
+# Static part of the prompt. It's evaluated once at warm-up and its KV
+# context is reused, so keep anything that changes per turn out of it.
+SYSTEM_PROMPT = """
+You are TED, a direct personal assistant. You manage calendar, emails, and tasks.
 
-        User: "How's the weather?"
-        You: "I focus on your calendar and emails. Want me to check your schedule instead?"
+RESPONSE STYLE:
+- Be brief: 1-2 sentences max
+- Be direct and actionable
+- Use casual language like a human assistant
+- No fluff, no explanations unless asked
+- If you can't do something, say what you CAN do
+- Use contractions: "I'll", "you've", "can't"
+- Sound like a busy colleague, not a chatbot
 
-        Context: {context}
+Examples:
+User: "What's on my calendar today?"
+You: "You have 3 meetings. Your next one is the project sync at 2 PM."
 
-        User: {prompt}
-        """
+User: "Schedule a meeting with Alex"
+You: "I can't schedule yet, but I can show you your free slots."
+
+User: "How's the weather?"
+You: "I focus on your calendar and emails. Want me to check your schedule instead?"
+"""
+
+TURN_TEMPLATE = """
+Context: {context}
+
+User: {prompt}
+"""
+
+class _Escalate(Exception):
+    """The small model's first sentence says it can't answer"""
+
+class _ConsumerGone(Exception):
+    """on_token raised (e.g. the WebSocket closed); re-raised as its cause, not answered"""
+
+class _SentenceStream:
+    """Splits streamed tokens into sentences and ends the reply after max_sentences
+    
+    With a screen, nothing is released until the first sentence is complete;
+    if screen(first_sentence) is true, _Escalate is raised before anything
+    has reached the user.
+    """
+    
+    def __init__(self, max_sentences: int, screen: Optional[Callable[[str], bool]] = None):
+        self.max_sentences = max_sentences
+        self.screen = screen
+        self.sentences: List[str] = []
+        self.text = ""
+        self.tokens = 0
+        self.full = False
+        self._pending = ""
+        self._held = ""
+        self._held_sentences: List[str] = []
+    
+    def feed(self, token: str) -> Tuple[str, List[str]]:
+        """Text for on_token and finished sentences for on_sentence"""
+        self.tokens += 1
+        text = self._pending + token
+        room = self.max_sentences - len(self.sentences)
+        finished = []
+        start = 0
+        for match in _sentence_ends(text):
+            sentence = text[start:match.start()].strip()
+            start = match.end()
+            if sentence:
+                finished.append(sentence)
+                if len(finished) == room:
+                    # Whatever follows the last allowed sentence is dropped
+                    self.full = True
+                    token = token[:max(0, match.start() - len(self._pending))]
+                    break
+        self._pending = "" if self.full else text[start:]
+        self.text += token
+        self.sentences.extend(finished)
+        return self._release(token, finished)
+    
+    def finish(self) -> Tuple[str, List[str]]:
+        """The unterminated last sentence, once the stream has ended"""
+        last = [] if self.full or not self._pending.strip() else [self._pending.strip()]
+        self._pending = ""
+        self.sentences.extend(last)
+        return self._release("", last)
+    
+    def _release(self, text: str, sentences: List[str]) -> Tuple[str, List[str]]:
+        if self.screen is None:
+            return text, sentences
+        self._held += text
+        self._held_sentences += sentences
+        if not self.sentences:
+            return "", []
+        if self.screen(self.sentences[0]):
+            raise _Escalate(self.sentences[0])
+        self.screen = None
+        return self._held, self._held_sentences
+
+def _missing_model(error: Exception) -> bool:
+    """Ollama answers 404 for a model that hasn't been pulled"""
+    return getattr(getattr(error, "response", None), "status_code", None) == 404
+
+class LLMManager:
+    def __init__(self, model: str = "phi3:mini", keep_alive: str = "30m",
+                 token_budgets: Optional[Dict[str, int]] = None,
+                 ollama_url: str = "http://localhost:11434/api/generate",
+                 history_limit: int = 50, small_model: Optional[str] = "llama3.2:1b"):
+        """model answers anything non-trivial; small_model (None to turn the
+        cascade off) takes short, simple turns"""
+        self.model = model
+        # Which model and generation limits each turn gets
+        self.cascade = ModelCascade(model, small_model)
+        self.ollama_url = ollama_url
+        self.keep_alive = keep_alive
+        # Ring buffer: the full record lives in Memory, this is only the latest turns
+        self.conversation_history = deque(maxlen=history_limit)
+        self.prompt_builder = PromptBuilder(TURN_TEMPLATE, SYSTEM_PROMPT, token_budgets)
+        self.response_cache = ResponseCache()
+        
+        # Where the last generate_response() spent its time, see _ollama_stats()
+        self.last_stats = {}
         
-        full_prompt = system_prompt.format(context=context, prompt=prompt)
+        # One pooled connection to Ollama instead of a new one per turn
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
         
+        # Ollama's context array for the evaluated SYSTEM_PROMPT per model, set by warm_up()
+        self._system_context: Dict[str, List[int]] = {}
+        
+        # httpx client for the async path, created on first use in the server's loop
+        self._async_client = None
+    
+    def warm_up(self) -> bool:
+        """Load the models and evaluate the static system prompt once for each
+        
+        Keeps them resident for keep_alive and remembers the returned
+        contexts so later turns only send their dynamic part. A small model
+        that isn't installed turns the cascade off.
+        """
+        for model in self.cascade.models:
+            payload = {
+                "model": model,
+                "prompt": SYSTEM_PROMPT,
+                "stream": False,
+                "keep_alive": self.keep_alive,
+                "options": {"num_predict": 1},
+            }
+            try:
+                response = self.session.post(self.ollama_url, json=payload)
+                response.raise_for_status()
+                self._system_context[model] = response.json().get("context")
+            except Exception as e:
+                if model == self.cascade.small and _missing_model(e):
+                    print(f"ℹ️ {model} isn't installed, {self.cascade.large} will answer everything")
+                    self.cascade.disable_small()
+                    continue
+                print(f"⚠️ LLM warm-up failed: {e}")
+                return False
+        return True
+    
+    def _plan(self, prompt: str, context: Union[str, Dict[str, List[str]]]) -> Tuple[str, Route]:
+        """The turn prompt, and the model and limits it gets"""
+        turn = self.prompt_builder.build(prompt, context)
+        route = self.cascade.choose(prompt, self.prompt_builder.last_stats["turn_tokens"])
+        return turn, route
+    
+    def _build_payload(self, turn: str, route: Route) -> Dict[str, Any]:
+        """Build the Ollama request, reusing the system prompt's context if warm"""
         payload = {
-            "model": self.model,
-            "prompt": full_prompt,
-            "stream": False,
+            "model": route.model,
+            "keep_alive": self.keep_alive,
+            "stream": True,
             "options": {
                 "temperature": 0.3,
-                "num_predict": 150,
+                # Backstops: the sentence limit normally ends the stream first
+                "num_predict": route.num_predict,
+                "stop": list(route.stop),
             }
         }
+        system_context = self._system_context.get(route.model)
+        if system_context:
+            payload["prompt"] = turn
+            payload["context"] = system_context
+        else:
+            # Same prefix every turn, so Ollama's prompt cache can still hit
+            payload["prompt"] = SYSTEM_PROMPT + turn
+        return payload
+    
+    def generate_response(self, prompt: str, context: Union[str, Dict[str, List[str]]] = "",
+                          on_token: Optional[Callable[[str], None]] = None,
+                          on_sentence: Optional[Callable[[str], None]] = None,
+                          session_id: str = DEFAULT_SESSION) -> str:
+        """Send prompt to local LLM via Ollama
+
+        context is either a plain string or sections ("memory", "calendar")
+        of items, which are trimmed to the prompt builder's token budgets.
+
+        The turn goes to the model ModelCascade picks for it, and generation
+        ends at its sentence limit. on_token, if given, gets every chunk as it
+        arrives and on_sentence every finished sentence, so TTS can start
+        while the rest is still generating.
+        """
+        
+        # Repeated questions against an unchanged calendar skip generation
+        fingerprint = self.response_cache.fingerprint(context, session_id)
+        cached = self.response_cache.get(self.model, prompt, fingerprint)
+        if cached is not None:
+            self.last_stats = {"cached": True}
+            metrics.count("response_cache", result="hit")
+            if on_token:
+                on_token(cached)
+            if on_sentence:
+                for sentence in split_sentences(cached):
+                    on_sentence(sentence)
+            return cached
+        
+        turn, route = self._plan(prompt, context)
+        self.last_stats = {"cached": False, "escalated": False}
+        streaming = on_token is not None or on_sentence is not None
+        
+        with metrics.span("llm", model=route.model, stream=streaming) as span:
+            try:
+                while True:
+                    try:
+                        reply, fallback = self._stream_response(self._build_payload(turn, route), route,
+                                                                on_token, on_sentence)
+                        break
+                    except Exception as e:
+                        escalated = self._escalation(route, e)
+                        if escalated is None:
+                            raise
+                        route = escalated
+                        self.last_stats["escalated"] = True
+                
+                span.set(model=route.model, tier=route.tier, escalated=self.last_stats["escalated"])
+                self.last_stats.update(model=route.model, tier=route.tier)
+                metrics.count("llm_turns", tier=route.tier)
+                reply = self._shorten_response(reply, route.max_sentences)
+                self._cache_reply(prompt, fingerprint, reply, fallback)
+                return reply
+                
+            except Exception as e:
+                self._record_failure(span, e)
+                if on_sentence:
+                    on_sentence("One moment...")
+                return f"One moment..."
+
+    def _stream_response(self, payload: Dict[str, Any], route: Route,
+                         on_token: Optional[Callable[[str], None]],
+                         on_sentence: Optional[Callable[[str], None]]) -> Tuple[str, bool]:
+        """Consume Ollama's NDJSON stream up to the route's sentence limit
+        
+        Returns the text and whether it's a fallback rather than the model's reply.
+        """
+        reply = self._sentence_stream(route)
+        started = time.perf_counter()
+        first_token = None
+        done = None
+        
+        with self.session.post(self.ollama_url, json=payload, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                token = data.get("response", "")
+                if token:
+                    if first_token is None:
+                        first_token = time.perf_counter() - started
+                    # Hand every finished sentence over while the rest generates
+                    self._emit(reply.feed(token), on_token, on_sentence)
+                    if reply.full:
+                        # Closing the connection stops Ollama generating
+                        break
+                if data.get("done"):
+                    done = data
+                    break
+        self._emit(reply.finish(), on_token, on_sentence)
+        self.last_stats.update(self._ollama_stats(done or self._cut_off(reply, started, first_token),
+                                                  started, first_token, route.model))
+        self.last_stats["cut_off"] = done is None
+        
+        if not reply.sentences:
+            metrics.count("fallbacks", kind="empty_reply")
+            self._emit(("Got it.", ["Got it."]), on_token, on_sentence)
+            return "Got it.", True
+        return reply.text, False
+
+    def _cache_reply(self, prompt: str, fingerprint: str, reply: str, fallback: bool):
+        # A fallback or a reply that admits it doesn't know is not an answer worth repeating
+        if fallback or self.cascade.hedged(reply):
+            return
+        self.response_cache.put(self.model, prompt, fingerprint, reply)
+
+    def _sentence_stream(self, route: Route) -> _SentenceStream:
+        # Only the small model's replies are screened, there's nothing to escalate to after
+        screen = self.cascade.hedged if self.cascade.escalate(route) else None
+        return _SentenceStream(route.max_sentences, screen)
+
+    def _escalation(self, route: Route, error: Exception) -> Optional[Route]:
+        """The route to retry on after error, or None if it should fail the turn"""
+        escalated = self.cascade.escalate(route)
+        if escalated is None:
+            return None
+        if isinstance(error, _Escalate):
+            metrics.count("escalations", reason="hedge")
+            return escalated
+        if _missing_model(error):
+            self.cascade.disable_small()
+            metrics.count("escalations", reason="missing_model")
+            return escalated
+        return None
+
+    @staticmethod
+    def _emit(released: Tuple[str, List[str]], on_token, on_sentence):
+        text, sentences = released
+        if on_token and text:
+            on_token(text)
+        if on_sentence:
+            for sentence in sentences:
+                on_sentence(sentence)
+
+    @staticmethod
+    def _cut_off(reply: _SentenceStream, started: float, first_token: Optional[float]) -> Dict[str, Any]:
+        """Timing fields like Ollama's final chunk, for a stream we ended ourselves"""
+        first_token = first_token or 0.0
+        return {
+            "prompt_eval_duration": first_token * 1e9,
+            "eval_count": reply.tokens,
+            "eval_duration": (time.perf_counter() - started - first_token) * 1e9,
+        }
+
+    def _ollama_stats(self, data: Dict[str, Any], started: float,
+                      first_token: Optional[float], model: str) -> Dict[str, Any]:
+        """Ollama's own timings (ns) from the final chunk, in seconds
         
+        prompt_eval is the time spent on the prompt before the first token,
+        generation the time spent producing eval_count tokens.
+        """
+        stats = {
+            "request": time.perf_counter() - started,
+            "first_token": first_token,
+            "prompt_eval_count": data.get("prompt_eval_count", 0),
+            "prompt_eval": data.get("prompt_eval_duration", 0) / 1e9,
+            "eval_count": data.get("eval_count", 0),
+            "generation": data.get("eval_duration", 0) / 1e9,
+        }
+        if metrics.enabled:
+            metrics.observe("ollama_prompt_eval_seconds", stats["prompt_eval"], attrs={"model": model})
+            metrics.observe("ollama_eval_seconds", stats["generation"], attrs={"model": model})
+            metrics.count("ollama_prompt_tokens", stats["prompt_eval_count"], model=model)
+            metrics.count("ollama_eval_tokens", stats["eval_count"], model=model)
+            if first_token is not None:
+                metrics.observe("llm_first_token_seconds", first_token, attrs={"model": model})
+        return stats
+
+    def _record_failure(self, span, error: Exception):
+        """Count a failed generation that was answered with the "One moment..." fallback"""
+        span.set(error=type(error).__name__, detail=str(error))
+        metrics.count("errors", stage="llm", error=type(error).__name__)
+        metrics.count("fallbacks", kind="one_moment")
+
+    async def agenerate_response(self, prompt: str, context: Union[str, Dict[str, List[str]]] = "",
+                                 on_token: Optional[Callable[[str], Awaitable[None]]] = None,
+                                 session_id: str = DEFAULT_SESSION,
+                                 stats: Optional[Dict[str, Any]] = None) -> str:
+        """Async variant of generate_response for the server
+        
+        Always streams from Ollama over a shared httpx.AsyncClient; on_token,
+        if given, is awaited with every chunk. last_stats is per-instance, so
+        concurrent turns get theirs in `stats` instead, if passed.
+        """
+        stats = {} if stats is None else stats
+        fingerprint = self.response_cache.fingerprint(context, session_id)
+        cached = self.response_cache.get(self.model, prompt, fingerprint)
+        if cached is not None:
+            stats["cached"] = True
+            metrics.count("response_cache", result="hit")
+            if on_token:
+                await on_token(cached)
+            return cached
+        
+        turn, route = self._plan(prompt, context)
+        stats.update(cached=False, escalated=False)
+        
+        with metrics.span("llm", model=route.model, stream=True) as span:
+            try:
+                while True:
+                    try:
+                        reply, fallback = await self._astream_response(self._build_payload(turn, route),
+                                                                       route, on_token, stats)
+                        break
+                    except Exception as e:
+                        escalated = self._escalation(route, e)
+                        if escalated is None:
+                            raise
+                        route = escalated
+                        stats["escalated"] = True
+                
+                span.set(model=route.model, tier=route.tier, escalated=stats["escalated"])
+                stats.update(model=route.model, tier=route.tier)
+                metrics.count("llm_turns", tier=route.tier)
+                reply = self._shorten_response(reply, route.max_sentences)
+                self._cache_reply(prompt, fingerprint, reply, fallback)
+                return reply
+                
+            except _ConsumerGone as e:
+                # Nobody is listening: don't answer, and don't let the caller save an answer
+                raise e.__cause__
+            except Exception as e:
+                self._record_failure(span, e)
+                return "One moment..."
+    
+    @staticmethod
+    async def _deliver(on_token: Optional[Callable[[str], Awaitable[None]]], text: str):
+        if not on_token or not text:
+            return
         try:
-            response = requests.post(self.ollama_url, json=payload)
-            response.raise_for_status()
-            result = response.json()
-            raw_response = result.get("response", "Got it.")
-            
-            return self._shorten_response(raw_response)
-            
+            await on_token(text)
         except Exception as e:
-            return f"One moment..."
-
-    def _shorten_response(self, response: str) -> str:
-        """Enforce 1-2 sentence limit"""
-        sentences = response.split('. ')
-        return response.replace('**', '').replace('#', '').strip()
-        
-        # Take only first 2 sentences
-        if len(sentences) > 2:
-            shortened = '. '.join(sentences[:2]) + '.'
-            # Remove any markdown or extra spaces
-            shortened = shortened.replace('**', '').replace('#', '').strip()
-            return shortened
-        else:
-            return response.replace('**', '').replace('#', '').strip()
+            raise _ConsumerGone() from e
+    
+    async def _astream_response(self, payload: Dict[str, Any], route: Route,
+                                on_token: Optional[Callable[[str], Awaitable[None]]],
+                                stats: Dict[str, Any]) -> Tuple[str, bool]:
+        reply = self._sentence_stream(route)
+        started = time.perf_counter()
+        first_token = None
+        done = None
+        client = self._get_async_client()
+        async with client.stream("POST", self.ollama_url, json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                token = data.get("response", "")
+                if token:
+                    if first_token is None:
+                        first_token = time.perf_counter() - started
+                    text, _ = reply.feed(token)
+                    await self._deliver(on_token, text)
+                    if reply.full:
+                        break
+                if data.get("done"):
+                    done = data
+                    break
+        text, _ = reply.finish()
+        await self._deliver(on_token, text)
+        stats.update(self._ollama_stats(done or self._cut_off(reply, started, first_token),
+                                        started, first_token, route.model))
+        stats["cut_off"] = done is None
+        
+        if not reply.sentences:
+            metrics.count("fallbacks", kind="empty_reply")
+            return "Got it.", True
+        return reply.text, False
+    
+    def _get_async_client(self):
+        if self._async_client is None:
+            import httpx
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(120.0, connect=5.0),
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+            )
+        return self._async_client
+    
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def _shorten_response(self, response: str, max_sentences: int = 2) -> str:
+        """Enforce the sentence limit and strip markdown"""
+        response = response.replace('**', '').replace('#', '').strip()
+        sentences = split_sentences(response)
+        if len(sentences) > max_sentences:
+            response = ' '.join(sentences[:max_sentences])
+        return response
     
     def add_to_history(self, user_input: str, ai_response: str):
         self.conversation_history.append({"user": user_input, "ai": ai_response})
@@ -1,51 +1,409 @@
 import sqlite3
 import json
-from datetime import datetime
+import re
+import atexit
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Dict, Optional, Tuple
+from agent.metrics import metrics
+from agent.prompt_builder import estimate_tokens
+
+WORD = re.compile(r"[a-z0-9]+")
+
+# Conversations from the CLI; server sessions use their own ids
+DEFAULT_SESSION = "cli"
+
+# Too common to say anything about relevance
+STOP_WORDS = {
+    "a", "an", "and", "are", "at", "be", "can", "do", "for", "i", "in", "is", "it",
+    "me", "my", "of", "on", "or", "s", "the", "to", "what", "when", "with", "you", "your",
+}
+
+# SQLite's CURRENT_TIMESTAMP format (UTC)
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def rollup_summary(turns: List[Tuple[str, str]], max_topics: int = 12, max_questions: int = 3) -> str:
+    """Extractive summary of a range of exchanges: main topics and a few of the questions
+
+    Keeps the words search matches on, so rolled-up conversations stay findable.
+    """
+    counts = Counter(
+        word for user_input, ai_response in turns
+        for word in WORD.findall(f"{user_input} {ai_response}".lower())
+        if word not in STOP_WORDS and len(word) > 2
+    )
+    topics = [word for word, _ in counts.most_common(max_topics)]
+    questions = list(dict.fromkeys(user_input.strip()[:60] for user_input, _ in turns))[:max_questions]
+    summary = f"Talked about {', '.join(topics)}." if topics else "Small talk."
+    if questions:
+        summary += f" Asked things like: {'; '.join(questions)}"
+    return summary
+
+class IdleCompactor:
+    """Runs Memory.compact on a daemon thread once nothing has happened for idle_after seconds
+
+    Call touch() whenever a command starts or finishes; a compaction in
+    progress stops after its current batch as soon as there's activity.
+    """
+
+    def __init__(self, memory: "Memory", idle_after: float = 60.0, interval: float = 3600.0):
+        self.memory = memory
+        self.idle_after = idle_after
+        self.interval = interval
+        self.last_stats: Dict[str, int] = {}
+        self._last_activity = time.monotonic()
+        # Compact soon after the first idle period, then at most every interval
+        self._last_run = time.monotonic() - interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def touch(self):
+        self._last_activity = time.monotonic()
+
+    def idle(self) -> bool:
+        return time.monotonic() - self._last_activity >= self.idle_after
+
+    def start(self) -> "IdleCompactor":
+        self._thread = threading.Thread(target=self._run, daemon=True, name="ted-compactor")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(min(self.idle_after, 30.0)):
+            if not self.idle() or time.monotonic() - self._last_run < self.interval:
+                continue
+            try:
+                self.last_stats = self.memory.compact(should_stop=lambda: not self.idle() or self._stop.is_set())
+            except Exception as e:
+                # Whatever went wrong, the thread has to live to try again next interval
+                metrics.count("errors", stage="memory_compact", error=type(e).__name__)
+            self._last_run = time.monotonic()
 
 class Memory:
-    def __init__(self, db_path="ted_memory.db"):
+    def __init__(self, db_path="ted_memory.db", batch_size=64, retention_days=30,
+                 max_turns=5000, summary_retention_days=365, rollup_size=50):
+        """Conversations older than retention_days, or beyond the newest max_turns,
+        are rolled up by compact() into summary rows of up to rollup_size exchanges;
+        summaries older than summary_retention_days are dropped."""
         self.db_path = db_path
+        self.batch_size = batch_size
+        self.retention_days = retention_days
+        self.max_turns = max_turns
+        self.summary_retention_days = summary_retention_days
+        self.rollup_size = rollup_size
+
+        # One long-lived connection shared by callers and the writer thread;
+        # sqlite3 keeps a cache of prepared statements per connection
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, cached_statements=64)
+        self._lock = threading.Lock()
         self._init_db()
-    
+
+        # Rows waiting for the writer thread, still visible to readers
+        self._pending = []
+        self._pending_cond = threading.Condition()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="ted-memory-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
     def _init_db(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS conversations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_input TEXT NOT NULL,
-                ai_response TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        with self._lock:
+            cursor = self._conn.cursor()
+            # Only takes effect on a new database; compact() converts older ones
+            cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS conversations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_input TEXT NOT NULL,
+                    ai_response TEXT NOT NULL,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    session_id TEXT NOT NULL DEFAULT 'cli',
+                    kind TEXT NOT NULL DEFAULT 'turn'
+                )
+            ''')
+            columns = [row[1] for row in cursor.execute("PRAGMA table_info(conversations)")]
+            if 'session_id' not in columns:
+                # Databases from before sessions existed: everything so far was the CLI
+                cursor.execute(
+                    "ALTER TABLE conversations ADD COLUMN session_id TEXT NOT NULL DEFAULT 'cli'"
+                )
+            if 'kind' not in columns:
+                # 'turn' is one exchange, 'summary' a rolled-up range of them
+                cursor.execute(
+                    "ALTER TABLE conversations ADD COLUMN kind TEXT NOT NULL DEFAULT 'turn'"
+                )
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_conversations_timestamp
+                ON conversations (timestamp)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_conversations_session
+                ON conversations (session_id, id)
+            ''')
+            # Full-text index over conversations, kept in sync by triggers
+            has_fts = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'conversations_fts'"
+            ).fetchone()
+            cursor.executescript('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+                    user_input, ai_response,
+                    content='conversations', content_rowid='id'
+                );
+                CREATE TRIGGER IF NOT EXISTS conversations_ai AFTER INSERT ON conversations BEGIN
+                    INSERT INTO conversations_fts (rowid, user_input, ai_response)
+                    VALUES (new.id, new.user_input, new.ai_response);
+                END;
+                CREATE TRIGGER IF NOT EXISTS conversations_ad AFTER DELETE ON conversations BEGIN
+                    INSERT INTO conversations_fts (conversations_fts, rowid, user_input, ai_response)
+                    VALUES ('delete', old.id, old.user_input, old.ai_response);
+                END;
+                CREATE TRIGGER IF NOT EXISTS conversations_au AFTER UPDATE ON conversations BEGIN
+                    INSERT INTO conversations_fts (conversations_fts, rowid, user_input, ai_response)
+                    VALUES ('delete', old.id, old.user_input, old.ai_response);
+                    INSERT INTO conversations_fts (rowid, user_input, ai_response)
+                    VALUES (new.id, new.user_input, new.ai_response);
+                END;
+            ''')
+            if not has_fts:
+                # Index conversations stored before the FTS table existed
+                cursor.execute("INSERT INTO conversations_fts (conversations_fts) VALUES ('rebuild')")
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    description TEXT NOT NULL,
+                    completed BOOLEAN DEFAULT FALSE,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            self._conn.commit()
+
+    def save_conversation(self, user_input: str, ai_response: str, session_id: str = DEFAULT_SESSION):
+        """Queue a conversation for the background writer (returns immediately)"""
+        with self._pending_cond:
+            self._pending.append((user_input, ai_response, session_id))
+            self._pending_cond.notify()
+
+    def get_recent_conversations(self, limit=5, session_id: str = DEFAULT_SESSION):
+        # id follows insertion order, so (session_id, id) serves this without a sort
+        with metrics.span("memory_recent"), self._lock:
+            with self._pending_cond:
+                pending = [row for row in self._pending if row[2] == session_id][-limit:]
+            cursor = self._conn.execute(
+                "SELECT user_input, ai_response FROM conversations "
+                "WHERE session_id = ? AND kind = 'turn' ORDER BY id DESC LIMIT ?",
+                (session_id, limit)
             )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tasks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                description TEXT NOT NULL,
-                completed BOOLEAN DEFAULT FALSE,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            results = cursor.fetchall()
+        newest_first = list(reversed(pending)) + results
+        return [{"user": r[0], "ai": r[1]} for r in newest_first[:limit]]
+
+    def search_conversations(self, query: str, k: int = 5, token_budget: int = 300,
+                             candidates: int = 200,
+                             session_id: str = DEFAULT_SESSION) -> List[Dict[str, str]]:
+        """Top-k past exchanges most relevant to query that fit in token_budget
+
+        Ranked by FTS5 bm25 among the session's newest `candidates` matches, which keeps
+        lookups in the low milliseconds however common the words are.
+        Conversations still queued for the writer aren't searchable yet;
+        get_recent_conversations covers those.
+        """
+        words = [w for w in WORD.findall(query.lower()) if w not in STOP_WORDS]
+        if not words:
+            return []
+        match = " OR ".join(f'"{w}"' for w in dict.fromkeys(words))
+
+        with metrics.span("memory_search"), self._lock:
+            cursor = self._conn.execute(
+                """
+                SELECT user_input, ai_response
+                FROM (
+                    SELECT c.user_input, c.ai_response, bm25(conversations_fts) AS score
+                    FROM conversations_fts
+                    JOIN conversations c ON c.id = conversations_fts.rowid
+                    WHERE conversations_fts MATCH ? AND c.session_id = ?
+                    ORDER BY conversations_fts.rowid DESC
+                    LIMIT ?
+                )
+                ORDER BY score
+                LIMIT ?
+                """,
+                (match, session_id, candidates, k)
+            )
+            results = cursor.fetchall()
+
+        selected = []
+        used = 0
+        for user_input, ai_response in results:
+            cost = estimate_tokens(user_input) + estimate_tokens(ai_response)
+            if used + cost > token_budget:
+                continue
+            used += cost
+            selected.append({"user": user_input, "ai": ai_response})
+        return selected
+
+    def recall(self, query: str, token_budget: int = 300,
+               session_id: str = DEFAULT_SESSION) -> List[Dict[str, str]]:
+        """The last couple of turns for continuity, plus older ones relevant to query"""
+        with metrics.span("memory_read"):
+            chats = self.get_recent_conversations(limit=2, session_id=session_id)
+            for chat in self.search_conversations(query, k=5, token_budget=token_budget,
+                                                  session_id=session_id):
+                if chat not in chats:
+                    chats.append(chat)
+            return chats
+
+    def get_tasks(self, include_completed: bool = False, limit: int = 20) -> List[Dict]:
+        """Tasks, oldest first"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT id, description, completed, created_at FROM tasks "
+                "WHERE completed = 0 OR ? ORDER BY id LIMIT ?",
+                (include_completed, limit)
             )
-        ''')
-        conn.commit()
-        conn.close()
-    
-    def save_conversation(self, user_input: str, ai_response: str):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO conversations (user_input, ai_response) VALUES (?, ?)",
-            (user_input, ai_response)
-        )
-        conn.commit()
-        conn.close()
-    
-    def get_recent_conversations(self, limit=5):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT user_input, ai_response FROM conversations ORDER BY timestamp DESC LIMIT ?",
-            (limit,)
-        )
-        results = cursor.fetchall()
-        conn.close()
-        return [{"user": r[0], "ai": r[1]} for r in results]
+            rows = cursor.fetchall()
+        return [
+            {"id": r[0], "description": r[1], "completed": bool(r[2]), "created_at": r[3]}
+            for r in rows
+        ]
+
+    def add_task(self, description: str) -> int:
+        with self._lock, self._conn:
+            cursor = self._conn.execute("INSERT INTO tasks (description) VALUES (?)", (description,))
+        return cursor.lastrowid
+
+    def compact(self, summarize: Optional[Callable[[List[Tuple[str, str]]], str]] = None,
+                should_stop: Optional[Callable[[], bool]] = None,
+                max_batches: int = 100, vacuum_pages: int = 2000,
+                now: Optional[datetime] = None) -> Dict[str, int]:
+        """Roll old conversations into summaries, expire old summaries and free space
+
+        Meant to run when TED is idle: it works in small transactions and
+        checks should_stop() between them, so a new command only ever waits
+        for one batch. summarize turns [(user_input, ai_response)] into text
+        (rollup_summary by default). Returns what was done.
+        """
+        summarize = summarize or rollup_summary
+        now = now or datetime.now(timezone.utc)
+        turn_cutoff = (now - timedelta(days=self.retention_days)).strftime(TIMESTAMP_FORMAT)
+        summary_cutoff = (now - timedelta(days=self.summary_retention_days)).strftime(TIMESTAMP_FORMAT)
+        stats = {"rolled_up": 0, "summaries": 0, "expired": 0, "freed_pages": 0}
+
+        self.flush()
+        with metrics.span("memory_compact") as span:
+            with self._lock:
+                # Turns at or below this id are beyond the newest max_turns
+                row = self._conn.execute(
+                    "SELECT id FROM conversations WHERE kind = 'turn' ORDER BY id DESC LIMIT 1 OFFSET ?",
+                    (self.max_turns,)
+                ).fetchone()
+            id_cutoff = row[0] if row else 0
+
+            for _ in range(max_batches):
+                if should_stop and should_stop():
+                    break
+                with self._lock:
+                    rows = self._conn.execute(
+                        "SELECT id, session_id, user_input, ai_response, timestamp FROM conversations "
+                        "WHERE kind = 'turn' AND (timestamp < ? OR id <= ?) ORDER BY id LIMIT ?",
+                        (turn_cutoff, id_cutoff, self.rollup_size)
+                    ).fetchall()
+                if not rows:
+                    break
+
+                by_session = {}
+                for row in rows:
+                    by_session.setdefault(row[1], []).append(row)
+                # Summarizing can be slow (e.g. an LLM), so it happens outside the lock
+                summaries = []
+                for session_id, turns in by_session.items():
+                    first, last = turns[0][4][:10], turns[-1][4][:10]
+                    header = f"Earlier conversations ({first} to {last}, {len(turns)} exchanges)"
+                    text = summarize([(t[2], t[3]) for t in turns])
+                    summaries.append((header, text, turns[-1][4], session_id))
+
+                with self._lock, self._conn:
+                    self._conn.executemany(
+                        "INSERT INTO conversations (user_input, ai_response, timestamp, session_id, kind) "
+                        "VALUES (?, ?, ?, ?, 'summary')",
+                        summaries
+                    )
+                    self._conn.executemany("DELETE FROM conversations WHERE id = ?", [(r[0],) for r in rows])
+                stats["rolled_up"] += len(rows)
+                stats["summaries"] += len(summaries)
+
+            with self._lock:
+                with self._conn:
+                    stats["expired"] = self._conn.execute(
+                        "DELETE FROM conversations WHERE kind = 'summary' AND timestamp < ?",
+                        (summary_cutoff,)
+                    ).rowcount
+                    if stats["rolled_up"] or stats["expired"]:
+                        # Merge the FTS index segments left behind by the deletes
+                        self._conn.execute("INSERT INTO conversations_fts (conversations_fts) VALUES ('optimize')")
+                stats["freed_pages"] = self._vacuum(vacuum_pages)
+            span.set(**stats)
+        return stats
+
+    def _vacuum(self, pages: int) -> int:
+        """Return up to `pages` free pages to the filesystem (caller holds the lock)"""
+        if self._conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # Databases created before auto_vacuum=INCREMENTAL need one full VACUUM to switch
+            self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            free = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+            self._conn.execute("VACUUM")
+            return free
+        free = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if free:
+            # Each step of the pragma frees one page, so it has to be run to the end
+            self._conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        return min(free, pages)
+
+    def flush(self):
+        """Block until every queued conversation is committed"""
+        with self._pending_cond:
+            while self._pending:
+                self._pending_cond.wait()
+
+    def close(self):
+        if self._closed:
+            return
+        self.flush()
+        with self._pending_cond:
+            self._closed = True
+            self._pending_cond.notify_all()
+        self._writer.join()
+        with self._lock:
+            self._conn.close()
+
+    def _write_loop(self):
+        """Commit queued conversations in batches, one transaction per batch"""
+        while True:
+            with self._pending_cond:
+                while not self._pending and not self._closed:
+                    self._pending_cond.wait()
+                if not self._pending:
+                    return
+                batch = self._pending[:self.batch_size]
+
+            with metrics.span("memory_write", rows=len(batch)), self._lock:
+                try:
+                    with self._conn:
+                        self._conn.executemany(
+                            "INSERT INTO conversations (user_input, ai_response, session_id) "
+                            "VALUES (?, ?, ?)",
+                            batch
+                        )
+                except sqlite3.Error as e:
+                    metrics.count("errors", stage="memory_write", error=type(e).__name__)
+                    print(f"❌ Memory write failed: {e}")
+                # Drop the rows only once they're readable from the table
+                with self._pending_cond:
+                    del self._pending[:len(batch)]
+                    self._pending_cond.notify_all()
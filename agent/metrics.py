@@ -0,0 +1,261 @@
+"""Timing spans and counters for the request path
+
+Off by default, and then every call returns straight away: span() hands
+back one shared no-op object. Turn it on with TED_METRICS=1 to aggregate in
+memory (see render_prometheus), or TED_METRICS=<path> to also write each
+span and counter to a JSONL file, or to SQLite if the path ends in .db.
+"""
+import atexit
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PREFIX = "ted_"
+
+class _NullSpan:
+    """What span() returns while metrics are off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+class Span:
+    """Times a with-block; an exception escaping it is counted under errors"""
+
+    __slots__ = ("_metrics", "name", "attrs", "_started")
+
+    def __init__(self, metrics: "Metrics", name: str, attrs: dict):
+        self._metrics = metrics
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """Attach details learned inside the block (they go to the sink, not to labels)"""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._started
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+            self._metrics.count("errors", stage=self.name, error=exc_type.__name__)
+        self._metrics.observe("span_seconds", duration, span=self.name, attrs=self.attrs)
+        return False
+
+class _Histogram:
+    __slots__ = ("buckets", "sum", "count")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def add(self, value: float):
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class JsonlSink:
+    """Appends one JSON object per line"""
+
+    def __init__(self, path: str):
+        self._file = open(path, "a", buffering=64 * 1024)
+        self._lock = threading.Lock()
+
+    def write(self, event: dict):
+        line = json.dumps(event) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+class SqliteSink:
+    """Buffers events and inserts them into an `events` table batch_size at a time"""
+
+    def __init__(self, path: str, batch_size: int = 256):
+        self.batch_size = batch_size
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS events (
+                ts REAL NOT NULL,
+                kind TEXT NOT NULL,
+                name TEXT NOT NULL,
+                value REAL,
+                attrs TEXT
+            )
+        ''')
+        self._conn.commit()
+        self._rows = []
+        self._lock = threading.Lock()
+
+    def write(self, event: dict):
+        attrs = {k: v for k, v in event.items() if k not in ("ts", "kind", "name", "value")}
+        with self._lock:
+            self._rows.append((event["ts"], event["kind"], event["name"], event["value"], json.dumps(attrs)))
+            if len(self._rows) >= self.batch_size:
+                self._flush()
+
+    def _flush(self):
+        """Caller holds the lock"""
+        if self._rows:
+            with self._conn:
+                self._conn.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?)", self._rows)
+            self._rows = []
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._conn.close()
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def open_sink(path: str):
+    return SqliteSink(path) if path.endswith(".db") else JsonlSink(path)
+
+class Metrics:
+    """Counters and latency histograms keyed by name and labels
+
+    Labels become Prometheus labels, so keep them low-cardinality (stage,
+    kind, model). Span attributes only go to the sinks.
+    """
+
+    def __init__(self, enabled: bool = False, sinks: Optional[list] = None):
+        self.enabled = enabled
+        self.sinks = list(sinks or [])
+        self._counters: Dict[Tuple[str, tuple], float] = {}
+        self._histograms: Dict[Tuple[str, tuple], _Histogram] = {}
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def enable(self, path: Optional[str] = None):
+        """Start collecting; with a path, also write events there (JSONL or .db)"""
+        if path:
+            self.sinks.append(open_sink(path))
+        self.enabled = True
+
+    def span(self, name: str, /, **attrs):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, attrs)
+
+    def count(self, name: str, value: float = 1, /, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._emit("count", name, value, labels)
+
+    def observe(self, name: str, seconds: float, span: Optional[str] = None, attrs: Optional[dict] = None):
+        """Add a duration to a histogram; span, if given, is its only label
+
+        attrs go to the sinks only. They're a dict rather than keyword
+        arguments so any name (even seconds or span) is safe.
+        """
+        if not self.enabled:
+            return
+        attrs = attrs or {}
+        labels = (("span", span),) if span is not None else ()
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[(name, labels)] = _Histogram()
+            histogram.add(seconds)
+        if span is not None:
+            self._emit("span", span, seconds, attrs)
+        else:
+            self._emit("observe", name, seconds, attrs)
+
+    def _emit(self, kind: str, name: str, value: float, attrs: dict):
+        if not self.sinks:
+            return
+        # Attributes can't overwrite the event's own fields
+        event = dict(attrs)
+        event.update(ts=time.time(), kind=kind, name=name, value=value)
+        for sink in self.sinks:
+            sink.write(event)
+
+    def snapshot(self) -> dict:
+        """Counter totals and histogram count/sum, keyed like name{label=value}"""
+        with self._lock:
+            return {
+                "counters": {self._series(name, labels): value
+                             for (name, labels), value in self._counters.items()},
+                "histograms": {self._series(name, labels): {"count": h.count, "sum": h.sum}
+                               for (name, labels), h in self._histograms.items()},
+            }
+
+    def render_prometheus(self) -> str:
+        """Everything collected so far in the Prometheus text exposition format"""
+        lines: List[str] = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                metric = f"{PREFIX}{name}_total"
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{self._series(metric, labels)} {value:g}")
+
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                metric = f"{PREFIX}{name}"
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(BUCKETS + (float("inf"),), histogram.buckets):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{self._series(metric + '_bucket', labels + (('le', le),))} {cumulative}")
+                lines.append(f"{self._series(metric + '_sum', labels)} {histogram.sum:.6f}")
+                lines.append(f"{self._series(metric + '_count', labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _series(name: str, labels: tuple) -> str:
+        if not labels:
+            return name
+        rendered = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+        return f"{name}{{{rendered}}}"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+        self.sinks = []
+
+def _from_env() -> Metrics:
+    setting = os.environ.get("TED_METRICS", "0")
+    metrics = Metrics()
+    if setting not in ("", "0"):
+        metrics.enable(None if setting == "1" else setting)
+    return metrics
+
+# Global metrics instance
+metrics = _from_env()
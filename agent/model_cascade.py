@@ -0,0 +1,84 @@
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+# Requests that need reasoning or writing go straight to the large model
+COMPLEX = re.compile(
+    r"\b(why|explain|compare|draft|write|compose|rewrite|summari[sz]e|plan|analy[sz]e|brainstorm"
+    r"|pros and cons|should i|help me (?:decide|think|figure))\b", re.I
+)
+# ...and these also get more than the usual two sentences
+LONG_FORM = re.compile(r"\b(draft|write|compose|rewrite|brainstorm|pros and cons)\b", re.I)
+
+# A first sentence like this from the small model means it's out of its depth
+HEDGE = re.compile(
+    r"\b(i'?m not sure|i am not sure|i don'?t know|i do not know|i'?m unable|i am unable"
+    r"|i don'?t have (?:enough |any )?(?:information|access|details)|as an ai)\b", re.I
+)
+
+# Room for one sentence in num_predict; the sentence limit normally ends generation first
+TOKENS_PER_SENTENCE = 30
+
+# Ollama stops here: the model has started a new turn or section of its own
+STOP = ("\nUser:", "\nContext:", "\n\n")
+
+class Route(NamedTuple):
+    tier: str
+    model: str
+    max_sentences: int
+    num_predict: int
+    stop: Tuple[str, ...]
+
+class ModelCascade:
+    """Picks the model and generation limits for each turn
+
+    Short, simple turns with little context go to the small model, anything
+    else to the large one. The small model's reply can still be escalated
+    (see hedged). With small=None every turn goes to the large model.
+    """
+
+    def __init__(self, large: str, small: Optional[str] = None,
+                 max_small_words: int = 16, max_small_context_tokens: int = 500,
+                 max_sentences: int = 2, long_form_sentences: int = 5):
+        self.large = large
+        self.small = small
+        self.max_small_words = max_small_words
+        self.max_small_context_tokens = max_small_context_tokens
+        self.max_sentences = max_sentences
+        self.long_form_sentences = long_form_sentences
+
+    @property
+    def models(self) -> List[str]:
+        """Every model a turn may use, the one used most first"""
+        return [m for m in (self.small, self.large) if m]
+
+    def choose(self, prompt: str, context_tokens: int = 0) -> Route:
+        """Route for a turn whose trimmed context comes to context_tokens"""
+        sentences = self.long_form_sentences if LONG_FORM.search(prompt) else self.max_sentences
+        simple = (
+            len(prompt.split()) <= self.max_small_words
+            and not COMPLEX.search(prompt)
+            and context_tokens <= self.max_small_context_tokens
+        )
+        if self.small and simple:
+            return self._route("small", self.small, sentences)
+        return self._route("large", self.large, sentences)
+
+    def escalate(self, route: Route) -> Optional[Route]:
+        """The same turn on the large model, or None if it's already there"""
+        if route.tier == "large":
+            return None
+        return self._route("large", self.large, route.max_sentences)
+
+    def disable_small(self):
+        """The small model isn't available (e.g. not pulled); use the large one from now on"""
+        self.small = None
+
+    @staticmethod
+    def hedged(sentence: str) -> bool:
+        return bool(HEDGE.search(sentence))
+
+    @staticmethod
+    def _route(tier: str, model: str, sentences: int) -> Route:
+        # Long-form replies can have paragraphs, so a blank line doesn't end them
+        stop = STOP if sentences <= 2 else STOP[:2]
+        return Route(tier, model, sentences, sentences * TOKENS_PER_SENTENCE, stop)
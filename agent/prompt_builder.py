@@ -0,0 +1,118 @@
+import re
+from typing import Dict, List, Union
+
+# Per-section token budgets for the dynamic part of the prompt. The user's
+# prompt is never cut: when it runs over its share the context sections give
+# up the difference
+DEFAULT_BUDGETS = {
+    "memory": 300,
+    "calendar": 120,
+    "free_slots": 120,
+    "user": 200,
+}
+
+# How each context section is introduced in the prompt
+SECTION_TITLES = {
+    "memory": "Recent conversations:",
+    "calendar": "Upcoming events:",
+    "free_slots": "Free time (working hours):",
+}
+
+WHITESPACE = re.compile(r'\s+')
+SPACES = re.compile(r'[ \t]+')
+
+def memory_items(chats: List[Dict[str, str]]) -> List[str]:
+    """Memory section items from Memory conversations"""
+    return [f"User: {chat['user']}\nTED: {chat['ai']}" for chat in chats]
+
+def calendar_items(events: List[dict]) -> List[str]:
+    """Calendar section items from Calendar API events"""
+    return [
+        f"- {event['summary']} ({event['start'].get('dateTime', event['start'].get('date'))})"
+        for event in events
+    ]
+
+def free_slot_items(slots: List[tuple], duration_minutes: int, label: str) -> List[str]:
+    """Free-slot section items from FreeSlots.find() (start, end) pairs"""
+    if not slots:
+        return [f"- No free {duration_minutes}-minute slot {label}"]
+
+    def clock(when):
+        return when.strftime("%I:%M %p").lstrip("0")
+
+    return [f"- {start:%a %b} {start.day}, {clock(start)} to {clock(end)}" for start, end in slots]
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English)"""
+    return len(text) // 4 + 1
+
+class PromptBuilder:
+    """Assembles the per-turn prompt so each section stays within its token budget
+
+    Sections are lists of items (one exchange, one event...) in priority order;
+    items that don't fit are dropped from the end, so prompt-eval cost stays
+    flat however much history or calendar there is. A prompt longer than its
+    own budget shrinks the context budgets instead of being cut.
+    """
+
+    def __init__(self, template: str, system_prompt: str, budgets: Dict[str, int] = None):
+        self.template = template
+        self.budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+        # The system prompt never changes, so count it once
+        self.system_tokens = estimate_tokens(system_prompt)
+        self.tokens_saved = 0
+        self.last_stats = {}
+
+    def build(self, prompt: str, sections: Union[str, Dict[str, List[str]]]) -> str:
+        """Return the turn prompt (everything after the system prompt)"""
+        if isinstance(sections, str):
+            sections = {"context": [sections]} if sections else {}
+
+        user = WHITESPACE.sub(' ', prompt).strip()
+        user_tokens = estimate_tokens(user)
+        budgets = self._section_budgets(sections, user_tokens - self.budgets["user"])
+
+        stats = {}
+        blocks = []
+        for name, items in sections.items():
+            kept, used, original = self._fit(items, budgets.get(name))
+            stats[name] = {"tokens": used, "original": original}
+            if kept:
+                title = SECTION_TITLES.get(name)
+                blocks.append("\n".join([title] + kept if title else kept))
+
+        stats["user"] = {"tokens": user_tokens, "original": user_tokens}
+
+        saved = sum(s["original"] - s["tokens"] for s in stats.values())
+        self.tokens_saved += saved
+        self.last_stats = {
+            "sections": stats,
+            "system_tokens": self.system_tokens,
+            "turn_tokens": sum(s["tokens"] for s in stats.values()),
+            "saved_tokens": saved,
+        }
+        return self.template.format(context="\n\n".join(blocks), prompt=user)
+
+    def _section_budgets(self, sections: Dict[str, List[str]], overrun: int) -> Dict[str, int]:
+        """Section budgets, scaled down together to make room for an overrun of the user budget"""
+        budgets = {name: self.budgets[name] for name in sections if name in self.budgets}
+        total = sum(budgets.values())
+        if overrun <= 0 or not total:
+            return budgets
+        scale = max(0, total - overrun) / total
+        return {name: int(budget * scale) for name, budget in budgets.items()}
+
+    @staticmethod
+    def _fit(items: List[str], budget: int):
+        """Keep items, in order, until one doesn't fit the budget"""
+        items = [SPACES.sub(' ', item).strip() for item in items]
+        costs = [estimate_tokens(item) for item in items]
+        kept = []
+        used = 0
+        for item, cost in zip(items, costs):
+            if budget is not None and used + cost > budget:
+                # Later items are lower priority; skipping ahead would keep them over this one
+                break
+            kept.append(item)
+            used += cost
+        return kept, used, sum(costs)
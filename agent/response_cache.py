@@ -0,0 +1,123 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Union
+
+# Commands that change something must always reach the LLM
+STATE_CHANGING = re.compile(
+    r"\b(schedule|create|add|book|cancel|delete|remove|move|reschedule|remind|send|"
+    r"update|mark|complete|invite|accept|decline)\b",
+    re.IGNORECASE
+)
+
+# Sections whose content changes the answer to a repeated question
+FINGERPRINT_SECTIONS = ("calendar", "free_slots")
+
+# Shorter prompts ("yes", "why?", "what about tomorrow?") only mean something
+# next to the conversation before them, so they're never cached...
+MIN_WORDS = 4
+# ...and neither are longer ones that point back at it ("when does it start")
+ANAPHORA = re.compile(r"\b(it|its|that|those|them|they|he|she|him|her|his|else)\b", re.IGNORECASE)
+
+# Keyed without apostrophes, since people type them either way
+CONTRACTIONS = {
+    "whats": "what is", "whens": "when is", "wheres": "where is", "whos": "who is",
+    "hows": "how is", "im": "i am", "todays": "today", "tomorrows": "tomorrow",
+}
+APOSTROPHES = re.compile(r"['\u2019]")
+PUNCTUATION = re.compile(r"[^\w\s]")
+
+class ResponseCache:
+    """TTL + LRU cache of LLM replies keyed on model, prompt and context fingerprint
+
+    A lookup tries the prompt exactly as typed first, then a normalized form
+    (case, punctuation, common contractions), so "What's on my calendar today?"
+    and "whats on my calendar today" share an entry.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (stored_at, response)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    @staticmethod
+    def cacheable(prompt: str) -> bool:
+        return (len(prompt.split()) >= MIN_WORDS
+                and not STATE_CHANGING.search(prompt)
+                and not ANAPHORA.search(prompt))
+
+    @staticmethod
+    def normalize(prompt: str) -> str:
+        text = PUNCTUATION.sub(" ", APOSTROPHES.sub("", prompt.lower()))
+        return " ".join(CONTRACTIONS.get(word, word) for word in text.split())
+
+    @staticmethod
+    def fingerprint(context: Union[str, Dict[str, List[str]]], session_id: str = "") -> str:
+        """Hash of the session and the parts of the context that matter for the answer
+
+        Memory is left out: it changes every turn, and prompts that depend on
+        it aren't cacheable in the first place.
+        """
+        if isinstance(context, str):
+            parts = [context]
+        else:
+            parts = ["\n".join(context.get(name, [])) for name in FINGERPRINT_SECTIONS]
+        relevant = "\n\0".join([session_id] + parts)
+        return hashlib.sha1(relevant.encode("utf-8")).hexdigest()
+
+    def get(self, model: str, prompt: str, fingerprint: str) -> Optional[str]:
+        if not self.cacheable(prompt):
+            with self._lock:
+                self.bypassed += 1
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            for key in ((model, "exact", prompt, fingerprint),
+                        (model, "normalized", self.normalize(prompt), fingerprint)):
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                stored_at, response = entry
+                if now - stored_at > self.ttl:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return response
+            self.misses += 1
+        return None
+
+    def put(self, model: str, prompt: str, fingerprint: str, response: str):
+        if not self.cacheable(prompt):
+            return
+        now = time.monotonic()
+        with self._lock:
+            for key in ((model, "exact", prompt, fingerprint),
+                        (model, "normalized", self.normalize(prompt), fingerprint)):
+                self._entries[key] = (now, response)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
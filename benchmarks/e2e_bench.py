@@ -0,0 +1,198 @@
+"""Where a CLI turn's time goes, stage by stage, against local stand-ins
+
+Run from the repo root: python benchmarks/e2e_bench.py [--repeat 5] [--json out.json]
+Compare against an earlier run: --compare baseline.json [--tolerance 0.2]
+
+Drives TEDCLI.process_command with a StubOllama (configurable token rate and
+prompt latency), a FakeCalendarService and a NullTTS over scripted
+conversations, and reports p50/p95/p99 per stage:
+
+  router        matching the command against the intent rules
+  context       memory + calendar gathering (memory_read and calendar on their own)
+  llm           the whole generate_response call
+  prompt_eval   Ollama's prompt evaluation, as reported by the stub
+  first_token   request sent to first streamed token
+  generation    Ollama's eval_duration for the reply
+  first_audio   turn start to the first sentence handed to TTS, plus --tts-synthesis
+  memory_write  queuing the turn in Memory
+  total         the whole process_command call
+
+Turns the intent router answers skip context gathering and the LLM; the
+fraction of them is reported as "routed". Ollama stages are only sampled on
+turns that reached the LLM and missed the response cache; for those the
+mean tokens generated per turn and the share each model tier took are
+reported too. The small model runs --small-speedup times faster than the
+large one; --no-cascade sends everything to the large model.
+With --compare, stages whose p95 grew by more than --tolerance (and by at
+least --min-delta, so scheduling jitter doesn't count) are listed and
+the exit code is 1.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.llm_manager import LLMManager
+from agent.memory import Memory
+from agent.response_cache import ResponseCache
+from benchmarks.fakes import FakeCalendarService, NullTTS, make_events
+from benchmarks.stub_ollama import StubOllama
+from cli import TEDCLI
+from tools.calendar_tools import CalendarTools
+
+CONVERSATIONS = [
+    ["what's on my calendar today", "when is the budget review", "move on, anything after that?"],
+    ["remind me what we said about the budget", "what about Alex", "thanks"],
+    ["do I have time for lunch", "what's next", "and tomorrow morning?"],
+    ["add a task to send Alex the budget deck", "list my tasks", "when is the deck due?"],
+]
+
+STAGES = ["router", "context", "memory_read", "calendar", "llm", "prompt_eval", "first_token",
+          "generation", "first_audio", "memory_write", "total"]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(samples: dict) -> dict:
+    summary = {}
+    for stage in STAGES:
+        values = samples.get(stage)
+        if not values:
+            continue
+        summary[stage] = {
+            "count": len(values),
+            "p50": statistics.median(values),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+        }
+    return summary
+
+
+def run(args) -> dict:
+    small_model = None if args.no_cascade else "llama3.2:1b"
+    stub = StubOllama(tokens_per_second=args.tokens_per_second, prompt_latency=args.prompt_latency,
+                      model_speeds={"llama3.2:1b": args.tokens_per_second * args.small_speedup}).start()
+    samples = {stage: [] for stage in STAGES}
+    intents = {}
+    tokens = []
+    tiers = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        llm = LLMManager(ollama_url=stub.url, small_model=small_model)
+        if not args.cache:
+            llm.response_cache = ResponseCache(max_entries=0)
+        calendar = CalendarTools(
+            service=FakeCalendarService(make_events(args.events), latency=args.calendar_latency),
+            cache_ttl=args.calendar_ttl
+        )
+        memory = Memory(os.path.join(tmp, "e2e.db"))
+        tts = NullTTS()
+        cli = TEDCLI(llm=llm, calendar=calendar, memory=memory, tts_engine=tts)
+        llm.warm_up()
+
+        turns = [command for _ in range(args.repeat) for conversation in CONVERSATIONS
+                 for command in conversation]
+        for index, command in enumerate(turns):
+            cli.process_command(command, on_token=lambda token: None)
+            if index < args.warmup:
+                continue
+            timings = dict(cli.last_timings)
+            if tts.first_sentence is not None:
+                timings["first_audio"] = tts.first_sentence + args.tts_synthesis
+            if cli.last_intent is not None:
+                intents[cli.last_intent] = intents.get(cli.last_intent, 0) + 1
+            elif not llm.last_stats.get("cached"):
+                for stage in ("prompt_eval", "first_token", "generation"):
+                    if llm.last_stats.get(stage) is not None:
+                        timings[stage] = llm.last_stats[stage]
+                tokens.append(llm.last_stats.get("eval_count", 0))
+                tier = llm.last_stats.get("tier")
+                tiers[tier] = tiers.get(tier, 0) + 1
+            for stage, value in timings.items():
+                if stage in samples:
+                    samples[stage].append(value)
+
+        memory.close()
+    llm.session.close()
+    stub.stop()
+
+    turns = len(samples["total"])
+    return {
+        "config": {key: value for key, value in vars(args).items()
+                   if key not in ("json", "compare", "tolerance", "min_delta")},
+        "turns": turns,
+        "routed": sum(intents.values()) / turns if turns else 0.0,
+        "intents": intents,
+        "tokens_per_turn": statistics.mean(tokens) if tokens else 0.0,
+        "tiers": tiers,
+        "response_cache": llm.response_cache.stats(),
+        "stages": summarize(samples),
+    }
+
+
+def regressions(result: dict, baseline: dict, tolerance: float, min_delta: float) -> list:
+    found = []
+    for stage, current in result["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if not before:
+            continue
+        grown = current["p95"] - before["p95"]
+        if grown > min_delta and current["p95"] > before["p95"] * (1 + tolerance):
+            found.append((stage, before["p95"], current["p95"]))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="times to run the scripted conversations")
+    parser.add_argument("--warmup", type=int, default=1, help="leading turns left out of the results")
+    parser.add_argument("--tokens-per-second", type=float, default=20.0)
+    parser.add_argument("--prompt-latency", type=float, default=0.05)
+    parser.add_argument("--small-speedup", type=float, default=3.0,
+                        help="how many times faster the small model generates")
+    parser.add_argument("--no-cascade", action="store_true", help="send every turn to the large model")
+    parser.add_argument("--calendar-latency", type=float, default=0.1)
+    parser.add_argument("--calendar-ttl", type=float, default=60.0)
+    parser.add_argument("--events", type=int, default=8)
+    parser.add_argument("--tts-synthesis", type=float, default=0.0,
+                        help="seconds added to first_audio for synthesizing the first sentence")
+    parser.add_argument("--cache", action="store_true", help="keep the response cache on")
+    parser.add_argument("--json", help="write the results here")
+    parser.add_argument("--compare", help="an earlier --json result to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--min-delta", type=float, default=0.01,
+                        help="seconds a stage's p95 must grow by to count as a regression")
+    args = parser.parse_args()
+
+    result = run(args)
+
+    print(f"\n{result['turns']} turns at {args.tokens_per_second:g} tok/s, "
+          f"{result['routed']:.0%} answered without the LLM {result['intents']}")
+    print(f"{result['tokens_per_turn']:.1f} tokens generated per LLM turn, by tier {result['tiers']}")
+    print(f"{'stage':<14} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10}")
+    for stage, summary in result["stages"].items():
+        print(f"{stage:<14} {summary['p50'] * 1000:>10.1f} {summary['p95'] * 1000:>10.1f} "
+              f"{summary['p99'] * 1000:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            found = regressions(result, json.load(f), args.tolerance, args.min_delta)
+        for stage, before, after in found:
+            print(f"regression: {stage} p95 {before * 1000:.1f} -> {after * 1000:.1f} ms")
+        if found:
+            sys.exit(1)
+        print(f"no stage regressed by more than {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
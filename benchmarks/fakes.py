@@ -0,0 +1,352 @@
+"""In-process stand-ins for the Google Calendar and Gmail services and the TTS engine
+
+FakeCalendarService is shaped like the Calendar v3 service as CalendarTools
+uses it (events().list with a time window or a syncToken, events().insert/patch,
+freebusy().query, batch requests), with a fixed per-call latency. expire_sync_tokens()
+makes the next incremental list fail with 410 Gone.
+FakeGmailService is shaped like the Gmail v1 service as GmailTools uses it
+(getProfile, messages().list/get, history().list, batch requests) and keeps
+a history of every change, which expire_history() can make too old to sync from.
+NullTTS has NaturalTTS's interface but only records when sentences arrive.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import List, Optional
+
+MEETINGS = ["Project sync", "1:1 with Alex", "Budget review", "Design review",
+            "Standup", "Lunch with Sam", "Hiring panel", "Roadmap planning"]
+
+
+def make_events(count: int, start: Optional[datetime] = None, spacing: timedelta = timedelta(hours=2),
+                duration: timedelta = timedelta(minutes=45)) -> List[dict]:
+    """count timed events, one every `spacing` from start (default: the next hour)"""
+    start = start or datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    events = []
+    for i in range(count):
+        begin = start + i * spacing
+        events.append({
+            'id': f"evt{i}",
+            'status': 'confirmed',
+            'summary': MEETINGS[i % len(MEETINGS)],
+            'start': {'dateTime': begin.isoformat()},
+            'end': {'dateTime': (begin + duration).isoformat()},
+        })
+    return events
+
+
+class _Request:
+    def __init__(self, result, latency: float):
+        self._result = result
+        self._latency = latency
+
+    def execute(self):
+        if self._latency:
+            time.sleep(self._latency)
+        if isinstance(self._result, Exception):
+            raise self._result
+        return self._result
+
+
+def _parse(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+class _Events:
+    def __init__(self, service: "FakeCalendarService"):
+        self._service = service
+
+    def list(self, **params):
+        service = self._service
+        with service.lock:
+            service.calls += 1
+            service.requests.append(params)
+            token = params.get('syncToken')
+            if token is not None:
+                seen = int(token[len("sync"):])
+                if seen < service.oldest_token:
+                    return _Request(FakeHttpError(410), service.latency)
+                # An incremental sync only returns what changed since the token
+                changed = {event['id']: event for seq, event in service.changes if seq > seen}
+                items = list(changed.values())
+            else:
+                time_min = _parse(params['timeMin']) if 'timeMin' in params else None
+                time_max = _parse(params['timeMax']) if 'timeMax' in params else None
+                items = [e for e in service.items
+                         if (time_min is None or _parse(e['end']['dateTime']) > time_min)
+                         and (time_max is None or _parse(e['start']['dateTime']) < time_max)]
+            return _Request({'items': items, 'nextSyncToken': f"sync{service.seq}"}, service.latency)
+
+    def insert(self, calendarId, body):
+        service = self._service
+
+        def run():
+            with service.lock:
+                event = dict(body, id=f"new{service.seq}", status='confirmed')
+                service.items.append(event)
+                service.changed(dict(event))
+                return event
+        return _Call(run, service.latency)
+
+    def patch(self, calendarId, eventId, body):
+        service = self._service
+
+        def run():
+            with service.lock:
+                event = next((e for e in service.items if e['id'] == eventId), None)
+                if event is None:
+                    raise FakeHttpError(404)
+                event.update(body)
+                service.changed(dict(event))
+                return dict(event)
+        return _Call(run, service.latency)
+
+
+class _FreeBusy:
+    def __init__(self, service: "FakeCalendarService"):
+        self._service = service
+
+    def query(self, body: dict):
+        service = self._service
+        time_min = datetime.fromisoformat(body['timeMin'].replace('Z', '+00:00'))
+        time_max = datetime.fromisoformat(body['timeMax'].replace('Z', '+00:00'))
+        with service.lock:
+            service.calls += 1
+            busy = []
+            for event in service.items:
+                start = datetime.fromisoformat(event['start']['dateTime'])
+                end = datetime.fromisoformat(event['end']['dateTime'])
+                if end > time_min and start < time_max and event.get('transparency') != 'transparent':
+                    busy.append({'start': start.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z'),
+                                 'end': end.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')})
+        return _Request({'calendars': {'primary': {'busy': busy}}}, service.latency)
+
+
+class FakeCalendarService:
+    def __init__(self, events: List[dict] = None, latency: float = 0.1):
+        self.items = make_events(8) if events is None else events
+        self.latency = latency
+        self.calls = 0
+        self.requests = []  # params of every events().list
+        self.seq = 0
+        self.changes = []   # (seq, event) for every change, oldest first
+        self.oldest_token = 0
+        self.lock = threading.Lock()
+
+    def events(self):
+        return _Events(self)
+
+    def freebusy(self):
+        return _FreeBusy(self)
+
+    def new_batch_http_request(self, callback):
+        return _Batch(callback)
+
+    def changed(self, event: dict):
+        """Record a change for incremental syncs (caller holds the lock)"""
+        self.seq += 1
+        self.changes.append((self.seq, event))
+
+    def cancel(self, event_id: str):
+        with self.lock:
+            event = next(e for e in self.items if e['id'] == event_id)
+            self.items.remove(event)
+            self.changed(dict(event, status='cancelled'))
+
+    def expire_sync_tokens(self):
+        with self.lock:
+            self.seq += 1
+            self.oldest_token = self.seq
+
+
+class FakeHttpError(Exception):
+    """Shaped like googleapiclient's HttpError where callers look (resp.status)"""
+
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.resp = SimpleNamespace(status=status)
+
+
+class _Call:
+    """A request that runs when executed, so errors surface at execute() like the real client"""
+
+    def __init__(self, func, latency: float = 0.0):
+        self._func = func
+        self._latency = latency
+
+    def execute(self):
+        if self._latency:
+            time.sleep(self._latency)
+        return self._func()
+
+
+class _Batch:
+    def __init__(self, callback):
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, request_id: Optional[str] = None):
+        self._requests.append((request_id or str(len(self._requests)), request))
+
+    def execute(self):
+        for request_id, request in self._requests:
+            try:
+                self._callback(request_id, request.execute(), None)
+            except FakeHttpError as e:
+                self._callback(request_id, None, e)
+
+
+class _GmailMessages:
+    def __init__(self, service: "FakeGmailService"):
+        self._service = service
+
+    def list(self, userId, maxResults=100, pageToken=None, **params):
+        def run():
+            with self._service.lock:
+                self._service.calls["messages.list"] += 1
+                newest_first = sorted(self._service.messages.values(),
+                                      key=lambda m: int(m['internalDate']), reverse=True)
+            start = int(pageToken or 0)
+            page = newest_first[start:start + maxResults]
+            result = {'messages': [{'id': m['id'], 'threadId': m['threadId']} for m in page]}
+            if start + maxResults < len(newest_first):
+                result['nextPageToken'] = str(start + maxResults)
+            return result
+        return _Call(run, self._service.latency)
+
+    def get(self, userId, id, **params):
+        def run():
+            with self._service.lock:
+                self._service.calls["messages.get"] += 1
+                if self._service.failures:
+                    raise FakeHttpError(self._service.failures.pop())
+                message = self._service.messages.get(id)
+                if message is None:
+                    raise FakeHttpError(404)
+                return dict(message, labelIds=list(message['labelIds']))
+        return _Call(run)
+
+
+class _GmailHistory:
+    def __init__(self, service: "FakeGmailService"):
+        self._service = service
+
+    def list(self, userId, startHistoryId, pageToken=None, **params):
+        def run():
+            service = self._service
+            with service.lock:
+                service.calls["history.list"] += 1
+                if int(startHistoryId) < service.oldest_history:
+                    raise FakeHttpError(404)
+                records = [r for r in service.history if int(r['id']) > int(startHistoryId)]
+                start = int(pageToken or 0)
+                result = {'history': records[start:start + service.page_size],
+                          'historyId': str(service.history_id)}
+                if start + service.page_size < len(records):
+                    result['nextPageToken'] = str(start + service.page_size)
+                return result
+        return _Call(run, self._service.latency)
+
+
+class _GmailUsers:
+    def __init__(self, service: "FakeGmailService"):
+        self._service = service
+
+    def getProfile(self, userId):
+        return _Call(lambda: {'historyId': str(self._service.history_id)})
+
+    def messages(self):
+        return _GmailMessages(self._service)
+
+    def history(self):
+        return _GmailHistory(self._service)
+
+
+class FakeGmailService:
+    def __init__(self, latency: float = 0.0, page_size: int = 100):
+        self.messages = {}  # id -> message in format='metadata' shape
+        self.history = []   # history records, oldest first
+        self.history_id = 1000
+        self.oldest_history = self.history_id
+        self.latency = latency
+        self.page_size = page_size
+        self.calls = {"messages.list": 0, "messages.get": 0, "history.list": 0}
+        self.failures = []  # statuses the next messages.get calls fail with
+        self.lock = threading.Lock()
+
+    def users(self):
+        return _GmailUsers(self)
+
+    def new_batch_http_request(self, callback):
+        return _Batch(callback)
+
+    def add_message(self, sender: str, subject: str, snippet: str = "", unread: bool = True) -> str:
+        with self.lock:
+            message_id = f"msg{len(self.messages) + len(self.history)}"
+            self.messages[message_id] = {
+                'id': message_id,
+                'threadId': message_id,
+                'snippet': snippet,
+                'internalDate': str(int(time.time() * 1000) + len(self.history)),
+                'labelIds': ['INBOX'] + (['UNREAD'] if unread else []),
+                'payload': {'headers': [{'name': 'From', 'value': sender},
+                                        {'name': 'Subject', 'value': subject}]},
+            }
+            self._record('messagesAdded', message_id)
+        return message_id
+
+    def mark_read(self, message_id: str):
+        with self.lock:
+            self.messages[message_id]['labelIds'].remove('UNREAD')
+            self._record('labelsRemoved', message_id)
+
+    def delete(self, message_id: str):
+        with self.lock:
+            del self.messages[message_id]
+            self._record('messagesDeleted', message_id)
+
+    def fail_gets(self, status: int, count: int = 1):
+        """Make the next count messages.get calls fail (e.g. 429 rate limiting)"""
+        with self.lock:
+            self.failures.extend([status] * count)
+
+    def expire_history(self):
+        """Drop every history record, as Gmail does after about a week"""
+        with self.lock:
+            self.history = []
+            self.oldest_history = self.history_id
+
+    def _record(self, key: str, message_id: str):
+        self.history_id += 1
+        self.history.append({'id': str(self.history_id), key: [{'message': {'id': message_id}}]})
+
+
+class NullTTS:
+    """Speaks nothing; records when each sentence was handed over since the last stop()"""
+
+    def __init__(self):
+        self.enabled = True
+        self.spoken = []
+        self.turn_started = time.perf_counter()
+        self.first_sentence = None
+
+    def speak(self, text: str, priority: int = 1):
+        if self.first_sentence is None:
+            self.first_sentence = time.perf_counter() - self.turn_started
+        self.spoken.append(text)
+
+    def announce(self, text: str):
+        self.spoken.append(text)
+
+    def wait_until_done(self, timeout: float) -> bool:
+        return True
+
+    def stop(self):
+        # TEDCLI stops TTS at the start of every turn (barge-in), so a turn starts here
+        self.turn_started = time.perf_counter()
+        self.first_sentence = None
+
+    def toggle(self) -> bool:
+        self.enabled = not self.enabled
+        return self.enabled
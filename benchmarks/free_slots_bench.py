@@ -0,0 +1,62 @@
+"""Free-slot lookups against a calendar with thousands of events
+
+Run from the repo root: python benchmarks/free_slots_bench.py [--events 1000 5000 20000]
+
+For each size, a FakeCalendarService is packed with events over the
+FreeSlots horizon. Reports how long fetching and parsing the freebusy
+blocks takes (in-process here, a network round trip in real use), how long
+rebuilding the interval index from them takes, and the p50/p99 of answering
+"when am I free next week for 45 minutes".
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakeCalendarService, make_events
+from tools.calendar_tools import CalendarTools
+from tools.free_slots import FreeSlots
+
+QUESTION = "when am I free next week for 45 minutes"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, nargs="+", default=[1_000, 5_000, 20_000])
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'events':>8} {'fetch (ms)':>11} {'rebuild (ms)':>13} {'p50 (us)':>10} {'p99 (us)':>10}")
+    for count in args.events:
+        horizon = timedelta(days=14)
+        start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        # Spread the events over the horizon, some overlapping, leaving gaps
+        events = make_events(count, start=start, spacing=horizon / count, duration=horizon / count * 0.8)
+        calendar = CalendarTools(service=FakeCalendarService(events, latency=0))
+        free_slots = FreeSlots(calendar, refresh_ttl=3600)
+
+        started = time.perf_counter()
+        busy = calendar.busy(start, start + horizon)
+        fetch = time.perf_counter() - started
+        started = time.perf_counter()
+        free_slots.index.rebuild(busy)
+        rebuild = time.perf_counter() - started
+        free_slots.refresh(force=True)
+
+        samples = []
+        for _ in range(args.queries):
+            started = time.perf_counter()
+            request = free_slots.parse(QUESTION)
+            free_slots.find(request.duration, request.start, request.end)
+            samples.append(time.perf_counter() - started)
+        samples.sort()
+        print(f"{count:>8} {fetch * 1000:>11.1f} {rebuild * 1000:>13.1f} "
+              f"{statistics.median(samples) * 1e6:>10.1f} {samples[int(len(samples) * 0.99) - 1] * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
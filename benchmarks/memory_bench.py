@@ -0,0 +1,76 @@
+"""Per-turn Memory cost as the conversations table grows
+
+Run from the repo root: python benchmarks/memory_bench.py [--sizes 1000 10000 100000]
+
+Each "turn" is what TEDCLI does against Memory: a get_recent_conversations()
+read, a search_conversations() relevance lookup and a save_conversation().
+The cost should stay flat as the table grows.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.memory import Memory
+
+
+TOPICS = (
+    "alex budget review dentist flight tokyo sync project lunch gym report invoice "
+    "standup deploy hiring offsite roadmap taxes dinner mom school pickup launch "
+    "demo interview contract renewal doctor haircut conference slides backlog sprint"
+).split()
+
+
+def fill(memory: Memory, rows: int):
+    """Bulk-insert filler conversations directly, bypassing the writer queue"""
+    def rows_of(n):
+        for i in range(n):
+            a, b = TOPICS[i % len(TOPICS)], TOPICS[(i * 7) % len(TOPICS)]
+            yield (f"what about the {a} with {b}?", f"You've got the {a} at {i % 12 + 1} PM.")
+
+    with memory._lock, memory._conn:
+        memory._conn.executemany(
+            "INSERT INTO conversations (user_input, ai_response) VALUES (?, ?)",
+            rows_of(rows)
+        )
+
+
+def measure(memory: Memory, turns: int):
+    samples = []
+    for i in range(turns):
+        started = time.perf_counter()
+        memory.get_recent_conversations(limit=2)
+        memory.search_conversations(f"when is the {TOPICS[i % len(TOPICS)]} again?")
+        memory.save_conversation(f"bench question {i}", f"bench answer {i}")
+        samples.append(time.perf_counter() - started)
+    memory.flush()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 200_000])
+    parser.add_argument("--turns", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = Memory(os.path.join(tmp, "bench.db"))
+        stored = 0
+        print(f"{'rows':>10} {'p50 (us)':>10} {'p99 (us)':>10}")
+        for size in sorted(args.sizes):
+            fill(memory, size - stored)
+            stored = size
+            samples = sorted(measure(memory, args.turns))
+            stored += args.turns
+            p50 = statistics.median(samples) * 1e6
+            p99 = samples[int(len(samples) * 0.99) - 1] * 1e6
+            print(f"{size:>10} {p50:>10.1f} {p99:>10.1f}")
+        memory.close()
+
+
+if __name__ == "__main__":
+    main()
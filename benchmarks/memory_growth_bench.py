@@ -0,0 +1,105 @@
+"""How the memory database and recall cost grow over months of daily use
+
+Run from the repo root: python benchmarks/memory_growth_bench.py [--days 180] [--no-compact]
+
+Simulates --turns-per-day exchanges a day, each stamped with its simulated
+date, and runs Memory.compact at the end of every day as the idle compactor
+would. Every --report-every days it prints the database size, how many
+turn and summary rows there are, and the p50/p99 of recall() for a few
+typical questions. With --no-compact it shows the unbounded baseline.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.memory import Memory, TIMESTAMP_FORMAT
+
+TOPICS = ["budget review", "the design deck", "Alex's offer", "quarterly planning", "the dentist",
+          "flight to Denver", "hiring panel", "roadmap", "gym schedule", "Sam's birthday",
+          "tax documents", "the standup", "car service", "team offsite", "the launch checklist"]
+QUESTIONS = ["when is {}", "remind me about {}", "what did we decide on {}", "move {} to Friday",
+             "add a note about {}", "who is coming to {}"]
+REPLIES = ["Sure, {} is on Thursday at 2 PM.", "Noted: {} moves to next week.",
+           "Last time you said {} needs a follow-up with Alex.", "{} is sorted, nothing else pending."]
+RECALL_QUERIES = ["what did we say about the budget review", "when is Sam's birthday",
+                  "remind me about the launch checklist", "anything on the team offsite"]
+
+
+def simulate_day(memory: Memory, day: datetime, turns: int, rng: random.Random):
+    rows = []
+    for i in range(turns):
+        topic = rng.choice(TOPICS)
+        when = day + timedelta(hours=8, seconds=i * 12 * 3600 // turns)
+        rows.append((rng.choice(QUESTIONS).format(topic), rng.choice(REPLIES).format(topic).capitalize(),
+                     when.strftime(TIMESTAMP_FORMAT)))
+    # Written directly so each turn carries its simulated date
+    with memory._lock, memory._conn:
+        memory._conn.executemany(
+            "INSERT INTO conversations (user_input, ai_response, timestamp) VALUES (?, ?, ?)", rows
+        )
+
+
+def measure_recall(memory: Memory, rounds: int = 50):
+    samples = []
+    for _ in range(rounds):
+        for query in RECALL_QUERIES:
+            started = time.perf_counter()
+            memory.recall(query)
+            samples.append(time.perf_counter() - started)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def database_size(memory: Memory, path: str) -> int:
+    with memory._lock:
+        memory._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--turns-per-day", type=int, default=40)
+    parser.add_argument("--report-every", type=int, default=30)
+    parser.add_argument("--retention-days", type=int, default=30)
+    parser.add_argument("--max-turns", type=int, default=5000)
+    parser.add_argument("--no-compact", action="store_true", help="never compact (the old behavior)")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=args.days)
+    print(f"{'day':>5} {'size (KB)':>10} {'turns':>7} {'summaries':>10} {'compact (ms)':>13} "
+          f"{'recall p50 (ms)':>16} {'p99 (ms)':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "growth.db")
+        memory = Memory(path, retention_days=args.retention_days, max_turns=args.max_turns)
+        compact_time = 0.0
+        for day_number in range(1, args.days + 1):
+            day = start + timedelta(days=day_number - 1)
+            simulate_day(memory, day, args.turns_per_day, rng)
+            if not args.no_compact:
+                started = time.perf_counter()
+                memory.compact(now=day + timedelta(days=1))
+                compact_time = time.perf_counter() - started
+
+            if day_number % args.report_every == 0 or day_number == args.days:
+                with memory._lock:
+                    kinds = dict(memory._conn.execute(
+                        "SELECT kind, COUNT(*) FROM conversations GROUP BY kind"
+                    ).fetchall())
+                p50, p99 = measure_recall(memory)
+                print(f"{day_number:>5} {database_size(memory, path) / 1024:>10.0f} "
+                      f"{kinds.get('turn', 0):>7} {kinds.get('summary', 0):>10} {compact_time * 1000:>13.1f} "
+                      f"{p50 * 1000:>16.2f} {p99 * 1000:>9.2f}")
+        memory.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Load test for the TED server (main.py) against a stub Ollama
+
+Run from the repo root: python benchmarks/server_load.py --users 32 --turns 5
+
+Starts a StubOllama and the FastAPI app in-process, then has every simulated
+user post --turns commands to /command in its own session. Reports
+throughput, p50/p95/p99 latency and how many requests were turned away by
+backpressure (HTTP 503).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import uvicorn
+
+from agent.llm_manager import LLMManager
+from agent.memory import Memory
+from benchmarks.stub_ollama import StubOllama
+from main import TedServer, create_app
+
+COMMANDS = [
+    "what's next on my calendar",
+    "anything important this afternoon",
+    "remind me what we said about the budget",
+    "do I have time for lunch",
+    "what's on tomorrow",
+]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def user(client: httpx.AsyncClient, index: int, turns: int, latencies: list, statuses: dict):
+    session_id = f"load-{index}"
+    for turn in range(turns):
+        # A unique suffix keeps the response cache out of the measurement
+        command = f"{COMMANDS[(index + turn) % len(COMMANDS)]} ({index}.{turn})"
+        started = time.perf_counter()
+        response = await client.post("/command", json={"session_id": session_id, "command": command})
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - started)
+
+
+async def drive(base_url: str, users: int, turns: int):
+    latencies, statuses = [], {}
+    limits = httpx.Limits(max_connections=users)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(user(client, i, turns, latencies, statuses) for i in range(users)))
+        elapsed = time.perf_counter() - started
+    return latencies, statuses, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument("--max-waiting", type=int, default=64)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    stub = StubOllama(tokens_per_second=args.tokens_per_second).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        ted = TedServer(
+            llm=LLMManager(ollama_url=stub.url),
+            memory=Memory(os.path.join(tmp, "load.db")),
+            calendar=None,
+            max_in_flight=args.max_in_flight,
+            max_waiting=args.max_waiting,
+        )
+        server = uvicorn.Server(uvicorn.Config(create_app(ted), port=args.port, log_level="warning"))
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started:
+            time.sleep(0.05)
+
+        latencies, statuses, elapsed = asyncio.run(
+            drive(f"http://127.0.0.1:{args.port}", args.users, args.turns)
+        )
+        server.should_exit = True
+        ted.memory.close()
+    stub.stop()
+
+    print(f"users={args.users} turns={args.turns} max_in_flight={args.max_in_flight}")
+    print(f"statuses: {statuses}")
+    if latencies:
+        print(f"throughput: {len(latencies) / elapsed:.1f} req/s")
+        print(f"latency p50 {statistics.median(latencies) * 1000:.0f} ms, "
+              f"p95 {percentile(latencies, 95) * 1000:.0f} ms, "
+              f"p99 {percentile(latencies, 99) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
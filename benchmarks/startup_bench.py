@@ -0,0 +1,62 @@
+"""How long cli.py takes from process start to being able to show a prompt
+
+Run from the repo root: python benchmarks/startup_bench.py [--runs 5]
+
+Each run is a fresh interpreter that imports cli and the global NaturalTTS
+(what TEDCLI() picks up by default) and reports the time until the imports
+returned, i.e. until the prompt could be shown, and the time until the TTS
+engine finished loading in the background. Google auth and the Ollama warm-up aren't included.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import cli
+from tools.tts_manager import tts
+prompt_ready = time.perf_counter() - started
+tts.ready.wait({timeout})
+engine_ready = time.perf_counter() - started if tts.ready.is_set() else None
+print(json.dumps({{"prompt_ready": prompt_ready, "engine_ready": engine_ready, "model": tts.model_type}}))
+"""
+
+
+def run_once(timeout: float) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(timeout=timeout)],
+        cwd=REPO_ROOT, capture_output=True, text=True, timeout=timeout + 60
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "probe failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--engine-timeout", type=float, default=300.0,
+                        help="seconds to wait for the TTS engine per run")
+    args = parser.parse_args()
+
+    runs = [run_once(args.engine_timeout) for _ in range(args.runs)]
+    prompt = [r["prompt_ready"] for r in runs]
+    engine = [r["engine_ready"] for r in runs if r["engine_ready"] is not None]
+
+    print(f"import-to-prompt: median {statistics.median(prompt) * 1000:.0f} ms, "
+          f"max {max(prompt) * 1000:.0f} ms over {len(prompt)} runs")
+    if engine:
+        print(f"engine ready:     median {statistics.median(engine):.1f} s "
+              f"(model: {runs[-1]['model']})")
+    else:
+        print("engine ready:     not within the timeout")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""A local stand-in for Ollama's /api/generate with a configurable speed
+
+Run standalone: python benchmarks/stub_ollama.py --port 11434 --tokens-per-second 20
+or start it in-process with StubOllama(...).start().
+
+It speaks the subset of the API TED uses: streamed NDJSON or a single JSON
+reply, a "context" array, and the eval_count / eval_duration style timing
+fields. Prompt evaluation is simulated as prompt_latency plus a per-token
+cost, so smaller prompts really are faster. model_speeds gives some models
+their own token rate; with available_models, any other model gets a 404
+like one that was never pulled.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Small models ramble past the two sentences the system prompt asks for
+DEFAULT_REPLY = ("You have 3 meetings today. Your next one is the project sync at 2 PM. "
+                 "After that you're free until the budget review at 4 PM. "
+                 "Let me know if you'd like me to find time for anything else!")
+
+
+class StubOllama:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, tokens_per_second: float = 20.0,
+                 prompt_latency: float = 0.05, prompt_tokens_per_second: float = 2000.0,
+                 reply: str = DEFAULT_REPLY, model_speeds: dict = None, available_models=None):
+        self.tokens_per_second = tokens_per_second
+        self.model_speeds = dict(model_speeds or {})
+        self.available_models = available_models
+        self.prompt_latency = prompt_latency
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.reply = reply
+        self.requests = 0
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def handle(self):
+                try:
+                    super().handle()
+                except ConnectionResetError:
+                    pass  # A pooled client connection closed while idle
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub._handle(self, body)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://{host}:{self._server.server_address[1]}/api/generate"
+
+    def start(self) -> "StubOllama":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handle(self, handler, body: dict):
+        with self._lock:
+            self.requests += 1
+
+        model = body.get("model")
+        if self.available_models is not None and model not in self.available_models:
+            error = json.dumps({"error": f'model "{model}" not found, try pulling it first'}).encode()
+            self._send(handler, 404, error, "application/json")
+            return
+        tokens_per_second = self.model_speeds.get(model, self.tokens_per_second)
+
+        prompt_tokens = len(body.get("prompt", "")) // 4 + 1
+        prompt_eval = self.prompt_latency + prompt_tokens / self.prompt_tokens_per_second
+        time.sleep(prompt_eval)
+
+        limit = body.get("options", {}).get("num_predict", 150)
+        words = self.reply.split(" ")
+        tokens = [w + " " for w in words[:-1]] + [words[-1]]
+        if limit >= 0:
+            tokens = tokens[:limit]
+        stops = body.get("options", {}).get("stop") or []
+        final = {
+            "model": body.get("model"),
+            "done": True,
+            "context": list(range(prompt_tokens + len(tokens))),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_eval * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": int(len(tokens) / tokens_per_second * 1e9),
+        }
+
+        if not body.get("stream", True):
+            text = self._generate(tokens, stops, tokens_per_second, emit=None)
+            self._send(handler, 200, json.dumps(dict(final, response=text)).encode(), "application/json")
+            return
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/x-ndjson")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+
+        def emit(token):
+            self._chunk(handler, json.dumps({"model": body.get("model"), "response": token, "done": False}))
+
+        try:
+            self._generate(tokens, stops, tokens_per_second, emit)
+            self._chunk(handler, json.dumps(dict(final, response="")))
+            handler.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client stopped reading early
+
+    def _generate(self, tokens, stops, tokens_per_second, emit):
+        text = ""
+        for token in tokens:
+            time.sleep(1.0 / tokens_per_second)
+            if any(stop in text + token for stop in stops):
+                break
+            text += token
+            if emit:
+                emit(token)
+        return text
+
+    @staticmethod
+    def _chunk(handler, line: str):
+        data = (line + "\n").encode()
+        handler.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        handler.wfile.flush()
+
+    @staticmethod
+    def _send(handler, status: int, data: bytes, content_type: str):
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--tokens-per-second", type=float, default=20.0)
+    parser.add_argument("--prompt-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    stub = StubOllama(args.host, args.port, args.tokens_per_second, args.prompt_latency).start()
+    print(f"Stub Ollama listening on {stub.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
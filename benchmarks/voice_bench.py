@@ -0,0 +1,111 @@
+"""End-of-speech to transcript latency for voice input, driven from WAV files
+
+Run from the repo root: python benchmarks/voice_bench.py [--wav a.wav b.wav] [--utterances 5]
+
+Without --wav, speech-like audio is synthesized (bursts of noise for words,
+short gaps between words, longer pauses between phrases, silence between
+utterances). The audio is fed to VoiceListener at microphone pace, with a
+fake transcriber that takes --base-latency plus --real-time-factor times
+the audio length, once with chunked transcription and once transcribing
+whole utterances. Per utterance it reports:
+
+  endpoint    last voiced frame to end of speech confirmed (the silence hangover)
+  transcribe  end of speech to the full transcript
+  to_llm      last voiced frame to the transcript handed to process_command
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import wave
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.voice_input import SAMPLE_RATE, SAMPLE_WIDTH, VoiceListener, wav_frames
+
+STAGES = ["endpoint", "transcribe", "to_llm"]
+
+
+def synthesize(path: str, utterances: int, rng: random.Random):
+    samples = array("h")
+
+    def add(seconds: float, amplitude: int):
+        samples.extend(rng.randint(-amplitude, amplitude) for _ in range(int(seconds * SAMPLE_RATE)))
+
+    add(1.0, 60)
+    for _ in range(utterances):
+        for phrase in range(rng.randint(2, 4)):
+            if phrase:
+                add(rng.uniform(0.25, 0.4), 60)
+            for word in range(rng.randint(3, 6)):
+                if word:
+                    add(rng.uniform(0.06, 0.12), 60)
+                add(rng.uniform(0.18, 0.35), 4000)
+        add(1.5, 60)
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(SAMPLE_WIDTH)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(samples.tobytes())
+
+
+class FakeTranscriber:
+    def __init__(self, base_latency: float, real_time_factor: float):
+        self.base_latency = base_latency
+        self.real_time_factor = real_time_factor
+
+    def __call__(self, pcm: bytes, sample_rate: int) -> str:
+        seconds = len(pcm) / (sample_rate * SAMPLE_WIDTH)
+        time.sleep(self.base_latency + self.real_time_factor * seconds)
+        return " ".join(["word"] * max(1, int(seconds * 2.5)))
+
+
+def run(paths, args, chunked: bool) -> dict:
+    samples = {stage: [] for stage in STAGES}
+    chunks = []
+    for path in paths:
+        listener = VoiceListener(FakeTranscriber(args.base_latency, args.real_time_factor), chunked=chunked)
+        for utterance in listener.utterances(wav_frames(path, realtime=True)):
+            samples["endpoint"].append(utterance.endpointed - utterance.speech_ended)
+            samples["transcribe"].append(utterance.transcribed - utterance.endpointed)
+            samples["to_llm"].append(utterance.transcribed - utterance.speech_ended)
+            chunks.append(utterance.chunks)
+        listener.close()
+    return {"samples": samples, "chunks": chunks}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--wav", nargs="+", help="16 kHz 16-bit mono recordings to use instead of synthesized audio")
+    parser.add_argument("--utterances", type=int, default=5, help="utterances to synthesize")
+    parser.add_argument("--base-latency", type=float, default=0.15, help="seconds per transcription call")
+    parser.add_argument("--real-time-factor", type=float, default=0.3,
+                        help="transcription seconds per second of audio")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = args.wav
+        if not paths:
+            paths = [os.path.join(tmp, "speech.wav")]
+            synthesize(paths[0], args.utterances, random.Random(0))
+
+        print(f"{'mode':<8} {'stage':<11} {'p50 (ms)':>9} {'p95 (ms)':>9}")
+        for mode, chunked in (("chunked", True), ("whole", False)):
+            result = run(paths, args, chunked)
+            for stage in STAGES:
+                values = sorted(result["samples"][stage])
+                if not values:
+                    continue
+                p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+                print(f"{mode:<8} {stage:<11} {statistics.median(values) * 1000:>9.0f} {p95 * 1000:>9.0f}")
+            if result["chunks"]:
+                print(f"{mode:<8} {len(result['chunks'])} utterances, "
+                      f"{statistics.mean(result['chunks']):.1f} chunks each")
+
+
+if __name__ == "__main__":
+    main()
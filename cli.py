@@ -1,72 +1,232 @@
 from agent.llm_manager import LLMManager
+from agent.intent_router import IntentRouter
 from tools.calendar_tools import CalendarTools
-from agent.memory import Memory
-from tools.tts_manager import tts  # Import the global TTS instance
+from agent.memory import IdleCompactor, Memory
+from agent.metrics import metrics
+from agent.prompt_builder import memory_items, calendar_items, free_slot_items
+from tools.free_slots import FreeSlots
+from tools.gmail_tools import GmailTools
 import readline  # For better input handling on Unix systems
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# How long each context source may take before the reply goes ahead without
+# it. The calendar's deadline counts from the start of the turn and covers
+# the router too, so a slow calendar adds 1.5 s at most; memory's counts from
+# when context gathering starts
+MEMORY_TIMEOUT = 0.5
+CALENDAR_TIMEOUT = 1.5
+
+# Longest the goodbye may hold up exiting
+GOODBYE_TIMEOUT = 3.0
 
 class TEDCLI:
-    def __init__(self):
-        self.llm = LLMManager()
-        self.calendar = CalendarTools()
-        self.memory = Memory()
+    def __init__(self, llm: LLMManager = None, calendar: CalendarTools = None,
+                 memory: Memory = None, tts_engine=None, gmail: GmailTools = None):
+        """Any of the parts can be passed in (e.g. stand-ins for benchmarks)
+
+        Without a gmail, mail questions are answered from Gmail only when the
+        calendar is the real Google one (its sign-in covers both).
+        """
+        self.llm = llm or LLMManager()
+        # Load the model and evaluate the system prompt while the user types
+        threading.Thread(target=self.llm.warm_up, daemon=True).start()
+        self.calendar = calendar or CalendarTools()
+        self.free_slots = FreeSlots(self.calendar)
+        self.memory = memory or Memory()
+        self.gmail = gmail or self._default_gmail()
+        if self.gmail is not None:
+            # The first sync is a backfill; get it done before the first mail question
+            threading.Thread(target=self._sync_gmail, daemon=True).start()
+        if tts_engine is None:
+            from tools.tts_manager import tts as tts_engine  # The global TTS instance
+        self.tts = tts_engine
         self.tts_enabled = True
         
+        # Context sources are fetched in parallel. Memory has its own pool, so
+        # calendar reads stuck past their deadline can never hold it up
+        self._context_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ted-context")
+        self._memory_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ted-memory")
+        
+        # Common requests are answered from local data without the LLM, under
+        # the same deadline as calendar context
+        self.router = IntentRouter(self.calendar, self.memory, self.free_slots,
+                                   pool=self._context_pool, timeout=CALENDAR_TIMEOUT, gmail=self.gmail)
+        self.last_intent = None
+        self.last_timings = {}
+        
+        # Old conversations are rolled up while the user isn't typing
+        self.compactor = IdleCompactor(self.memory).start()
+        
         print("🤖 TED 2.0 MVP - Local LLM + Voice")
         print("Commands: 'voice' to toggle TTS, 'quit' to exit")
         print("🔊 Voice: ON\n")
     
-    def process_command(self, command: str) -> str:
+    def _default_gmail(self):
+        client = getattr(self.calendar, 'client', None)
+        if client is None:
+            return None
+        try:
+            return GmailTools(client=client)
+        except Exception as e:
+            print(f"⚠️ Gmail unavailable ({e}); mail questions go to the LLM")
+            return None
+    
+    def _sync_gmail(self):
+        try:
+            self.gmail.sync()
+        except Exception as e:
+            metrics.count("errors", stage="gmail_sync", error=type(e).__name__)
+    
+    def process_command(self, command: str, on_token=None) -> str:
+        """Answer a command; on_token streams the reply as it's generated"""
         # Handle special commands
         if command.lower() in ['voice', 'tts', 'speak']:
-            self.tts_enabled = tts.toggle()
+            self.tts_enabled = self.tts.toggle()
             return f"Voice feedback {'enabled' if self.tts_enabled else 'disabled'}."
         
         if command.lower() in ['quiet', 'mute']:
             self.tts_enabled = False
-            tts.stop()
+            self.tts.stop()
             return "Voice feedback muted."
         
-        # Get recent context
-        recent_chats = self.memory.get_recent_conversations()
-        context = "Recent conversations:\n" + "\n".join(
-            [f"User: {chat['user']}\nTED: {chat['ai']}" for chat in recent_chats]
+        # Barge-in: a new command cuts off whatever TED was still saying
+        self.tts.stop()
+        self.compactor.touch()
+        
+        timings = {}
+        started = time.perf_counter()
+        
+        # The router and the calendar read share one deadline from the start of the turn
+        routed = self._timed(timings, 'router', self.router.route, command,
+                             self._remaining(started, CALENDAR_TIMEOUT))
+        if routed is not None:
+            self.last_intent, response = routed
+            if on_token:
+                on_token(response)
+            if self.tts_enabled:
+                self.tts.speak(response)
+        else:
+            self.last_intent = None
+            context_started = time.perf_counter()
+            context = self._gather_context(command, timings, started)
+            timings['context'] = time.perf_counter() - context_started
+            
+            # Get LLM response, handing each finished sentence to TTS as it streams
+            on_sentence = self.tts.speak if self.tts_enabled else None
+            llm_started = time.perf_counter()
+            response = self.llm.generate_response(
+                command, context, on_token=on_token, on_sentence=on_sentence
+            )
+            timings['llm'] = time.perf_counter() - llm_started
+        
+        # Save to memory; Memory batches the actual write on its own thread
+        self._timed(timings, 'memory_write', self.memory.save_conversation, command, response)
+        
+        timings['total'] = time.perf_counter() - started
+        self.last_timings = timings
+        self.compactor.touch()
+        metrics.observe("turn_seconds", timings['total'], attrs={"source": "cli"})
+        return response
+    
+    def _gather_context(self, command: str, timings: dict, turn_started: float) -> dict:
+        """Fetch recent chats and calendar events in parallel, each with its own deadline
+        
+        The calendar's deadline counts from the start of the turn, so time the
+        router already spent waiting on a slow calendar comes out of it.
+        Free-time questions get the computed free slots instead of the event list.
+        """
+        started = time.perf_counter()
+        memory_future = self._memory_pool.submit(
+            self._timed, timings, 'memory_read', self.memory.recall,
+            command, self.llm.prompt_builder.budgets["memory"]
         )
+        slot_request = self.free_slots.parse(command)
+        if slot_request:
+            calendar_future = self._context_pool.submit(
+                self._timed, timings, 'calendar', self.free_slots.find,
+                slot_request.duration, slot_request.start, slot_request.end
+            )
+        else:
+            calendar_future = self._context_pool.submit(
+                # Waits on a slow sync only until the deadline, then frees its worker
+                self._timed, timings, 'calendar', self.calendar.get_events, 10,
+                self._remaining(turn_started, CALENDAR_TIMEOUT)
+            )
         
-        # Get calendar context
         try:
-            events = self.calendar.get_events(3)
-            events_text = "\n".join([
-                f"- {event['summary']} ({event['start'].get('dateTime', event['start'].get('date'))})"
-                for event in events
-            ])
-            context += f"\n\nUpcoming events:\n{events_text}"
-        except Exception as e:
-            context += f"\n\nCalendar access issue: {str(e)}"
+            recent_chats = memory_future.result(timeout=self._remaining(started, MEMORY_TIMEOUT))
+        except FutureTimeout:
+            metrics.count("fallbacks", kind="memory_timeout")
+            recent_chats = []
+        sections = {"memory": memory_items(recent_chats)}
         
-        # Get LLM response
-        response = self.llm.generate_response(command, context)
-        
-        # Trigger TTS if enabled
-        if self.tts_enabled:
-            tts.speak(response)
+        section = "free_slots" if slot_request else "calendar"
+        try:
+            events = calendar_future.result(timeout=self._remaining(turn_started, CALENDAR_TIMEOUT))
+            if slot_request:
+                sections["free_slots"] = free_slot_items(
+                    events, int(slot_request.duration.total_seconds() // 60), slot_request.label
+                )
+            else:
+                sections["calendar"] = calendar_items(events)
+        except FutureTimeout:
+            metrics.count("fallbacks", kind="calendar_timeout")
+            sections[section] = ["Calendar access issue: timed out"]
+        except Exception as e:
+            metrics.count("errors", stage="calendar", error=type(e).__name__)
+            sections[section] = [f"Calendar access issue: {str(e)}"]
         
-        # Save to memory
-        self.memory.save_conversation(command, response)
+        # The LLM's prompt builder trims each section to its token budget
+        return sections
+    
+    @staticmethod
+    def _remaining(started: float, timeout: float) -> float:
+        return max(0.0, started + timeout - time.perf_counter())
+    
+    @staticmethod
+    def _timed(timings: dict, stage: str, func, *args):
+        """Run func and record how long it took under timings[stage]"""
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            timings[stage] = time.perf_counter() - started
+    
+    def _goodbye(self):
+        """Cut off the reply still being spoken and give the goodbye time to play
         
-        return response
+        The speech threads die with the process, so returning right away
+        would lose it.
+        """
+        self.tts.stop()
+        self.tts.announce("Goodbye!")
+        self.tts.wait_until_done(GOODBYE_TIMEOUT)
     
     def run(self):
         while True:
             try:
                 user_input = input("You: ").strip()
                 if user_input.lower() in ['quit', 'exit', 'bye']:
-                    tts.speak("Goodbye!")
                     print("TED: Goodbye! 👋")
+                    self._goodbye()
                     break
                 
                 if user_input:
-                    response = self.process_command(user_input)
-                    print(f"TED: {response}\n")
+                    streamed = []
+                    
+                    def print_token(token):
+                        if not streamed:
+                            print("TED: ", end="", flush=True)
+                        streamed.append(token)
+                        print(token, end="", flush=True)
+                    
+                    response = self.process_command(user_input, on_token=print_token)
+                    if streamed:
+                        print("\n")
+                    else:
+                        print(f"TED: {response}\n")
             
             except KeyboardInterrupt:
                 print("\nTED: Session ended.")
@@ -74,6 +234,41 @@ class TEDCLI:
             except Exception as e:
                 print(f"TED: Error - {str(e)}\n")
 
+    def listen(self, frames, listener=None):
+        """Voice mode: each utterance in frames is transcribed and answered like typed input"""
+        from tools.voice_input import SpeechRecognitionTranscriber, VoiceListener
+        listener = listener or VoiceListener(SpeechRecognitionTranscriber())
+        print("🎙️ Listening... (Ctrl+C to stop)\n")
+        try:
+            for utterance in listener.utterances(frames):
+                print(f"You: {utterance.text}")
+                if utterance.text.lower().strip(".!? ") in ['quit', 'exit', 'bye']:
+                    print("TED: Goodbye! 👋")
+                    self._goodbye()
+                    break
+                print(f"TED: {self.process_command(utterance.text)}\n")
+        except KeyboardInterrupt:
+            print("\nTED: Session ended.")
+        finally:
+            listener.close()
+
+def _frames_for(source: str):
+    from tools.voice_input import microphone_frames, pipe_frames, wav_frames
+    if source == "mic":
+        return microphone_frames()
+    if source == "-":
+        return pipe_frames()
+    return wav_frames(source, realtime=True)
+
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="TED command line")
+    parser.add_argument("--listen", nargs="?", const="mic", metavar="SOURCE",
+                        help="voice input from the microphone, a WAV file, or - for raw 16 kHz PCM on stdin")
+    args = parser.parse_args()
+    
     cli = TEDCLI()
-    cli.run()
+    if args.listen:
+        cli.listen(_frames_for(args.listen))
+    else:
+        cli.run()
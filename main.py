@@ -0,0 +1,235 @@
+"""TED server: process_command over HTTP, streamed replies over WebSocket
+
+Run with: python main.py [--host 127.0.0.1] [--port 8000]
+Set TED_OLLAMA_URL to point at a different Ollama (or a stub),
+TED_CALENDAR=0 to run without Google Calendar, and TED_METRICS=1 (or a
+.jsonl/.db path) to collect the metrics served at /metrics.
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from agent.llm_manager import LLMManager
+from agent.memory import IdleCompactor, Memory
+from agent.metrics import metrics
+from agent.prompt_builder import memory_items, calendar_items, free_slot_items
+
+# How long each context source may take before the reply goes ahead without it
+MEMORY_TIMEOUT = 0.5
+CALENDAR_TIMEOUT = 1.5
+
+class CommandRequest(BaseModel):
+    command: str
+    session_id: Optional[str] = None
+
+class Overloaded(Exception):
+    """Raised when too many requests are already waiting for a generation slot"""
+
+class TedServer:
+    """Serves many sessions at once over one async Ollama client
+
+    At most max_in_flight generations run concurrently; up to max_waiting more
+    wait for a slot and anything beyond that is rejected (backpressure), so a
+    burst can't pile up unbounded work in front of a CPU-bound model.
+    """
+
+    def __init__(self, llm: LLMManager = None, memory: Memory = None, calendar=None,
+                 max_in_flight: int = 4, max_waiting: int = 32):
+        self.llm = llm or LLMManager(
+            ollama_url=os.environ.get("TED_OLLAMA_URL", "http://localhost:11434/api/generate")
+        )
+        self.memory = memory or Memory()
+        self.calendar = calendar
+        self.free_slots = None
+        if calendar is not None:
+            from tools.free_slots import FreeSlots
+            self.free_slots = FreeSlots(calendar)
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self.waiting = 0
+        self.in_flight = 0
+        self.served = 0
+        self.rejected = 0
+        # Old conversations are rolled up between requests
+        self.compactor = IdleCompactor(self.memory).start()
+
+    async def process_command(self, session_id: str, command: str, on_token=None) -> dict:
+        if self.waiting >= self.max_waiting:
+            self.rejected += 1
+            metrics.count("rejected")
+            raise Overloaded()
+
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        self.compactor.touch()
+        try:
+            timings = {}
+            started = time.perf_counter()
+            sections = await self._gather_context(session_id, command)
+            timings['context'] = time.perf_counter() - started
+
+            llm_started = time.perf_counter()
+            llm_stats = {}
+            response = await self.llm.agenerate_response(command, sections, on_token=on_token,
+                                                         session_id=session_id, stats=llm_stats)
+            timings['llm'] = time.perf_counter() - llm_started
+
+            # Memory batches the actual write on its own thread
+            self.memory.save_conversation(command, response, session_id=session_id)
+            timings['total'] = time.perf_counter() - started
+            metrics.observe("turn_seconds", timings['total'], attrs={"source": "server"})
+            self.served += 1
+            return {"session_id": session_id, "response": response, "timings": timings,
+                    "model": llm_stats.get("model"), "escalated": llm_stats.get("escalated", False)}
+        finally:
+            self.in_flight -= 1
+            self.compactor.touch()
+            self._slots.release()
+
+    async def _gather_context(self, session_id: str, command: str) -> dict:
+        """Fetch memory and calendar context in parallel, each with its own deadline"""
+        budget = self.llm.prompt_builder.budgets["memory"]
+        memory_read = asyncio.wait_for(
+            asyncio.to_thread(self.memory.recall, command, budget, session_id),
+            MEMORY_TIMEOUT
+        )
+        reads = [memory_read]
+        slot_request = None
+        if self.calendar is not None:
+            # Free-time questions get the computed free slots instead of the event list
+            slot_request = self.free_slots.parse(command)
+            if slot_request:
+                calendar_read = asyncio.to_thread(
+                    self.free_slots.find, slot_request.duration, slot_request.start, slot_request.end
+                )
+            else:
+                calendar_read = asyncio.to_thread(self.calendar.get_events, 10)
+            reads.append(asyncio.wait_for(calendar_read, CALENDAR_TIMEOUT))
+        chats, *events = await asyncio.gather(*reads, return_exceptions=True)
+
+        if isinstance(chats, asyncio.TimeoutError):
+            metrics.count("fallbacks", kind="memory_timeout")
+        elif isinstance(chats, Exception):
+            metrics.count("errors", stage="memory_read", error=type(chats).__name__)
+        sections = {"memory": memory_items(chats) if isinstance(chats, list) else []}
+        if not events:
+            return sections
+        events = events[0]
+        if isinstance(events, asyncio.TimeoutError):
+            metrics.count("fallbacks", kind="calendar_timeout")
+            sections["calendar"] = ["Calendar access issue: timed out"]
+        elif isinstance(events, Exception):
+            metrics.count("errors", stage="calendar", error=type(events).__name__)
+            sections["calendar"] = [f"Calendar access issue: {str(events)}"]
+        elif slot_request:
+            sections["free_slots"] = free_slot_items(
+                events, int(slot_request.duration.total_seconds() // 60), slot_request.label
+            )
+        else:
+            sections["calendar"] = calendar_items(events)
+        return sections
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "served": self.served,
+            "rejected": self.rejected,
+            "response_cache": self.llm.response_cache.stats(),
+        }
+
+def _default_calendar():
+    if os.environ.get("TED_CALENDAR", "1") == "0":
+        return None
+    try:
+        from tools.calendar_tools import CalendarTools
+        return CalendarTools()
+    except Exception as e:
+        print(f"⚠️ Calendar unavailable, serving without it: {e}")
+        return None
+
+def create_app(server: TedServer = None) -> FastAPI:
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if app.state.ted is None:
+            app.state.ted = TedServer(calendar=_default_calendar())
+        # Preload the models and their system-prompt contexts before the first request
+        await asyncio.to_thread(app.state.ted.llm.warm_up)
+        yield
+        await app.state.ted.llm.aclose()
+
+    app = FastAPI(title="TED", lifespan=lifespan)
+    app.state.ted = server
+
+    @app.post("/sessions")
+    async def new_session():
+        return {"session_id": uuid.uuid4().hex}
+
+    @app.post("/command")
+    async def command(request: CommandRequest):
+        session_id = request.session_id or uuid.uuid4().hex
+        try:
+            return await app.state.ted.process_command(session_id, request.command)
+        except Overloaded:
+            raise HTTPException(status_code=503, detail="TED is busy, try again shortly",
+                                headers={"Retry-After": "1"})
+
+    @app.websocket("/ws/{session_id}")
+    async def stream(websocket: WebSocket, session_id: str):
+        """Each text message is a command; the reply streams back as token events"""
+        await websocket.accept()
+
+        async def send_token(token: str):
+            await websocket.send_json({"type": "token", "text": token})
+
+        try:
+            while True:
+                command = (await websocket.receive_text()).strip()
+                if not command:
+                    continue
+                try:
+                    result = await app.state.ted.process_command(session_id, command, on_token=send_token)
+                except Overloaded:
+                    await websocket.send_json({"type": "error", "error": "busy"})
+                    continue
+                await websocket.send_json({"type": "done", **result})
+        except WebSocketDisconnect:
+            pass
+
+    @app.get("/health")
+    async def health():
+        return app.state.ted.stats()
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def prometheus():
+        """Prometheus text format; empty unless metrics are enabled"""
+        return PlainTextResponse(metrics.render_prometheus(),
+                                 media_type="text/plain; version=0.0.4")
+
+    return app
+
+app = create_app()
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the TED server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
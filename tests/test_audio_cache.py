@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+
+from tools.audio_cache import AudioCache
+
+
+class AudioCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp.name, "tts_cache")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def cache(self, **budgets):
+        return AudioCache(cache_dir=self.cache_dir, **budgets)
+
+    def on_disk(self, key):
+        return os.path.exists(os.path.join(self.cache_dir, f"{key}.wav"))
+
+    def age(self, key, mtime):
+        path = os.path.join(self.cache_dir, f"{key}.wav")
+        os.utime(path, (mtime, mtime))
+
+    def test_key_depends_on_voice_and_model(self):
+        key = AudioCache.key("vits", "p225", "Hello.")
+        self.assertEqual(key, AudioCache.key("vits", "p225", "Hello."))
+        self.assertNotEqual(key, AudioCache.key("vits", "p226", "Hello."))
+        self.assertNotEqual(key, AudioCache.key("tacotron", "p225", "Hello."))
+
+    def test_memory_tier_evicts_least_recently_used_over_budget(self):
+        cache = self.cache(max_memory_bytes=10)
+        cache.put("a", b"aaaa")
+        cache.put("b", b"bbbb")
+        cache.get("a")  # a is now the most recent
+        cache.put("c", b"cccc")
+        self.assertEqual(cache.stats()["memory_bytes"], 8)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+        self.assertEqual(cache.get("a"), b"aaaa")
+        self.assertEqual(cache.get("c"), b"cccc")
+        self.assertEqual(cache.stats()["memory_hits"], 3)
+        # b only survives on disk
+        self.assertEqual(cache.get("b"), b"bbbb")
+        self.assertEqual(cache.stats()["disk_hits"], 1)
+
+    def test_entry_bigger_than_the_memory_budget_goes_to_disk_only(self):
+        cache = self.cache(max_memory_bytes=4)
+        cache.put("small", b"ss")
+        cache.put("big", b"bbbbbbbb")
+        self.assertEqual(cache.stats()["memory_bytes"], 2)
+        self.assertEqual(cache.stats()["evictions"], 0)
+        self.assertEqual(cache.get("big"), b"bbbbbbbb")
+        self.assertEqual(cache.stats()["disk_hits"], 1)
+        self.assertEqual(cache.get("small"), b"ss")
+        self.assertEqual(cache.stats()["memory_hits"], 1)
+
+    def test_disk_hit_is_promoted_to_memory(self):
+        self.cache().put("hello", b"RIFF....WAVE")
+        # A fresh cache (e.g. after a restart) starts with an empty memory tier
+        cache = self.cache()
+        self.assertEqual(cache.stats()["disk_bytes"], 12)
+        self.assertEqual(cache.get("hello"), b"RIFF....WAVE")
+        self.assertEqual(cache.get("hello"), b"RIFF....WAVE")
+        stats = cache.stats()
+        self.assertEqual((stats["disk_hits"], stats["memory_hits"]), (1, 1))
+        self.assertEqual(stats["memory_bytes"], 12)
+
+    def test_disk_tier_evicts_least_recently_used_files(self):
+        cache = self.cache(max_memory_bytes=0, max_disk_bytes=10)
+        cache.put("a", b"aaaa")
+        cache.put("b", b"bbbb")
+        self.age("a", 1000)
+        self.age("b", 2000)
+        # Reading a refreshes its mtime, so b is now the oldest
+        self.assertEqual(cache.get("a"), b"aaaa")
+        cache.put("c", b"cccc")
+
+        self.assertTrue(self.on_disk("a"))
+        self.assertFalse(self.on_disk("b"))
+        self.assertTrue(self.on_disk("c"))
+        stats = cache.stats()
+        self.assertEqual((stats["disk_bytes"], stats["evictions"]), (8, 1))
+        self.assertIsNone(cache.get("b"))
+
+    def test_stats_count_hits_and_misses(self):
+        cache = self.cache()
+        self.assertEqual(cache.stats()["hit_rate"], 0.0)
+        self.assertIsNone(cache.get("missing"))
+        cache.put("a", b"aa")
+        cache.get("a")
+        cache.get("a")
+        stats = cache.stats()
+        self.assertEqual((stats["memory_hits"], stats["disk_hits"], stats["misses"]), (2, 0, 1))
+        self.assertAlmostEqual(stats["hit_rate"], 2 / 3)
+        self.assertEqual(stats["disk_bytes"], 2)
+
+    def test_putting_an_existing_key_doesnt_recount_disk_bytes(self):
+        cache = self.cache()
+        cache.put("a", b"aaaa")
+        cache.put("a", b"aaaa")
+        stats = cache.stats()
+        self.assertEqual((stats["memory_bytes"], stats["disk_bytes"]), (4, 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.fakes import FakeCalendarService, FakeHttpError, make_events
+from tools.calendar_tools import CalendarTools
+
+
+class CalendarCacheTest(unittest.TestCase):
+    def test_concurrent_readers_share_one_sync(self):
+        service = FakeCalendarService(latency=0.2)
+        calendar = CalendarTools(service=service)
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            results = list(pool.map(lambda _: calendar.get_events(3), range(5)))
+        self.assertEqual(service.calls, 1)
+        self.assertTrue(all(len(events) == 3 for events in results))
+
+    def test_fresh_cache_skips_the_api(self):
+        service = FakeCalendarService(latency=0)
+        calendar = CalendarTools(service=service)
+        calendar.get_events()
+        calendar.get_events()
+        self.assertEqual(service.calls, 1)
+        calendar.invalidate()
+        calendar.get_events()
+        self.assertEqual(service.calls, 2)
+
+    def test_reader_gives_up_on_a_slow_sync_at_its_deadline(self):
+        service = FakeCalendarService(latency=0.5)
+        calendar = CalendarTools(service=service)
+        started = time.perf_counter()
+        with self.assertRaises(FutureTimeout):
+            calendar.get_events(3, timeout=0.05)
+        self.assertLess(time.perf_counter() - started, 0.3)
+        # The sync carried on; the next reader joins it rather than starting another
+        self.assertEqual(len(calendar.get_events(3)), 3)
+        self.assertEqual(service.calls, 1)
+
+
+class CalendarSyncTest(unittest.TestCase):
+    def setUp(self):
+        self.service = FakeCalendarService(make_events(3), latency=0)
+        # One event well past the sync window
+        far = datetime.now(timezone.utc) + timedelta(days=200)
+        self.service.items += make_events(1, start=far)
+        self.service.items[-1]['id'] = "far"
+        self.calendar = CalendarTools(service=self.service)
+
+    def ids(self):
+        return [e['id'] for e in self.calendar.get_events(10)]
+
+    def test_full_sync_is_windowed_and_incremental_sync_is_not(self):
+        self.assertEqual(self.ids(), ["evt0", "evt1", "evt2"])
+        self.calendar.invalidate()
+        self.calendar.get_events()
+        full, incremental = self.service.requests
+        self.assertIn('timeMin', full)
+        self.assertIn('timeMax', full)
+        self.assertEqual(set(incremental) - set(full), {'syncToken'})
+        self.assertEqual(set(full) - set(incremental), {'timeMin', 'timeMax'})
+
+    def test_create_event_shows_up_on_the_next_read(self):
+        self.ids()
+        start = datetime.now(timezone.utc) + timedelta(hours=10)
+        created = self.calendar.create_event("Coffee", start.isoformat(),
+                                             (start + timedelta(minutes=15)).isoformat())
+        self.assertEqual(self.ids(), ["evt0", "evt1", "evt2", created['id']])
+        self.assertIn('syncToken', self.service.requests[-1])
+
+    def test_cancelled_events_drop_out(self):
+        self.ids()
+        self.service.cancel("evt1")
+        self.calendar.invalidate()
+        self.assertEqual(self.ids(), ["evt0", "evt2"])
+
+    def test_expired_sync_token_falls_back_to_full_sync(self):
+        self.ids()
+        self.service.cancel("evt0")
+        self.service.expire_sync_tokens()
+        self.calendar.invalidate()
+        self.assertEqual(self.ids(), ["evt1", "evt2"])
+        gone, full = self.service.requests[-2:]
+        self.assertIn('syncToken', gone)
+        self.assertIn('timeMin', full)
+        # The new token works
+        self.calendar.invalidate()
+        self.ids()
+        self.assertIn('syncToken', self.service.requests[-1])
+        self.assertEqual(len(self.service.requests), 4)
+
+    def test_batched_writes_report_per_event_and_invalidate(self):
+        self.ids()
+        start = datetime.now(timezone.utc) + timedelta(hours=10)
+        bodies = [CalendarTools.event_body(f"Focus {i}", (start + timedelta(hours=i)).isoformat(),
+                                           (start + timedelta(hours=i, minutes=30)).isoformat())
+                  for i in range(2)]
+        created = self.calendar.create_events(bodies)
+        self.assertEqual([e['summary'] for e in created], ["Focus 0", "Focus 1"])
+        self.assertEqual(self.ids()[-2:], [e['id'] for e in created])
+
+        results = self.calendar.update_events([{'id': created[0]['id'], 'summary': "Deep work"},
+                                               {'id': "missing", 'summary': "Nope"}])
+        self.assertEqual(results[0]['summary'], "Deep work")
+        self.assertIsInstance(results[1], FakeHttpError)
+        summaries = {e['id']: e['summary'] for e in self.calendar.get_events(10)}
+        self.assertEqual(summaries[created[0]['id']], "Deep work")
+
+
+if __name__ == "__main__":
+    unittest.main()
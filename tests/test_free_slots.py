@@ -0,0 +1,111 @@
+import unittest
+from datetime import datetime, timedelta, time as clock
+
+from benchmarks.fakes import FakeCalendarService
+from tools.calendar_tools import CalendarTools
+from tools.free_slots import FreeSlots, IntervalIndex
+
+DAY = datetime(2030, 1, 7).astimezone()
+
+
+def event(start: datetime, end: datetime) -> dict:
+    return {'id': f"e{start.timestamp():.0f}", 'status': 'confirmed', 'summary': "Busy",
+            'start': {'dateTime': start.isoformat()}, 'end': {'dateTime': end.isoformat()}}
+
+
+def hours(day: datetime, start: float, end: float):
+    return (day + timedelta(hours=start), day + timedelta(hours=end))
+
+
+class IntervalIndexTest(unittest.TestCase):
+    def test_add_merges_overlapping_and_touching(self):
+        index = IntervalIndex([hours(DAY, 9, 10)])
+        index.add(*hours(DAY, 12, 13))
+        index.add(*hours(DAY, 10, 11))      # touches the first
+        index.add(*hours(DAY, 10.5, 12.5))  # bridges both
+        index.add(*hours(DAY, 15, 15))      # empty: ignored
+        self.assertEqual(len(index), 1)
+        self.assertEqual((index.starts[0], index.ends[0]),
+                         tuple(t.timestamp() for t in hours(DAY, 9, 13)))
+
+    def test_gaps_within_a_window(self):
+        index = IntervalIndex([hours(DAY, 9, 10), hours(DAY, 11, 12)])
+        gaps = index.gaps(*hours(DAY, 9.5, 14))
+        expected = [hours(DAY, 10, 11), hours(DAY, 12, 14)]
+        self.assertEqual(gaps, [(s.timestamp(), e.timestamp()) for s, e in expected])
+
+
+class FreeSlotsFindTest(unittest.TestCase):
+    def setUp(self):
+        self.service = FakeCalendarService([], latency=0)
+        self.slots = FreeSlots(CalendarTools(service=self.service), horizon_days=400)
+        # A Wednesday at least a week out, at local midnight
+        today = datetime.now(self.slots.tz).date()
+        wednesday = today + timedelta(days=7 + (2 - today.weekday()) % 7)
+        self.day = datetime.combine(wednesday, clock(0), self.slots.tz)
+
+    def find(self, minutes: int, day: datetime):
+        self.slots.refresh(force=True)
+        return self.slots.find(timedelta(minutes=minutes), day, day + timedelta(days=1))
+
+    def local(self, start: float, end: float, day: datetime = None):
+        day = day or self.day
+        return tuple(datetime.combine(day.date(), clock(int(h), int(h % 1 * 60)), self.slots.tz)
+                     for h in (start, end))
+
+    def test_working_hours_merging_and_step_rounding(self):
+        self.service.items = [event(*self.local(8, 10)), event(*self.local(9.5, 11 + 10 / 60)),
+                              event(*self.local(13, 13 + 50 / 60))]
+        self.assertEqual(self.find(60, self.day), [self.local(11.25, 13), self.local(14, 17)])
+
+    def test_too_short_gaps_are_skipped(self):
+        self.service.items = [event(*self.local(9, 12)), event(*self.local(12.5, 17))]
+        self.assertEqual(self.find(45, self.day), [])
+        self.assertEqual(self.find(30, self.day), [self.local(12, 12.5)])
+
+    def test_working_hours_follow_a_dst_change(self):
+        # The first weekday after the next change of UTC offset
+        day = datetime.combine(datetime.now(self.slots.tz).date(), clock(12), self.slots.tz)
+        offset = day.utcoffset()
+        while day.utcoffset() == offset:
+            day += timedelta(days=1)
+        while day.weekday() not in self.slots.workdays:
+            day += timedelta(days=1)
+        midnight = datetime.combine(day.date(), clock(0), self.slots.tz)
+        [(start, end)] = self.find(60, midnight)
+        self.assertEqual((start.hour, end.hour), (9, 17))
+        self.assertEqual(start.utcoffset(), day.utcoffset())
+        self.assertEqual(end - start, timedelta(hours=8))
+
+
+class FreeSlotsParseTest(unittest.TestCase):
+    def setUp(self):
+        self.slots = FreeSlots(calendar=None)
+
+    def at(self, *args):
+        return datetime(*args, tzinfo=self.slots.tz)
+
+    def test_durations(self):
+        now = self.at(2026, 10, 14, 10)
+        for text, minutes in [("am i free for 45 minutes", 45), ("do i have time for an hour", 60),
+                              ("free for 1.5 hours", 90), ("am i free tomorrow", 30)]:
+            with self.subTest(text=text):
+                self.assertEqual(self.slots.parse(text, now).duration, timedelta(minutes=minutes))
+
+    def test_this_week_midweek(self):
+        request = self.slots.parse("when am i free this week", self.at(2026, 10, 14, 10))
+        self.assertEqual((request.end, request.label), (self.at(2026, 10, 19), "this week"))
+
+    def test_this_week_at_the_weekend_means_the_coming_one(self):
+        for now in [self.at(2026, 10, 18, 10), self.at(2026, 10, 17, 9), self.at(2026, 10, 16, 18)]:
+            with self.subTest(now=now):
+                request = self.slots.parse("when am i free this week", now)
+                self.assertEqual((request.start, request.end, request.label),
+                                 (self.at(2026, 10, 19), self.at(2026, 10, 26), "next week"))
+
+    def test_not_a_free_time_question(self):
+        self.assertIsNone(self.slots.parse("what's on my calendar", self.at(2026, 10, 14, 10)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+
+from agent.intent_router import IntentRouter
+from benchmarks.fakes import FakeGmailService, FakeHttpError
+from tools.gmail_tools import GmailTools
+
+
+class GmailToolsTest(unittest.TestCase):
+    def setUp(self):
+        self.service = FakeGmailService(page_size=2)
+        self.budget = self.service.add_message("Alex Kim <alex@example.com>", "Budget deck", "Numbers for Q3")
+        self.lunch = self.service.add_message("Sam <sam@example.com>", "Lunch?", "Thursday works")
+        self.service.add_message("News <news@example.com>", "Weekly digest", unread=False)
+        self.gmail = GmailTools(service=self.service, db_path=":memory:", sync_ttl=0)
+
+    def subjects(self, messages):
+        return [m["subject"] for m in messages]
+
+    def test_backfill_indexes_newest_messages(self):
+        self.assertEqual(self.subjects(self.gmail.unread()), ["Lunch?", "Budget deck"])
+        self.assertEqual(self.service.calls["messages.list"], 1)
+        self.assertEqual(self.service.calls["history.list"], 0)
+        self.assertEqual(self.subjects(self.gmail.unread_from("alex")), ["Budget deck"])
+        self.assertEqual(self.subjects(self.gmail.search("q3 numbers")), ["Budget deck"])
+
+    def test_history_applies_only_the_changes(self):
+        self.gmail.sync()
+        gets = self.service.calls["messages.get"]
+        self.service.mark_read(self.budget)
+        self.service.delete(self.lunch)
+        self.service.add_message("Alex Kim <alex@example.com>", "Offsite agenda")
+
+        self.assertEqual(self.subjects(self.gmail.unread()), ["Offsite agenda"])
+        self.assertEqual(self.service.calls["messages.list"], 1)
+        # Pages through all three records, then fetches the two that changed and still exist
+        self.assertEqual(self.service.calls["history.list"], 2)
+        self.assertEqual(self.service.calls["messages.get"] - gets, 2)
+        self.assertEqual(self.gmail.search("lunch"), [])
+
+    def test_expired_history_falls_back_to_backfill(self):
+        self.gmail.sync()
+        self.service.add_message("Sam <sam@example.com>", "Re: Lunch?")
+        self.service.expire_history()
+
+        self.assertEqual(self.subjects(self.gmail.unread_from("sam")), ["Re: Lunch?", "Lunch?"])
+        self.assertEqual(self.service.calls["messages.list"], 2)
+        # The new baseline works for the next sync
+        self.service.mark_read(self.lunch)
+        self.assertEqual(self.subjects(self.gmail.unread_from("sam")), ["Re: Lunch?"])
+        self.assertEqual(self.service.calls["messages.list"], 2)
+
+    def test_rate_limited_fetch_is_retried_on_the_next_sync(self):
+        self.gmail.sync()
+        self.service.add_message("Sam <sam@example.com>", "Re: Lunch?")
+        self.service.fail_gets(429)
+        with self.assertRaises(FakeHttpError):
+            self.gmail.sync()
+        # The historyId didn't move past the message, so the next sync picks it up
+        self.assertEqual(self.subjects(self.gmail.unread_from("sam")), ["Re: Lunch?", "Lunch?"])
+
+
+class MailIntentTest(unittest.TestCase):
+    def setUp(self):
+        service = FakeGmailService()
+        service.add_message("Alex Kim <alex@example.com>", "Budget deck", "Numbers for Q3")
+        service.add_message("Sam <sam@example.com>", "Lunch?")
+        self.router = IntentRouter(calendar=None, memory=None,
+                                   gmail=GmailTools(service=service, db_path=":memory:"))
+
+    def test_unread(self):
+        self.assertEqual(self.router.route("Do I have any unread email?"),
+                         ("unread_mail", 'You\'ve got 2 unread: "Lunch?" from Sam and "Budget deck" from Alex Kim.'))
+        self.assertEqual(self.router.route("any new mail from Alex"),
+                         ("unread_mail", 'You\'ve got 1 unread from Alex: "Budget deck".'))
+        self.assertEqual(self.router.route("unread from Jordan"),
+                         ("unread_mail", "No unread email from Jordan."))
+
+    def test_mail_about(self):
+        intent, reply = self.router.route("emails about the budget")
+        self.assertEqual(intent, "mail_about")
+        self.assertTrue(reply.startswith('Latest on budget: "Budget deck" from Alex Kim today'))
+
+    def test_without_gmail_falls_through(self):
+        router = IntentRouter(calendar=None, memory=None)
+        self.assertIsNone(router.route("any unread email"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+
+from google.oauth2.credentials import Credentials
+
+from agent.google_client import GoogleClient
+
+
+class FakeCreds:
+    def __init__(self, expires_in: timedelta, refresh_token="refresh"):
+        self.expiry = datetime.utcnow() + expires_in
+        self.refresh_token = refresh_token
+        self.refreshes = 0
+
+    @property
+    def valid(self):
+        return self.expiry > datetime.utcnow()
+
+    def refresh(self, request):
+        self.refreshes += 1
+        self.expiry = datetime.utcnow() + timedelta(hours=1)
+
+    def to_json(self):
+        return "{}"
+
+
+class EnsureFreshTest(unittest.TestCase):
+    def client(self, creds):
+        client = GoogleClient(creds=creds)
+        client.token_file = os.path.join(tempfile.mkdtemp(), "token.json")
+        return client
+
+    def test_token_with_time_left_is_kept(self):
+        creds = FakeCreds(timedelta(minutes=30))
+        self.client(creds).ensure_fresh()
+        self.assertEqual(creds.refreshes, 0)
+
+    def test_token_about_to_expire_is_refreshed_and_saved(self):
+        creds = FakeCreds(timedelta(minutes=2))
+        client = self.client(creds)
+        client.ensure_fresh()
+        self.assertEqual(creds.refreshes, 1)
+        self.assertTrue(os.path.exists(client.token_file))
+
+    def test_without_refresh_token_nothing_happens(self):
+        creds = FakeCreds(timedelta(minutes=-1), refresh_token=None)
+        self.client(creds).ensure_fresh()
+        self.assertEqual(creds.refreshes, 0)
+
+
+class ServiceTest(unittest.TestCase):
+    def setUp(self):
+        creds = Credentials(token="token", expiry=datetime.utcnow() + timedelta(hours=1))
+        self.client = GoogleClient(creds=creds)
+
+    def test_service_is_built_once(self):
+        self.assertIs(self.client.get_calendar_service(), self.client.get_calendar_service())
+
+    def test_each_thread_sends_on_its_own_connection(self):
+        service = self.client.get_calendar_service()
+        mine = service.events().list(calendarId='primary').http
+        self.assertIs(service.events().list(calendarId='primary').http, mine)
+        theirs = []
+        thread = threading.Thread(target=lambda: theirs.append(service.events().list(calendarId='primary').http))
+        thread.start()
+        thread.join()
+        self.assertIsNot(theirs[0], mine)
+        self.assertIs(mine.credentials, theirs[0].credentials)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from agent.intent_router import FREE_TIME, IntentRouter
+
+
+class SlowCalendar:
+    def __init__(self, delay):
+        self.delay = delay
+
+    def get_events(self, max_results=10):
+        time.sleep(self.delay)
+        return []
+
+
+class SlowMemory:
+    def __init__(self, delay):
+        self.delay = delay
+        self.tasks = []
+
+    def add_task(self, description):
+        time.sleep(self.delay)
+        self.tasks.append(description)
+
+
+class FreeTimePatternTest(unittest.TestCase):
+    def test_common_phrasings_match(self):
+        for text in ["do i have free time", "do i have any free time today",
+                     "am i free at 3",
+                     "when am i free next week", "when's my available slot"]:
+            with self.subTest(text=text):
+                self.assertIsNotNone(FREE_TIME.fullmatch(text))
+
+    def test_needs_free_or_available(self):
+        self.assertIsNone(FREE_TIME.fullmatch("do i have a meeting"))
+
+
+class RouterDeadlineTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = ThreadPoolExecutor(max_workers=2)
+
+    def tearDown(self):
+        self.pool.shutdown(wait=False)
+
+    def test_slow_calendar_falls_through(self):
+        router = IntentRouter(SlowCalendar(0.5), memory=None, pool=self.pool, timeout=0.05)
+        started = time.perf_counter()
+        self.assertIsNone(router.route("what's next"))
+        self.assertLess(time.perf_counter() - started, 0.3)
+        self.assertEqual(router.passed, 1)
+
+    def test_fast_calendar_is_answered(self):
+        router = IntentRouter(SlowCalendar(0), memory=None, pool=self.pool, timeout=1.0)
+        self.assertEqual(router.route("what's next"), ("next_event", "Nothing else on your calendar."))
+
+    def test_turn_deadline_overrides_the_default(self):
+        router = IntentRouter(SlowCalendar(0.5), memory=None, pool=self.pool, timeout=5.0)
+        started = time.perf_counter()
+        self.assertIsNone(router.route("what's next", timeout=0.05))
+        self.assertLess(time.perf_counter() - started, 0.3)
+
+    def test_writes_run_inline_past_the_deadline(self):
+        memory = SlowMemory(0.1)
+        router = IntentRouter(SlowCalendar(0), memory, pool=self.pool, timeout=0.01)
+        self.assertEqual(router.route("add a task to call Mom"), ("add_task", "Added to your tasks: call Mom."))
+        self.assertEqual(memory.tasks, ["call Mom"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+
+from agent.llm_manager import LLMManager, _Escalate, _SentenceStream, split_sentences
+from agent.model_cascade import ModelCascade
+
+
+def feed_all(stream, tokens):
+    shown, spoken = [], []
+    for token in tokens:
+        text, sentences = stream.feed(token)
+        shown.append(text)
+        spoken.extend(sentences)
+        if stream.full:
+            break
+    text, sentences = stream.finish()
+    shown.append(text)
+    spoken.extend(sentences)
+    return "".join(shown), spoken
+
+
+class SentenceStreamTest(unittest.TestCase):
+    def test_cut_off_after_limit(self):
+        stream = _SentenceStream(2)
+        shown, spoken = feed_all(stream, ["You have ", "3 meetings.", " Next", " is at 2.", " After", " that"])
+        self.assertTrue(stream.full)
+        self.assertEqual(spoken, ["You have 3 meetings.", "Next is at 2."])
+        # The token that completed the limit is sliced, nothing after it is shown
+        self.assertEqual(shown, "You have 3 meetings. Next is at 2.")
+        self.assertEqual(stream.text, shown)
+
+    def test_slices_token_spanning_the_boundary(self):
+        stream = _SentenceStream(1)
+        text, sentences = stream.feed("Done. Then")
+        self.assertEqual((text, sentences), ("Done.", ["Done."]))
+        self.assertTrue(stream.full)
+
+    def test_first_sentence_held_until_screened(self):
+        stream = _SentenceStream(2, screen=ModelCascade.hedged)
+        self.assertEqual(stream.feed("Your next "), ("", []))
+        self.assertEqual(stream.feed("one is lunch."), ("", []))
+        text, sentences = stream.feed(" Then")
+        self.assertEqual(text, "Your next one is lunch. Then")
+        self.assertEqual(sentences, ["Your next one is lunch."])
+        # Screened once: later tokens go straight through
+        self.assertEqual(stream.feed(" a call")[0], " a call")
+
+    def test_hedge_escalates_before_anything_is_shown(self):
+        stream = _SentenceStream(2, screen=ModelCascade.hedged)
+        self.assertEqual(stream.feed("I'm not sure "), ("", []))
+        with self.assertRaises(_Escalate):
+            stream.feed("about that. Maybe")
+
+    def test_hedge_in_unterminated_reply_escalates_at_finish(self):
+        stream = _SentenceStream(2, screen=ModelCascade.hedged)
+        stream.feed("I don't know")
+        with self.assertRaises(_Escalate):
+            stream.finish()
+
+    def test_abbreviations_do_not_end_sentences(self):
+        stream = _SentenceStream(1)
+        shown, spoken = feed_all(stream, ["Next is at 2 p.m. ", "tomorrow. ", "Then"])
+        self.assertEqual(spoken, ["Next is at 2 p.m. tomorrow."])
+
+
+class SplitSentencesTest(unittest.TestCase):
+    def test_abbreviations_and_initials(self):
+        self.assertEqual(split_sentences("Meet Dr. Smith at 3. Then lunch."),
+                         ["Meet Dr. Smith at 3.", "Then lunch."])
+        self.assertEqual(split_sentences("Call J. Smith now."), ["Call J. Smith now."])
+        self.assertEqual(split_sentences("Ends at 2 p.m. Then lunch."), ["Ends at 2 p.m.", "Then lunch."])
+
+    def test_shorten_response_keeps_abbreviated_sentence(self):
+        llm = LLMManager(small_model=None)
+        self.assertEqual(llm._shorten_response("Next is at 2 p.m. tomorrow. Then **nothing**. More."),
+                         "Next is at 2 p.m. tomorrow. Then nothing.")
+
+
+if __name__ == "__main__":
+    unittest.main()
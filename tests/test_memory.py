@@ -0,0 +1,32 @@
+import threading
+import unittest
+
+from agent.memory import IdleCompactor
+
+
+class FlakyMemory:
+    def __init__(self):
+        self.calls = 0
+        self.recovered = threading.Event()
+
+    def compact(self, should_stop):
+        self.calls += 1
+        if self.calls == 1:
+            raise ValueError("bad summary row")
+        self.recovered.set()
+        return {"rolled_up": 0}
+
+
+class IdleCompactorTest(unittest.TestCase):
+    def test_keeps_running_after_a_failed_compaction(self):
+        memory = FlakyMemory()
+        compactor = IdleCompactor(memory, idle_after=0.01, interval=0).start()
+        try:
+            self.assertTrue(memory.recovered.wait(2.0))
+            self.assertEqual(compactor.last_stats, {"rolled_up": 0})
+        finally:
+            compactor.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from agent.metrics import NULL_SPAN, JsonlSink, Metrics, SqliteSink
+
+
+class RecordingSink:
+    def __init__(self):
+        self.events = []
+
+    def write(self, event):
+        self.events.append(event)
+
+    def close(self):
+        pass
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.sink = RecordingSink()
+        self.metrics = Metrics(enabled=True, sinks=[self.sink])
+
+    def test_disabled_records_nothing(self):
+        metrics = Metrics()
+        metrics.count("routed", intent="tasks")
+        metrics.observe("turn_seconds", 0.1)
+        self.assertIs(metrics.span("llm"), NULL_SPAN)
+        self.assertEqual(metrics.snapshot(), {"counters": {}, "histograms": {}})
+
+    def test_counters_add_up_per_label_set(self):
+        self.metrics.count("routed", intent="tasks")
+        self.metrics.count("routed", intent="tasks")
+        self.metrics.count("routed", 3, intent="agenda")
+        self.assertEqual(self.metrics.snapshot()["counters"],
+                         {'routed{intent="tasks"}': 2, 'routed{intent="agenda"}': 3})
+
+    def test_histogram_buckets_are_cumulative(self):
+        for seconds in (0.003, 0.2, 20.0):
+            self.metrics.observe("turn_seconds", seconds)
+        lines = self.metrics.render_prometheus().splitlines()
+        self.assertIn("# TYPE ted_turn_seconds histogram", lines)
+        self.assertIn('ted_turn_seconds_bucket{le="0.001"} 0', lines)
+        self.assertIn('ted_turn_seconds_bucket{le="0.005"} 1', lines)
+        self.assertIn('ted_turn_seconds_bucket{le="0.25"} 2', lines)
+        self.assertIn('ted_turn_seconds_bucket{le="10"} 2', lines)
+        self.assertIn('ted_turn_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn("ted_turn_seconds_sum 20.203000", lines)
+        self.assertIn("ted_turn_seconds_count 3", lines)
+
+    def test_render_prometheus_counters_and_escaping(self):
+        self.metrics.count("errors", stage="llm", error='Bad "quote"')
+        lines = self.metrics.render_prometheus().splitlines()
+        self.assertEqual(lines[:2], ["# TYPE ted_errors_total counter",
+                                     'ted_errors_total{error="Bad \\"quote\\"",stage="llm"} 1'])
+
+    def test_span_attributes_with_any_name(self):
+        with self.metrics.span("voice_transcribe", seconds=2.0, span="x", name="y", value=1) as span:
+            span.set(attrs="z")
+        event = self.sink.events[-1]
+        self.assertEqual((event["kind"], event["name"]), ("span", "voice_transcribe"))
+        self.assertEqual((event["seconds"], event["span"], event["attrs"]), (2.0, "x", "z"))
+        self.assertIn('span_seconds{span="voice_transcribe"}', self.metrics.snapshot()["histograms"])
+
+    def test_span_counts_escaping_errors(self):
+        with self.assertRaises(ValueError):
+            with self.metrics.span("memory_read"):
+                raise ValueError()
+        self.assertEqual(self.metrics.snapshot()["counters"],
+                         {'errors{error="ValueError",stage="memory_read"}': 1})
+        self.assertEqual(self.sink.events[-1]["error"], "ValueError")
+
+
+class SinkTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def test_jsonl_sink_writes_a_line_per_event(self):
+        path = os.path.join(self.dir, "metrics.jsonl")
+        metrics = Metrics(enabled=True, sinks=[JsonlSink(path)])
+        metrics.count("routed", intent="tasks")
+        metrics.observe("turn_seconds", 0.5, attrs={"source": "cli"})
+        metrics.close()
+        with open(path) as f:
+            events = [json.loads(line) for line in f]
+        self.assertEqual([(e["kind"], e["name"], e["value"]) for e in events],
+                         [("count", "routed", 1), ("observe", "turn_seconds", 0.5)])
+        self.assertEqual(events[1]["source"], "cli")
+
+    def test_sqlite_sink_flushes_batches_and_on_close(self):
+        path = os.path.join(self.dir, "metrics.db")
+        sink = SqliteSink(path, batch_size=2)
+        metrics = Metrics(enabled=True, sinks=[sink])
+        for _ in range(3):
+            metrics.count("routed", intent="tasks")
+        with sqlite3.connect(path) as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM events").fetchone()[0], 2)
+        metrics.close()
+        with sqlite3.connect(path) as conn:
+            rows = conn.execute("SELECT kind, name, value, attrs FROM events").fetchall()
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0][:3], ("count", "routed", 1.0))
+        self.assertEqual(json.loads(rows[0][3]), {"intent": "tasks"})
+
+
+if __name__ == "__main__":
+    unittest.main()
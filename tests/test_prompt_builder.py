@@ -0,0 +1,29 @@
+import unittest
+
+from agent.prompt_builder import PromptBuilder, estimate_tokens
+
+TEMPLATE = "{context}\n\nUser: {prompt}"
+
+
+class PromptBuilderTest(unittest.TestCase):
+    def test_stops_at_the_first_item_that_does_not_fit(self):
+        builder = PromptBuilder(TEMPLATE, "", {"calendar": 10})
+        turn = builder.build("next?", {"calendar": ["- short", "- " + "long " * 20, "- tiny"]})
+        self.assertIn("- short", turn)
+        self.assertNotIn("- tiny", turn)
+        self.assertEqual(builder.last_stats["sections"]["calendar"]["tokens"], estimate_tokens("- short"))
+
+    def test_long_prompt_is_kept_and_context_shrinks(self):
+        builder = PromptBuilder(TEMPLATE, "", {"memory": 40, "user": 10})
+        prompt = " ".join(f"word{i}" for i in range(15))
+        memory = [f"User: question {i}\nTED: answer {i}" for i in range(10)]
+        turn = builder.build(prompt, {"memory": memory})
+        self.assertTrue(turn.endswith(prompt))
+        stats = builder.last_stats["sections"]
+        self.assertEqual(stats["user"]["tokens"], estimate_tokens(prompt))
+        self.assertLessEqual(stats["memory"]["tokens"] + stats["user"]["tokens"], 50)
+        self.assertGreater(stats["memory"]["tokens"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import time
+import unittest
+
+from agent.response_cache import ResponseCache
+
+CONTEXT = {"calendar": ["- Budget review (2026-10-19T10:00:00-04:00)"],
+           "memory": ["User: hi\nTED: Hey!"]}
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(ttl=60.0)
+        self.fingerprint = ResponseCache.fingerprint(CONTEXT, "s1")
+
+    def test_normalized_prompt_hits(self):
+        self.cache.put("m", "What's on my calendar today?", self.fingerprint, "Budget review at 10.")
+        self.assertEqual(self.cache.get("m", "whats on my calendar today", self.fingerprint),
+                         "Budget review at 10.")
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_entries_expire(self):
+        cache = ResponseCache(ttl=0.05)
+        cache.put("m", "what is on my calendar", self.fingerprint, "Nothing.")
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("m", "what is on my calendar", self.fingerprint))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_least_recently_used_is_evicted(self):
+        # Each prompt stores an exact and a normalized entry
+        cache = ResponseCache(max_entries=3)
+        cache.put("m", "first question about the calendar", self.fingerprint, "one")
+        cache.put("m", "second question about the calendar", self.fingerprint, "two")
+        cache.get("m", "first question about the calendar", self.fingerprint)
+        cache.put("m", "third question about the calendar", self.fingerprint, "three")
+        self.assertEqual(cache.get("m", "first question about the calendar", self.fingerprint), "one")
+        self.assertIsNone(cache.get("m", "second question about the calendar", self.fingerprint))
+
+    def test_state_changing_short_and_anaphoric_prompts_bypass(self):
+        for prompt in ["cancel my meeting with Alex", "what about tomorrow", "when does it start today"]:
+            with self.subTest(prompt=prompt):
+                self.cache.put("m", prompt, self.fingerprint, "reply")
+                self.assertIsNone(self.cache.get("m", prompt, self.fingerprint))
+        self.assertEqual(self.cache.stats()["bypassed"], 3)
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_fingerprint_follows_calendar_and_session_not_memory(self):
+        later = dict(CONTEXT, memory=["User: what is on my calendar\nTED: Budget review at 10."])
+        self.assertEqual(ResponseCache.fingerprint(later, "s1"), self.fingerprint)
+        self.assertNotEqual(ResponseCache.fingerprint(CONTEXT, "s2"), self.fingerprint)
+        moved = dict(CONTEXT, calendar=["- Budget review (2026-10-19T11:00:00-04:00)"])
+        self.assertNotEqual(ResponseCache.fingerprint(moved, "s1"), self.fingerprint)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from agent.llm_manager import LLMManager
+from agent.memory import Memory
+from agent.response_cache import ResponseCache
+from benchmarks.stub_ollama import StubOllama
+from main import Overloaded, TedServer, create_app
+
+
+class TedServerTest(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubOllama(tokens_per_second=500, prompt_latency=0.01).start()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.memory = Memory(os.path.join(self.tmp.name, "server.db"))
+        llm = LLMManager(ollama_url=self.stub.url, small_model=None)
+        llm.response_cache = ResponseCache(max_entries=0)
+        self.server = TedServer(llm=llm, memory=self.memory, max_in_flight=1, max_waiting=1)
+
+    def tearDown(self):
+        self.server.compactor.stop()
+        self.memory.close()
+        self.stub.stop()
+        self.tmp.cleanup()
+
+    def run_async(self, coroutine):
+        async def run():
+            try:
+                return await coroutine
+            finally:
+                await self.server.llm.aclose()
+        return asyncio.run(run())
+
+    def saved(self, session_id):
+        self.memory.flush()
+        return self.memory.get_recent_conversations(session_id=session_id)
+
+    def test_rejects_once_the_wait_queue_is_full(self):
+        commands = ["What's on today?", "Any meetings tomorrow?", "Am I free at 3?"]
+
+        async def burst():
+            return await asyncio.gather(
+                *(self.server.process_command(f"s{i}", command) for i, command in enumerate(commands)),
+                return_exceptions=True
+            )
+
+        results = self.run_async(burst())
+        # One runs, one waits for its slot, the third is turned away
+        self.assertIsInstance(results[2], Overloaded)
+        self.assertTrue(all(result["response"] for result in results[:2]))
+        stats = self.server.stats()
+        self.assertEqual((stats["served"], stats["rejected"]), (2, 1))
+        self.assertEqual((stats["in_flight"], stats["waiting"]), (0, 0))
+
+    def test_disconnect_mid_reply_saves_nothing_and_frees_the_slot(self):
+        async def gone(token):
+            raise WebSocketDisconnect(1001)
+
+        async def turns():
+            with self.assertRaises(WebSocketDisconnect):
+                await self.server.process_command("left", "What's on today?", on_token=gone)
+            # The slot went back, so the next request isn't stuck behind it
+            return await asyncio.wait_for(self.server.process_command("stayed", "Hello?"), 5)
+
+        self.assertTrue(self.run_async(turns())["response"])
+        self.assertEqual(self.saved("left"), [])
+        self.assertEqual(len(self.saved("stayed")), 1)
+        self.assertEqual(self.server.stats()["in_flight"], 0)
+
+    def test_websocket_streams_the_reply_and_survives_a_disconnect(self):
+        app = create_app(self.server)
+        with TestClient(app) as client:
+            # The lifespan preloaded the system prompt
+            self.assertIn(self.server.llm.model, self.server.llm._system_context)
+            with client.websocket_connect("/ws/ws-session") as websocket:
+                websocket.send_text("What's on today?")
+                tokens = []
+                while True:
+                    message = websocket.receive_json()
+                    if message["type"] == "done":
+                        break
+                    tokens.append(message["text"])
+                self.assertEqual("".join(tokens), message["response"])
+            # Closing the socket ends the handler cleanly
+            self.assertEqual(client.get("/health").json()["in_flight"], 0)
+        self.assertEqual(len(self.saved("ws-session")), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from array import array
+
+from agent.metrics import metrics
+from tools.voice_input import FRAME_MS, SAMPLE_RATE, SAMPLE_WIDTH, VoiceListener
+
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+
+
+def frames(amplitude, count):
+    frame = array("h", [amplitude, -amplitude] * (FRAME_SAMPLES // 2)).tobytes()
+    return [frame] * count
+
+
+def frame_count(pcm, sample_rate):
+    return str(len(pcm) // (FRAME_SAMPLES * SAMPLE_WIDTH))
+
+
+class VoiceListenerTest(unittest.TestCase):
+    def test_silence_ends_an_utterance(self):
+        listener = VoiceListener(frame_count)
+        audio = frames(20, 10) + frames(4000, 20) + frames(20, 30)
+        utterances = list(listener.utterances(audio))
+        listener.close()
+        self.assertEqual(len(utterances), 1)
+        self.assertAlmostEqual(utterances[0].speech_seconds, 20 * FRAME_MS / 1000, places=2)
+
+    def test_continuous_speech_is_capped(self):
+        listener = VoiceListener(frame_count, max_utterance_seconds=0.6)
+        audio = frames(20, 10) + frames(4000, 100)
+        utterances = list(listener.utterances(audio))
+        listener.close()
+        cap = int(600 // FRAME_MS)
+        self.assertGreaterEqual(len(utterances), 3)
+        for utterance in utterances:
+            self.assertLessEqual(int(utterance.text), cap)
+
+    def test_runs_with_metrics_enabled(self):
+        metrics.enable()
+        self.addCleanup(metrics.reset)
+        self.addCleanup(setattr, metrics, "enabled", False)
+        listener = VoiceListener(frame_count)
+        audio = frames(20, 10) + frames(4000, 20) + frames(20, 30)
+        utterances = list(listener.utterances(audio))
+        listener.close()
+        self.assertEqual(len(utterances), 1)
+        self.assertEqual(metrics.snapshot()["histograms"]["span_seconds{span=\"voice_transcribe\"}"]["count"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
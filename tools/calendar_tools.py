@@ -1,26 +1,122 @@
-from datetime import datetime, timedelta
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import List
 from agent.google_client import GoogleClient
+from agent.metrics import metrics
+
+# The Calendar API accepts at most 50 requests per batch
+BATCH_LIMIT = 50
+
+# A full sync fetches this window (recurring events expand into instances,
+# so it needs an end); incremental syncs report changes within it
+SYNC_PAST = timedelta(days=1)
+SYNC_AHEAD = timedelta(days=90)
+# ...and is redone this often so the window moves along with the clock
+WINDOW_REFRESH = timedelta(days=1)
 
 class CalendarTools:
-    def __init__(self):
-        self.client = GoogleClient()
-        self.service = self.client.get_calendar_service()
-    
-    def get_events(self, max_results=10):
-        """Get upcoming events"""
-        now = datetime.utcnow().isoformat() + 'Z'  # 'Z' indicates UTC time
-        events_result = self.service.events().list(
-            calendarId='primary',
-            timeMin=now,
-            maxResults=max_results,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-        return events_result.get('items', [])
-    
+    def __init__(self, service=None, cache_ttl: float = 60.0):
+        """service can be any object shaped like the Calendar v3 service (e.g. a fake in tests)"""
+        self.client = None
+        if service is None:
+            self.client = GoogleClient()
+            service = self.client.get_calendar_service()
+        self.service = service
+
+        # Local event cache kept fresh with incremental (syncToken) sync
+        self.cache_ttl = cache_ttl
+        self._events = {}          # event id -> event
+        self._sorted = None        # upcoming-order view, rebuilt on change
+        self._sync_token = None
+        self._window_start = None  # when the current sync token's window begins
+        self._synced_at = 0.0
+        self._invalidated_at = 0.0
+        self._lock = threading.Lock()
+        # Syncs run one at a time on their own thread; readers that find the
+        # cache stale wait on the sync already under way instead of starting another
+        self._sync_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ted-calendar-sync")
+        self._pending = None
+        
+        # Bumped whenever the calendar may have changed, so derived views
+        # (e.g. FreeSlots) know to rebuild
+        self.version = 0
+
+    def get_events(self, max_results=10, timeout=None):
+        """Get upcoming events
+
+        With a timeout, waits at most that long for a sync under way and then
+        raises concurrent.futures.TimeoutError; the sync carries on regardless.
+        """
+        with metrics.span("calendar_read"):
+            self._refresh(timeout)
+            now = datetime.now(timezone.utc)
+            with self._lock:
+                if self._sorted is None:
+                    self._sorted = sorted(self._events.values(), key=lambda e: self._when(e, 'start'))
+                upcoming = [e for e in self._sorted if self._when(e, 'end') > now]
+            return upcoming[:max_results]
+
     def create_event(self, summary, start_time, end_time, description=""):
         """Create a new calendar event"""
-        event = {
+        event = self.event_body(summary, start_time, end_time, description)
+
+        self._ensure_fresh()
+        event = self.service.events().insert(
+            calendarId='primary',
+            body=event
+        ).execute()
+        self.invalidate()
+        return event
+
+    def create_events(self, events: List[dict]) -> list:
+        """Insert many events (bodies as built by event_body) in batched round trips
+
+        Returns one entry per event, in order: the created event, or the
+        exception for that insert.
+        """
+        events_api = self.service.events()
+        return self._batch([events_api.insert(calendarId='primary', body=event) for event in events])
+
+    def update_events(self, events: List[dict]) -> list:
+        """Patch many existing events (each with its 'id') in batched round trips"""
+        events_api = self.service.events()
+        return self._batch([
+            events_api.patch(
+                calendarId='primary',
+                eventId=event['id'],
+                body={k: v for k, v in event.items() if k != 'id'}
+            )
+            for event in events
+        ])
+
+    def busy(self, time_min: datetime, time_max: datetime) -> List[tuple]:
+        """Busy (start, end) intervals between time_min and time_max from the freebusy endpoint
+        
+        One call covers the whole range and returns only the busy blocks,
+        not full event bodies, so it's the cheap way to refresh a window.
+        """
+        self._ensure_fresh()
+        with metrics.span("calendar_freebusy"):
+            result = self.service.freebusy().query(body={
+                'timeMin': time_min.astimezone(timezone.utc).isoformat(),
+                'timeMax': time_max.astimezone(timezone.utc).isoformat(),
+                'items': [{'id': 'primary'}],
+            }).execute()
+        calendar = result.get('calendars', {}).get('primary', {})
+        if calendar.get('errors'):
+            raise RuntimeError(f"freebusy failed: {calendar['errors'][0].get('reason')}")
+        # Blocks are RFC 3339 strings in UTC
+        return [
+            (datetime.fromisoformat(block['start'].replace('Z', '+00:00')),
+             datetime.fromisoformat(block['end'].replace('Z', '+00:00')))
+            for block in calendar.get('busy', [])
+        ]
+
+    @staticmethod
+    def event_body(summary, start_time, end_time, description=""):
+        return {
             'summary': summary,
             'description': description,
             'start': {
@@ -32,9 +128,120 @@ class CalendarTools:
                 'timeZone': 'America/New_York',
             },
         }
-        
-        event = self.service.events().insert(
-            calendarId='primary', 
-            body=event
-        ).execute()
-        return event
+
+    def _batch(self, requests: list) -> list:
+        """Run requests through BatchHttpRequest, BATCH_LIMIT at a time"""
+        results = [None] * len(requests)
+
+        def callback(request_id, response, exception):
+            results[int(request_id)] = exception if exception is not None else response
+
+        self._ensure_fresh()
+        with metrics.span("calendar_batch", requests=len(requests)):
+            for start in range(0, len(requests), BATCH_LIMIT):
+                batch = self.service.new_batch_http_request(callback=callback)
+                for index in range(start, min(start + BATCH_LIMIT, len(requests))):
+                    batch.add(requests[index], request_id=str(index))
+                batch.execute()
+
+        if requests:
+            self.invalidate()
+        return results
+
+    def _ensure_fresh(self):
+        if self.client is not None:
+            self.client.ensure_fresh()
+
+    def invalidate(self):
+        """Force the next read to fetch the delta from the API"""
+        with self._lock:
+            self._synced_at = 0.0
+            self._invalidated_at = time.monotonic()
+            # A sync already under way may have read the calendar before the change
+            self._pending = None
+            self.version += 1
+
+    def _refresh(self, timeout=None):
+        """Bring the cache up to date if it's older than cache_ttl"""
+        with self._lock:
+            if time.monotonic() - self._synced_at < self.cache_ttl:
+                return
+            # A finished sync that left the cache stale failed (or was invalidated): go again
+            if self._pending is None or self._pending.done():
+                self._pending = self._sync_pool.submit(self._sync_now)
+            pending = self._pending
+        pending.result(timeout)
+
+    def _sync_now(self):
+        """Runs on the sync thread: fetch without the lock, then swap the result in under it"""
+        started = time.monotonic()
+        self._ensure_fresh()
+        now = datetime.now(timezone.utc)
+        full = self._sync_token is None or now - self._window_start >= WINDOW_REFRESH
+        with metrics.span("calendar_sync", full=full):
+            try:
+                fetched, sync_token = self._fetch(now if full else None)
+            except Exception as e:
+                # 410 Gone means the sync token expired: start over
+                if full or getattr(getattr(e, 'resp', None), 'status', None) != 410:
+                    raise
+                metrics.count("fallbacks", kind="calendar_full_sync")
+                full = True
+                fetched, sync_token = self._fetch(now)
+        with self._lock:
+            self._apply(fetched, full)
+            self._sync_token = sync_token
+            if full:
+                self._window_start = now
+            if started > self._invalidated_at:
+                self._synced_at = started
+
+    def _fetch(self, window_from=None):
+        """(event id -> event, next sync token): everything in the window starting
+        at window_from, or with window_from=None only what changed since the sync token
+        """
+        fetched = {}
+        page_token = None
+
+        while True:
+            # Incremental requests repeat the full sync's parameters, minus the window
+            params = {'calendarId': 'primary', 'singleEvents': True, 'maxResults': 2500}
+            if page_token:
+                params['pageToken'] = page_token
+            if window_from is None:
+                params['syncToken'] = self._sync_token
+            else:
+                params['timeMin'] = (window_from - SYNC_PAST).isoformat()
+                params['timeMax'] = (window_from + SYNC_AHEAD).isoformat()
+            result = self.service.events().list(**params).execute()
+            for event in result.get('items', []):
+                fetched[event['id']] = event
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                break
+        return fetched, result.get('nextSyncToken')
+
+    def _apply(self, fetched: dict, full: bool):
+        """Merge a fetch into the cache (caller holds the lock)"""
+        if full:
+            self._events = {}
+        for event_id, event in fetched.items():
+            if event.get('status') == 'cancelled':
+                self._events.pop(event_id, None)
+            else:
+                self._events[event_id] = event
+        if full or fetched:
+            self._sorted = None
+            self.version += 1
+
+    @staticmethod
+    def _when(event, key):
+        """Event start/end as an aware datetime (all-day events start at UTC midnight)"""
+        value = event.get(key, {})
+        if 'dateTime' in value:
+            when = datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00'))
+        elif 'date' in value:
+            when = datetime.fromisoformat(value['date'])
+        else:
+            return datetime.max.replace(tzinfo=timezone.utc)
+        return when if when.tzinfo else when.replace(tzinfo=timezone.utc)
@@ -0,0 +1,236 @@
+import bisect
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone, time as clock
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+from zoneinfo import ZoneInfo
+from agent.metrics import metrics
+from tools.calendar_tools import CalendarTools
+
+# Same zone CalendarTools creates events in
+DEFAULT_TIMEZONE = "America/New_York"
+
+# Free time is only offered in whole steps of this many minutes
+SLOT_STEP = 15
+
+FREE_TIME = re.compile(
+    r"\b(free|available|availability|open slots?|free slots?|time for|squeeze|fit in)\b", re.I
+)
+DURATION = re.compile(r"(\d+(?:\.\d+)?)\s*(minutes?|mins?|m|hours?|hrs?|h)\b", re.I)
+HALF_HOUR = re.compile(r"\bhalf an? hour\b", re.I)
+AN_HOUR = re.compile(r"\b(an|one) hour\b", re.I)
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+WEEKDAY = re.compile(r"\b(" + "|".join(WEEKDAYS) + r")\b", re.I)
+
+Interval = Tuple[datetime, datetime]
+
+class SlotRequest(NamedTuple):
+    duration: timedelta
+    start: datetime
+    end: datetime
+    label: str
+
+class IntervalIndex:
+    """Disjoint busy intervals sorted by start, kept as epoch seconds for bisect
+
+    Overlapping and touching intervals are merged on the way in, so finding
+    the gaps in a window is a bisect plus a walk over the intervals inside it.
+    """
+
+    def __init__(self, intervals: Iterable[Interval] = ()):
+        self.starts: List[float] = []
+        self.ends: List[float] = []
+        self.rebuild(intervals)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def rebuild(self, intervals: Iterable[Interval]):
+        starts, ends = [], []
+        for start, end in sorted((s.timestamp(), e.timestamp()) for s, e in intervals):
+            if end <= start:
+                continue
+            if ends and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        self.starts, self.ends = starts, ends
+
+    def add(self, start: datetime, end: datetime):
+        """Insert one interval, merging it with any it overlaps"""
+        start, end = start.timestamp(), end.timestamp()
+        if end <= start:
+            return
+        # Every interval from lo to hi-1 touches [start, end]
+        lo = bisect.bisect_left(self.ends, start)
+        hi = bisect.bisect_right(self.starts, end)
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
+
+    def gaps(self, start: datetime, end: datetime) -> List[Tuple[float, float]]:
+        """Free (start, end) epoch-second pairs within [start, end]"""
+        lo, hi = start.timestamp(), end.timestamp()
+        free = []
+        cursor = lo
+        # First interval that ends after the window opens
+        i = bisect.bisect_right(self.ends, lo)
+        while i < len(self.starts) and self.starts[i] < hi:
+            if self.starts[i] > cursor:
+                free.append((cursor, self.starts[i]))
+            cursor = max(cursor, self.ends[i])
+            i += 1
+        if cursor < hi:
+            free.append((cursor, hi))
+        return free
+
+class FreeSlots:
+    """Finds free time in working hours from a local index of busy intervals
+
+    The index is refreshed in bulk from the freebusy endpoint (one call for
+    the next horizon_days) when it's older than refresh_ttl or the calendar
+    has changed; lookups after that are pure interval arithmetic.
+    """
+
+    def __init__(self, calendar, tz: str = DEFAULT_TIMEZONE,
+                 work_start: clock = clock(9), work_end: clock = clock(17),
+                 workdays: Tuple[int, ...] = (0, 1, 2, 3, 4),
+                 horizon_days: int = 14, refresh_ttl: float = 60.0):
+        self.calendar = calendar
+        self.tz = ZoneInfo(tz)
+        self.work_start = work_start
+        self.work_end = work_end
+        self.workdays = workdays
+        self.horizon = timedelta(days=horizon_days)
+        self.refresh_ttl = refresh_ttl
+
+        self.index = IntervalIndex()
+        self._refreshed_at = 0.0
+        self._version = None
+        self._lock = threading.Lock()
+
+    def find(self, duration: timedelta, start: Optional[datetime] = None,
+             end: Optional[datetime] = None, limit: int = 5) -> List[Interval]:
+        """Free blocks of at least duration in working hours, earliest first
+
+        Each block is returned whole (local time), so a caller can offer
+        "10:00-12:00" rather than just the first 45 minutes of it.
+        """
+        now = datetime.now(self.tz)
+        start = max(start or now, now)
+        end = min(end or now + timedelta(days=7), now + self.horizon)
+        self.refresh()
+
+        with metrics.span("free_slots", events=len(self.index)):
+            needed = duration.total_seconds()
+            step = SLOT_STEP * 60
+            slots = []
+            day = start.astimezone(self.tz).date()
+            while len(slots) < limit:
+                opens = datetime.combine(day, self.work_start, self.tz)
+                if opens >= end:
+                    break
+                if day.weekday() in self.workdays:
+                    closes = datetime.combine(day, self.work_end, self.tz)
+                    window_start = self._round_up(max(opens, start))
+                    window_end = min(closes, end)
+                    if window_start < window_end:
+                        # Stay in epoch seconds; only blocks that fit become datetimes
+                        for free_start, free_end in self.index.gaps(window_start, window_end):
+                            free_start = -(-free_start // step) * step
+                            if free_end - free_start >= needed:
+                                slots.append((datetime.fromtimestamp(free_start, self.tz),
+                                              datetime.fromtimestamp(free_end, self.tz)))
+                                if len(slots) == limit:
+                                    break
+                day += timedelta(days=1)
+            return slots
+
+    def refresh(self, force: bool = False):
+        """Rebuild the index if it's stale or the calendar changed since the last build"""
+        with self._lock:
+            version = getattr(self.calendar, 'version', None)
+            fresh = time.monotonic() - self._refreshed_at < self.refresh_ttl
+            if fresh and version == self._version and not force:
+                return
+            now = datetime.now(timezone.utc)
+            try:
+                busy = self.calendar.busy(now - timedelta(days=1), now + self.horizon)
+            except Exception:
+                # freebusy unavailable: fall back to the cached event list
+                metrics.count("fallbacks", kind="free_slots_events")
+                busy = self.busy_from_events(self.calendar.get_events(None))
+            self.index.rebuild(busy)
+            self._refreshed_at = time.monotonic()
+            self._version = version
+
+    @staticmethod
+    def busy_from_events(events: List[dict]) -> List[Interval]:
+        """Busy intervals from Calendar API events, skipping ones marked as free"""
+        return [
+            (CalendarTools._when(event, 'start'), CalendarTools._when(event, 'end'))
+            for event in events
+            if event.get('transparency') != 'transparent'
+        ]
+
+    def parse(self, text: str, now: Optional[datetime] = None) -> Optional[SlotRequest]:
+        """A SlotRequest if text asks for free time, e.g. "when am I free this week for 45 minutes" """
+        if not FREE_TIME.search(text):
+            return None
+        now = (now or datetime.now(self.tz)).astimezone(self.tz)
+        lowered = text.lower()
+
+        duration = timedelta(minutes=30)
+        match = DURATION.search(text)
+        if match:
+            amount = float(match.group(1))
+            minutes = amount * 60 if match.group(2).lower().startswith('h') else amount
+            duration = timedelta(minutes=minutes)
+        elif HALF_HOUR.search(text):
+            duration = timedelta(minutes=30)
+        elif AN_HOUR.search(text):
+            duration = timedelta(hours=1)
+
+        today = datetime.combine(now.date(), clock(0), self.tz)
+        weekday = WEEKDAY.search(text)
+        if "tomorrow" in lowered:
+            start = today + timedelta(days=1)
+            end, label = start + timedelta(days=1), "tomorrow"
+        elif "today" in lowered or "this afternoon" in lowered or "this morning" in lowered:
+            start, end, label = now, today + timedelta(days=1), "today"
+        elif "next week" in lowered:
+            start = today + timedelta(days=7 - now.weekday())
+            end, label = start + timedelta(days=7), "next week"
+        elif "this week" in lowered:
+            start, end, label = now, today + timedelta(days=7 - now.weekday()), "this week"
+            if not self._working_time_left(now, end):
+                # At the weekend (or Friday evening) "this week" means the coming one
+                start, end, label = end, end + timedelta(days=7), "next week"
+        elif weekday:
+            offset = (WEEKDAYS.index(weekday.group(1).lower()) - now.weekday()) % 7
+            start = max(now, today + timedelta(days=offset))
+            end, label = today + timedelta(days=offset + 1), weekday.group(1).capitalize()
+        else:
+            start, end, label = now, now + timedelta(days=7), "the next 7 days"
+        return SlotRequest(duration, start, end, label)
+
+    def _working_time_left(self, now: datetime, end: datetime) -> bool:
+        """Whether any working hours remain between now and end"""
+        day = now.date()
+        while datetime.combine(day, clock(0), self.tz) < end:
+            if day.weekday() in self.workdays and datetime.combine(day, self.work_end, self.tz) > now:
+                return True
+            day += timedelta(days=1)
+        return False
+
+    @staticmethod
+    def _round_up(when: datetime) -> datetime:
+        """Round up to the next SLOT_STEP minutes"""
+        step = SLOT_STEP * 60
+        seconds = when.timestamp()
+        rounded = -(-seconds // step) * step
+        return datetime.fromtimestamp(rounded, when.tzinfo)
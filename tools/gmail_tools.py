@@ -0,0 +1,259 @@
+import re
+import sqlite3
+import threading
+import time
+from email.utils import parseaddr
+from typing import Dict, List
+from agent.google_client import GoogleClient
+from agent.metrics import metrics
+
+# Messages fetched per BatchHttpRequest (Gmail allows 100, fewer avoids rate limits)
+BATCH_LIMIT = 50
+
+WORD = re.compile(r"\w+")
+
+class GmailTools:
+    """Local SQLite index of Gmail headers and snippets, kept fresh with history.list
+
+    The first sync backfills the newest messages with batched messages.get;
+    after that only the changes since the stored historyId are fetched. Mail
+    questions are answered from the index, never with a live search.
+    """
+
+    def __init__(self, service=None, db_path: str = "ted_mail.db",
+                 backfill: int = 500, sync_ttl: float = 60.0, client: GoogleClient = None):
+        """service can be any object shaped like the Gmail v1 service (e.g. a fake in tests)
+
+        Pass the client CalendarTools already signed in with to share its credentials.
+        """
+        self.client = None
+        if service is None:
+            self.client = client or GoogleClient()
+            service = self.client.get_gmail_service()
+        self.service = service
+        self.backfill = backfill
+        self.sync_ttl = sync_ttl
+        self._synced_at = 0.0
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._init_db()
+
+    def _init_db(self):
+        with self._lock:
+            self._conn.executescript('''
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS messages (
+                    id TEXT PRIMARY KEY,
+                    thread_id TEXT,
+                    sender_name TEXT,
+                    sender_email TEXT,
+                    subject TEXT,
+                    snippet TEXT,
+                    received_at INTEGER,
+                    unread INTEGER NOT NULL DEFAULT 0,
+                    labels TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_messages_received ON messages (received_at);
+                CREATE INDEX IF NOT EXISTS idx_messages_unread ON messages (unread, received_at);
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                    sender_name, sender_email, subject, snippet,
+                    content='messages', content_rowid='rowid'
+                );
+                CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+                    INSERT INTO messages_fts (rowid, sender_name, sender_email, subject, snippet)
+                    VALUES (new.rowid, new.sender_name, new.sender_email, new.subject, new.snippet);
+                END;
+                CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+                    INSERT INTO messages_fts (messages_fts, rowid, sender_name, sender_email, subject, snippet)
+                    VALUES ('delete', old.rowid, old.sender_name, old.sender_email, old.subject, old.snippet);
+                END;
+                CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE ON messages BEGIN
+                    INSERT INTO messages_fts (messages_fts, rowid, sender_name, sender_email, subject, snippet)
+                    VALUES ('delete', old.rowid, old.sender_name, old.sender_email, old.subject, old.snippet);
+                    INSERT INTO messages_fts (rowid, sender_name, sender_email, subject, snippet)
+                    VALUES (new.rowid, new.sender_name, new.sender_email, new.subject, new.snippet);
+                END;
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            ''')
+            self._conn.commit()
+
+    def unread_from(self, sender: str, limit: int = 10) -> List[Dict]:
+        """Unread messages whose sender name or address contains `sender`"""
+        self._refresh()
+        pattern = f"%{sender.strip()}%"
+        return self._query(
+            "SELECT * FROM messages WHERE unread = 1 AND (sender_name LIKE ? OR sender_email LIKE ?) "
+            "ORDER BY received_at DESC LIMIT ?",
+            (pattern, pattern, limit)
+        )
+
+    def unread(self, limit: int = 10) -> List[Dict]:
+        self._refresh()
+        return self._query(
+            "SELECT * FROM messages WHERE unread = 1 ORDER BY received_at DESC LIMIT ?", (limit,)
+        )
+
+    def search(self, topic: str, limit: int = 10) -> List[Dict]:
+        """Messages about `topic` (full-text over sender, subject and snippet), newest first"""
+        self._refresh()
+        words = WORD.findall(topic.lower())
+        if not words:
+            return []
+        match = " ".join(f'"{w}"' for w in words)
+        return self._query(
+            "SELECT m.* FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid "
+            "WHERE messages_fts MATCH ? ORDER BY m.received_at DESC LIMIT ?",
+            (match, limit)
+        )
+
+    def _query(self, sql: str, params: tuple) -> List[Dict]:
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def _refresh(self):
+        with self._sync_lock:
+            if time.monotonic() - self._synced_at < self.sync_ttl:
+                return
+            self._sync()
+
+    def sync(self):
+        """Bring the index up to date: a backfill the first time, history.list after that"""
+        with self._sync_lock:
+            self._sync()
+
+    def _sync(self):
+        if self.client is not None:
+            self.client.ensure_fresh()
+        history_id = self._get_state('history_id')
+        with metrics.span("gmail_sync", full=history_id is None):
+            if history_id is None:
+                self._backfill()
+            else:
+                try:
+                    self._sync_history(history_id)
+                except Exception as e:
+                    # 404 means the historyId is too old to sync from: start over
+                    if getattr(getattr(e, 'resp', None), 'status', None) != 404:
+                        raise
+                    metrics.count("fallbacks", kind="gmail_backfill")
+                    self._backfill()
+        self._synced_at = time.monotonic()
+
+    def _backfill(self):
+        # Read the historyId first so nothing that arrives during the backfill is missed
+        history_id = self.service.users().getProfile(userId='me').execute()['historyId']
+
+        ids = []
+        page_token = None
+        while len(ids) < self.backfill:
+            params = {'userId': 'me', 'maxResults': min(500, self.backfill - len(ids))}
+            if page_token:
+                params['pageToken'] = page_token
+            result = self.service.users().messages().list(**params).execute()
+            ids.extend(m['id'] for m in result.get('messages', []))
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                break
+
+        messages = self._fetch(ids)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages")
+            self._store(messages)
+            self._set_state('history_id', str(history_id))
+
+    def _sync_history(self, history_id: str):
+        changed = set()
+        deleted = set()
+        page_token = None
+        while True:
+            params = {'userId': 'me', 'startHistoryId': history_id}
+            if page_token:
+                params['pageToken'] = page_token
+            result = self.service.users().history().list(**params).execute()
+            for record in result.get('history', []):
+                for key in ('messagesAdded', 'labelsAdded', 'labelsRemoved'):
+                    for item in record.get(key, []):
+                        changed.add(item['message']['id'])
+                for item in record.get('messagesDeleted', []):
+                    deleted.add(item['message']['id'])
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                break
+
+        changed -= deleted
+        messages = self._fetch(sorted(changed))
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM messages WHERE id = ?", [(i,) for i in deleted])
+            self._store(messages)
+            self._set_state('history_id', str(result.get('historyId', history_id)))
+
+    def _fetch(self, ids: List[str]) -> List[Dict]:
+        """messages.get (metadata only) for ids, BATCH_LIMIT per round trip
+
+        Raises the first failure other than a 404 once every batch has run,
+        so the caller doesn't move its historyId past messages it never got.
+        """
+        messages = []
+        errors = []
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                messages.append(response)
+            elif getattr(getattr(exception, 'resp', None), 'status', None) != 404:
+                errors.append(exception)
+            # A 404 is a message deleted between listing and fetching: it just drops out
+
+        messages_api = self.service.users().messages()
+        for start in range(0, len(ids), BATCH_LIMIT):
+            batch = self.service.new_batch_http_request(callback=callback)
+            for message_id in ids[start:start + BATCH_LIMIT]:
+                batch.add(messages_api.get(
+                    userId='me', id=message_id, format='metadata',
+                    metadataHeaders=['From', 'Subject']
+                ))
+            batch.execute()
+        if errors:
+            metrics.count("errors", stage="gmail_fetch", error=type(errors[0]).__name__)
+            raise errors[0]
+        return messages
+
+    def _store(self, messages: List[Dict]):
+        """Upsert fetched messages (caller holds the lock and the transaction)"""
+        rows = []
+        for message in messages:
+            headers = {h['name'].lower(): h['value'] for h in message.get('payload', {}).get('headers', [])}
+            name, email = parseaddr(headers.get('from', ''))
+            labels = message.get('labelIds', [])
+            rows.append((
+                message['id'], message.get('threadId'), name, email.lower(),
+                headers.get('subject', ''), message.get('snippet', ''),
+                int(message.get('internalDate', 0)), int('UNREAD' in labels), ",".join(labels)
+            ))
+        self._conn.executemany('''
+            INSERT INTO messages (id, thread_id, sender_name, sender_email, subject, snippet,
+                                  received_at, unread, labels)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET
+                unread = excluded.unread, labels = excluded.labels,
+                subject = excluded.subject, snippet = excluded.snippet
+        ''', rows)
+
+    def _get_state(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value: str):
+        """Caller holds the lock"""
+        self._conn.execute(
+            "INSERT INTO sync_state (key, value) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
@@ -1,31 +1,81 @@
-import torch
-from TTS.api import TTS
 import threading
 import queue
-import tempfile
 import os
+import io
+import json
 import time
-import pygame
+import wave
+import itertools
+import statistics
+from collections import deque
 import requests
+from agent.metrics import metrics
+from tools.audio_cache import AudioCache
+
+# Remembers the model that loaded last time so startup doesn't probe the list again
+MODEL_STATE_FILE = "tts_model.json"
+
+# Lower is spoken first; speech with the same priority keeps its order
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
 
 class NaturalTTS:
     def __init__(self):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"🚀 Using device: {self.device}")
-        
+        # torch, TTS and pygame are heavy: they're imported and set up on a
+        # background thread so the CLI prompt shows up right away
+        self.device = None
         self.tts = None
-        self.speech_queue = queue.Queue()
-        self.is_processing = False
+        self.model_type = None
+        self.channel = None
+        self.speech_queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
         self.enabled = True
+        self.ready = threading.Event()
+        
+        # Cancellation token: stop() bumps it and anything queued, being
+        # synthesized or waiting to play under an older generation is dropped
+        self._generation = 0
+        self._generation_lock = threading.Lock()
         
-        # Initialize pygame for audio playback
-        pygame.mixer.init(frequency=22050, size=-16, channels=1, buffer=512)
+        # Seconds from speak() to audio starting, and for stop() to go silent
+        self.playback_latencies = deque(maxlen=100)
+        self.stop_latencies = deque(maxlen=100)
         
-        self._init_tts_engine()
+        # Synthesized waveforms, so repeated phrases skip the neural model
+        self.audio_cache = AudioCache()
+        
+        # Synthesized audio waits here for the player, so the next sentence
+        # can be synthesized while this one is playing
+        self.playback_queue = queue.Queue()
+        
+        threading.Thread(target=self._load_engine, daemon=True).start()
+        threading.Thread(target=self._speech_loop, daemon=True).start()
+    
+    def _load_engine(self):
+        """Set up audio and the TTS model, then let queued speech through"""
+        try:
+            import pygame
+            
+            # Initialize pygame for audio playback
+            pygame.mixer.init(frequency=22050, size=-16, channels=1, buffer=512)
+            self.channel = pygame.mixer.Channel(0)
+            threading.Thread(target=self._playback_loop, daemon=True).start()
+            
+            self._init_tts_engine()
+        except Exception as e:
+            print(f"❌ Audio setup failed: {e}")
+            self.enabled = False
+        finally:
+            self.ready.set()
     
     def _init_tts_engine(self):
         """Initialize TTS engine with models that don't require speaker reference"""
         try:
+            import torch
+            from TTS.api import TTS
+            
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+            print(f"🚀 Using device: {self.device}")
             print("📦 Loading AI TTS model...")
             
             # Try models in order of preference (ones that don't need speaker_wav)
@@ -37,41 +87,52 @@ class NaturalTTS:
                 "tts_models/en/ek1/tacotron2"           # Another option
             ]
             
+            last_model = self._load_last_model()
+            if last_model == "xtts_v2":
+                models_to_try = []
+            elif last_model in models_to_try:
+                models_to_try.remove(last_model)
+                models_to_try.insert(0, last_model)
+            
             for model_name in models_to_try:
                 try:
                     print(f"🔄 Trying {model_name}...")
                     self.tts = TTS(model_name).to(self.device)
                     self.model_type = model_name
-                    print(f"✅ Loaded: {model_name}")
                     
-                    # Test the TTS
-                    test_text = "Hello, I am your AI assistant."
-                    print("🔊 Testing TTS...")
-                    self._speak_immediate(test_text)
+                    # Test the TTS (synthesis only; it also warms the audio cache)
+                    self._synthesize("Hello, I am your AI assistant.")
+                    print(f"✅ Loaded: {model_name}")
+                    self._save_last_model(model_name)
                     return
                     
                 except Exception as e:
+                    metrics.count("errors", stage="tts_load", error=type(e).__name__)
                     print(f"❌ {model_name} failed: {e}")
                     continue
             
             # If all models fail, try XTTS with a default speaker
             print("🔄 Trying XTTS with default speaker...")
+            metrics.count("fallbacks", kind="tts_xtts")
             self._init_xtts_with_default_speaker()
             
         except Exception as e:
             print(f"❌ All AI TTS models failed: {e}")
             print("🔄 Falling back to pyttsx3...")
+            metrics.count("fallbacks", kind="tts_pyttsx3")
             self._init_fallback()
     
     def _init_xtts_with_default_speaker(self):
         """Initialize XTTS with a default speaker sample"""
         try:
+            from TTS.api import TTS
             self.tts = TTS("tts_models/multilingual/multi-dataset/xtts_v2").to(self.device)
             self.model_type = "xtts_v2"
             
             # Create or download a default speaker reference
             self.default_speaker_path = self._get_default_speaker()
             print("✅ XTTS v2 loaded with default speaker")
+            self._save_last_model(self.model_type)
             
         except Exception as e:
             print(f"❌ XTTS v2 failed: {e}")
@@ -85,6 +146,7 @@ class NaturalTTS:
             print("📥 Creating default speaker reference...")
             # Create a simple default speaker using another TTS model
             try:
+                from TTS.api import TTS
                 # Use a simple model to generate reference audio
                 temp_tts = TTS("tts_models/en/ljspeech/tacotron2-DDC")
                 reference_text = "Hello, this is my default voice."
@@ -138,7 +200,23 @@ class NaturalTTS:
             print(f"❌ No TTS available: {e}")
             self.enabled = False
     
-    def speak(self, text: str):
+    @staticmethod
+    def _load_last_model():
+        try:
+            with open(MODEL_STATE_FILE) as f:
+                return json.load(f).get("model")
+        except (OSError, ValueError):
+            return None
+    
+    @staticmethod
+    def _save_last_model(model_name: str):
+        try:
+            with open(MODEL_STATE_FILE, 'w') as f:
+                json.dump({"model": model_name}, f)
+        except OSError:
+            pass
+    
+    def speak(self, text: str, priority: int = PRIORITY_NORMAL):
         """Add text to speech queue"""
         if not self.enabled or not text.strip():
             return
@@ -146,11 +224,27 @@ class NaturalTTS:
         clean_text = self._clean_text(text)
         
         # Add to queue
-        self.speech_queue.put(clean_text)
-        
-        # Start processing if not already running
-        if not self.is_processing:
-            self._start_processing()
+        self.speech_queue.put(
+            (priority, next(self._sequence), self._generation, time.perf_counter(), clean_text)
+        )
+    
+    def announce(self, text: str):
+        """Speak text ahead of anything still queued"""
+        self.speak(text, PRIORITY_HIGH)
+    
+    def wait_until_done(self, timeout: float) -> bool:
+        """Block until everything queued has been played, or timeout seconds pass
+
+        The speech threads are daemons, so anything that must be heard before
+        the process exits (a goodbye) has to be waited for.
+        """
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            idle = not self.speech_queue.unfinished_tasks and not self.playback_queue.unfinished_tasks
+            if idle and not (self.channel and self.channel.get_busy()):
+                return True
+            time.sleep(0.02)
+        return False
     
     def _clean_text(self, text: str) -> str:
         """Clean text for better TTS"""
@@ -181,92 +275,168 @@ class NaturalTTS:
         
         return text.strip()
     
-    def _start_processing(self):
-        """Start processing the speech queue in a separate thread"""
-        def process_queue():
-            self.is_processing = True
-            while not self.speech_queue.empty():
-                try:
-                    text = self.speech_queue.get_nowait()
-                    if text:
-                        self._synthesize_and_play(text)
-                    time.sleep(0.1)  # Small pause between utterances
-                except Exception as e:
-                    print(f"TTS Error: {e}")
-                    break
-            self.is_processing = False
-        
-        # Run in background thread
-        thread = threading.Thread(target=process_queue, daemon=True)
-        thread.start()
+    def _speech_loop(self):
+        """The one speech worker: synthesizes queued text for as long as the process runs"""
+        # Speech queued while the engine is still loading waits for it
+        self.ready.wait()
+        while True:
+            _, _, generation, queued_at, text = self.speech_queue.get()
+            try:
+                if generation != self._generation:
+                    continue
+                self._synthesize_and_play(text, generation, queued_at)
+            except Exception as e:
+                metrics.count("errors", stage="tts", error=type(e).__name__)
+                print(f"TTS Error: {e}")
+            finally:
+                # The audio (if any) is on the playback queue by now, so
+                # wait_until_done never sees a gap between the two
+                self.speech_queue.task_done()
     
-    def _synthesize_and_play(self, text: str):
-        """Synthesize and play speech using AI model"""
+    def _synthesize_and_play(self, text: str, generation: int = None, queued_at: float = None):
+        """Synthesize speech and hand it to the player (returns before playback ends)"""
+        if generation is None:
+            generation = self._generation
+        if queued_at is None:
+            queued_at = time.perf_counter()
+        
         try:
             print(f"🗣️ AI Speaking: {text}")
             
             if self.model_type == "fallback":
-                # Use fallback TTS
-                self.fallback_tts.say(text)
-                self.fallback_tts.runAndWait()
+                # pyttsx3 plays by itself; the player runs it in turn
+                self.playback_queue.put((generation, queued_at, text))
                 return
             
-            # Create temporary file for audio
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                temp_path = temp_file.name
+            import pygame
+            wav = self._synthesize(text)
+            if generation != self._generation:
+                return  # Stopped while synthesizing
+            self.playback_queue.put((generation, queued_at, pygame.mixer.Sound(file=io.BytesIO(wav))))
+            
+        except Exception as e:
+            print(f"❌ AI TTS synthesis failed: {e}")
+            # Fallback to basic TTS if AI fails
+            if hasattr(self, 'fallback_tts'):
+                print("🔄 Using fallback TTS...")
+                metrics.count("fallbacks", kind="tts_sentence_pyttsx3")
+                self.playback_queue.put((generation, queued_at, text))
+    
+    def _synthesize(self, text: str) -> bytes:
+        """Synthesize text to in-memory WAV bytes, going through the audio cache"""
+        speaker = getattr(self, 'default_speaker_path', '') if self.model_type == "xtts_v2" else ''
+        cache_key = AudioCache.key(self.model_type, speaker, text)
+        with metrics.span("tts_synthesis", model=self.model_type, chars=len(text)) as span:
+            cached = self.audio_cache.get(cache_key)
+            if cached is not None:
+                span.set(cached=True)
+                return cached
             
             # Generate speech with appropriate method
             if self.model_type == "xtts_v2" and hasattr(self, 'default_speaker_path'):
                 # XTTS v2 with default speaker
-                self.tts.tts_to_file(
+                samples = self.tts.tts(
                     text=text,
-                    file_path=temp_path,
                     speaker_wav=self.default_speaker_path,
                     language="en"
                 )
             else:
                 # Other models that don't need speaker reference
-                self.tts.tts_to_file(text=text, file_path=temp_path)
-            
-            # Play the audio
-            self._play_audio_file(temp_path)
+                samples = self.tts.tts(text=text)
             
-            # Clean up
-            os.unlink(temp_path)
-            
-        except Exception as e:
-            print(f"❌ AI TTS synthesis failed: {e}")
-            # Fallback to basic TTS if AI fails
-            if hasattr(self, 'fallback_tts'):
-                print("🔄 Using fallback TTS...")
-                self.fallback_tts.say(text)
-                self.fallback_tts.runAndWait()
+            wav = self._to_wav_bytes(samples, self.tts.synthesizer.output_sample_rate)
+            self.audio_cache.put(cache_key, wav)
+            return wav
     
-    def _play_audio_file(self, file_path: str):
-        """Play audio file using pygame"""
-        try:
-            pygame.mixer.music.load(file_path)
-            pygame.mixer.music.play()
-            
-            # Wait for playback to complete
-            while pygame.mixer.music.get_busy():
-                time.sleep(0.1)
+    @staticmethod
+    def _to_wav_bytes(samples, sample_rate: int) -> bytes:
+        """Encode a float waveform as 16-bit mono WAV, normalized like TTS's save_wav"""
+        import numpy as np
+        samples = np.asarray(samples, dtype=np.float32)
+        peak = float(np.max(np.abs(samples))) if samples.size else 0.0
+        pcm = samples * (32767 / max(0.01, peak))
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(sample_rate)
+            f.writeframes(pcm.astype('<i2').tobytes())
+        return buffer.getvalue()
+    
+    def _playback_loop(self):
+        """Play synthesized audio back to back; queuing on the channel avoids gaps"""
+        while True:
+            generation, queued_at, item = self.playback_queue.get()
+            try:
+                if generation != self._generation:
+                    continue
+                if isinstance(item, str):
+                    # Fallback speech: let queued audio finish, then speak
+                    while self.channel.get_busy() and generation == self._generation:
+                        time.sleep(0.01)
+                    if generation != self._generation:
+                        continue
+                    self._record_playback(queued_at)
+                    self.fallback_tts.say(item)
+                    self.fallback_tts.runAndWait()
+                    continue
                 
-        except Exception as e:
-            print(f"❌ Audio playback error: {e}")
+                if self.channel.get_busy():
+                    # Queue behind the current sound and wait for it to start,
+                    # so only one sound ever waits on the channel
+                    self.channel.queue(item)
+                    while self.channel.get_queue() is not None and generation == self._generation:
+                        time.sleep(0.005)
+                else:
+                    self.channel.play(item)
+                if generation == self._generation:
+                    self._record_playback(queued_at)
+            except Exception as e:
+                metrics.count("errors", stage="tts_playback", error=type(e).__name__)
+                print(f"❌ Audio playback error: {e}")
+            finally:
+                self.playback_queue.task_done()
+    
+    def _record_playback(self, queued_at: float):
+        latency = time.perf_counter() - queued_at
+        self.playback_latencies.append(latency)
+        metrics.observe("tts_playback_latency_seconds", latency)
     
     def _speak_immediate(self, text: str):
         """For testing - speak immediately without queue"""
         self._synthesize_and_play(text)
     
     def stop(self):
-        """Stop any ongoing speech"""
+        """Stop any ongoing speech and cancel everything still queued"""
+        started = time.perf_counter()
+        with self._generation_lock:
+            self._generation += 1
+        # Drop text waiting for synthesis and audio waiting to play
+        for pending in (self.speech_queue, self.playback_queue):
+            try:
+                while True:
+                    pending.get_nowait()
+                    pending.task_done()
+            except queue.Empty:
+                pass
         try:
-            pygame.mixer.music.stop()
+            if self.channel:
+                self.channel.stop()
             if hasattr(self, 'fallback_tts'):
                 self.fallback_tts.stop()
         except:
             pass
+        self.stop_latencies.append(time.perf_counter() - started)
+        metrics.observe("tts_stop_seconds", self.stop_latencies[-1])
+    
+    def latency_stats(self) -> dict:
+        """Median playback and stop latency in milliseconds"""
+        def median_ms(samples):
+            return statistics.median(samples) * 1000 if samples else None
+        return {
+            "playback_ms": median_ms(list(self.playback_latencies)),
+            "stop_ms": median_ms(list(self.stop_latencies)),
+        }
     
     def toggle(self):
         """Toggle TTS on/off"""
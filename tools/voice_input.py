@@ -0,0 +1,237 @@
+import math
+import sys
+import threading
+import time
+import wave
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, NamedTuple
+from agent.metrics import metrics
+
+# 16-bit mono PCM throughout; 16 kHz is what speech recognizers expect
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+FRAME_MS = 30
+
+# pcm bytes, sample rate -> text ("" if nothing was recognized)
+Transcriber = Callable[[bytes, int], str]
+
+class Utterance(NamedTuple):
+    text: str
+    speech_seconds: float
+    chunks: int
+    # perf_counter times: the last voiced frame arrived, silence confirmed the
+    # end, and the transcript was complete
+    speech_ended: float
+    endpointed: float
+    transcribed: float
+
+def _frames(read: Callable[[int], bytes], frame_bytes: int) -> Iterator[bytes]:
+    while True:
+        frame = read(frame_bytes)
+        if len(frame) < frame_bytes:
+            return
+        yield frame
+
+def microphone_frames(sample_rate: int = SAMPLE_RATE, frame_ms: int = FRAME_MS) -> Iterator[bytes]:
+    """Frames from the default input device (needs pyaudio)"""
+    import pyaudio  # Optional: only needed for live voice input
+
+    frame_samples = sample_rate * frame_ms // 1000
+    audio = pyaudio.PyAudio()
+    stream = audio.open(format=pyaudio.paInt16, channels=1, rate=sample_rate,
+                        input=True, frames_per_buffer=frame_samples)
+    try:
+        while True:
+            yield stream.read(frame_samples, exception_on_overflow=False)
+    finally:
+        stream.stop_stream()
+        stream.close()
+        audio.terminate()
+
+def wav_frames(path: str, frame_ms: int = FRAME_MS, realtime: bool = False) -> Iterator[bytes]:
+    """Frames from a 16-bit mono WAV file; realtime paces them like a microphone"""
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != SAMPLE_WIDTH or wav.getnchannels() != 1:
+            raise ValueError(f"{path}: expected 16-bit mono audio")
+        frame_bytes = wav.getframerate() * frame_ms // 1000 * SAMPLE_WIDTH
+        frames = _frames(lambda n: wav.readframes(n // SAMPLE_WIDTH), frame_bytes)
+        yield from paced(frames, frame_ms) if realtime else frames
+
+def pipe_frames(stream=None, sample_rate: int = SAMPLE_RATE, frame_ms: int = FRAME_MS) -> Iterator[bytes]:
+    """Frames of raw 16-bit mono PCM from a binary stream (stdin by default)
+
+    e.g. arecord -q -f S16_LE -r 16000 -c 1 | python cli.py --listen -
+    """
+    stream = stream or sys.stdin.buffer
+    yield from _frames(stream.read, sample_rate * frame_ms // 1000 * SAMPLE_WIDTH)
+
+def paced(frames: Iterable[bytes], frame_ms: int = FRAME_MS) -> Iterator[bytes]:
+    """Hand frames over no faster than they'd arrive from a microphone"""
+    started = time.perf_counter()
+    for i, frame in enumerate(frames):
+        delay = started + i * frame_ms / 1000 - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        yield frame
+
+class EnergyVAD:
+    """Calls a frame speech when its RMS energy is well above the background
+
+    The noise floor follows the energy of non-speech frames, so a fan or a
+    quiet room both work without tuning.
+    """
+
+    def __init__(self, threshold_ratio: float = 3.0, min_energy: float = 300.0, adapt: float = 0.05):
+        self.threshold_ratio = threshold_ratio
+        self.min_energy = min_energy
+        self.adapt = adapt
+        self.noise_floor = None
+
+    @staticmethod
+    def energy(frame: bytes) -> float:
+        samples = array("h", frame)
+        if sys.byteorder == "big":
+            samples.byteswap()
+        if not samples:
+            return 0.0
+        return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+    def is_speech(self, frame: bytes) -> bool:
+        energy = self.energy(frame)
+        if self.noise_floor is None:
+            self.noise_floor = energy
+        speech = energy > max(self.min_energy, self.noise_floor * self.threshold_ratio)
+        if not speech:
+            self.noise_floor += self.adapt * (energy - self.noise_floor)
+        return speech
+
+class SpeechRecognitionTranscriber:
+    """Transcribes PCM with the SpeechRecognition package (engine: google, sphinx, whisper, ...)"""
+
+    def __init__(self, engine: str = "google", **options):
+        import speech_recognition as sr  # Optional: only needed for voice input
+
+        self._sr = sr
+        self.recognizer = sr.Recognizer()
+        self._recognize = getattr(self.recognizer, f"recognize_{engine}")
+        self.options = options
+
+    def __call__(self, pcm: bytes, sample_rate: int) -> str:
+        audio = self._sr.AudioData(pcm, sample_rate, SAMPLE_WIDTH)
+        try:
+            return self._recognize(audio, **self.options)
+        except self._sr.UnknownValueError:
+            return ""
+
+class VoiceListener:
+    """Splits a stream of audio frames into utterances and transcribes them
+
+    Speech starts after start_ms of voiced frames and ends after
+    end_silence_ms of silence. While the user is still talking, each pause of
+    chunk_pause_ms closes a chunk (once it's at least min_chunk_seconds long)
+    and that chunk is transcribed in the background, so when the utterance
+    ends only its last chunk is left to transcribe.
+    """
+
+    def __init__(self, transcriber: Transcriber, vad=None, sample_rate: int = SAMPLE_RATE,
+                 frame_ms: int = FRAME_MS, start_ms: int = 90, end_silence_ms: int = 500,
+                 pre_speech_ms: int = 300, chunk_pause_ms: int = 200, min_chunk_seconds: float = 1.0,
+                 min_speech_ms: int = 250, max_utterance_seconds: float = 30.0, chunked: bool = True):
+        self.transcriber = transcriber
+        self.vad = vad or EnergyVAD()
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.start_frames = max(1, start_ms // frame_ms)
+        self.end_frames = max(1, end_silence_ms // frame_ms)
+        self.pause_frames = max(1, chunk_pause_ms // frame_ms)
+        self.min_chunk_frames = int(min_chunk_seconds * 1000 // frame_ms)
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.max_frames = int(max_utterance_seconds * 1000 // frame_ms)
+        self.pre_speech = deque(maxlen=max(1, pre_speech_ms // frame_ms))
+        self.chunked = chunked
+        # One worker: chunks finish in order and the recognizer is never shared
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ted-transcribe")
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def utterances(self, frames: Iterable[bytes]) -> Iterator[Utterance]:
+        speaking = False
+        voiced_run = 0
+        chunk: List[bytes] = []
+        pending = []
+        frames_in_utterance = voiced_frames = silence = 0
+        speech_ended = 0.0
+
+        for frame in frames:
+            if self._stop.is_set():
+                break
+            now = time.perf_counter()
+            voiced = self.vad.is_speech(frame)
+
+            if not speaking:
+                self.pre_speech.append(frame)
+                voiced_run = voiced_run + 1 if voiced else 0
+                if voiced_run >= self.start_frames:
+                    speaking = True
+                    chunk = list(self.pre_speech)
+                    self.pre_speech.clear()
+                    pending = []
+                    frames_in_utterance = len(chunk)
+                    voiced_frames = voiced_run
+                    silence = 0
+                    speech_ended = now
+                continue
+
+            chunk.append(frame)
+            frames_in_utterance += 1
+            if voiced:
+                voiced_frames += 1
+                silence = 0
+                speech_ended = now
+            else:
+                silence += 1
+                if silence == self.pause_frames and self.chunked and len(chunk) >= self.min_chunk_frames:
+                    # A pause mid-sentence: start on this much while the user goes on
+                    pending.append(self._pool.submit(self._transcribe, b"".join(chunk)))
+                    chunk = []
+
+            # The cap applies to voiced frames too, or noise above the threshold never ends
+            capped = frames_in_utterance >= self.max_frames
+            if silence >= self.end_frames or capped:
+                if capped:
+                    metrics.count("fallbacks", kind="voice_max_utterance")
+                speaking = False
+                voiced_run = 0
+                endpointed = now
+                if voiced_frames < self.min_speech_frames:
+                    # A click or a cough
+                    for future in pending:
+                        future.cancel()
+                    continue
+                # Trailing silence is nothing but extra work for the recognizer
+                tail = chunk[:len(chunk) - max(0, silence - self.pause_frames)]
+                if tail:
+                    pending.append(self._pool.submit(self._transcribe, b"".join(tail)))
+                text = " ".join(filter(None, (future.result().strip() for future in pending)))
+                transcribed = time.perf_counter()
+                metrics.observe("speech_to_transcript_seconds", transcribed - speech_ended)
+                if text:
+                    yield Utterance(text, voiced_frames * self.frame_ms / 1000, len(pending),
+                                    speech_ended, endpointed, transcribed)
+
+    def _transcribe(self, pcm: bytes) -> str:
+        with metrics.span("voice_transcribe", audio_seconds=len(pcm) / (self.sample_rate * SAMPLE_WIDTH)):
+            try:
+                return self.transcriber(pcm, self.sample_rate)
+            except Exception as e:
+                # One bad chunk shouldn't lose the rest of the utterance
+                metrics.count("errors", stage="transcribe", error=type(e).__name__)
+                return ""
+
+    def close(self):
+        self.stop()
+        self._pool.shutdown(wait=False, cancel_futures=True)